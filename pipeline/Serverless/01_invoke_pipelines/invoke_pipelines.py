@@ -6,6 +6,9 @@ from aws_lambda_powertools.logging import Logger
 logger = Logger()
 
 from common.get_config import get_from_common_service
+from common.deploy_planner import plan_deploys, get_latest_layers
+from common.batch_check import check_packages
+from common.dependency_index import get_layers_to_rebuild
 
 
 @logger.inject_lambda_context
@@ -13,6 +16,10 @@ def main(event, context):
     """
     Args:
       package: Python Package to build and deploy
+      deploy_only: Only start executions for packages whose latest build is missing from a region (e.g. new region)
+      changed_only: Only start executions for packages whose latest version on PyPI hasn't been built yet
+      dependency_releases: {dependency: version} of new releases, only start executions for the layers that pin
+                           an older version of one of them, and rebuild those even if otherwise up to date
     return:
       response: Entries in EventBridge for processing
     """
@@ -20,12 +27,54 @@ def main(event, context):
     client = boto3.client("events")
     python_versions = get_from_common_service(resource="/api/v1/python-versions")
     logger.info(f"Python Versions: {python_versions}")
-
-    for python_version in python_versions:
-        packages = get_from_common_service(
+    packages_by_python_version = {
+        python_version: get_from_common_service(
             resource=f"/api/v1/config/{python_version}/pckgs"
         )
+        for python_version in python_versions
+    }
+    if event.get("changed_only", False):
+        # One concurrent pass over PyPI for every python version, instead of one check per execution
+        changed = check_packages(packages_by_python_version)
+        packages_by_python_version = {
+            python_version: [
+                package for package in packages if package in changed[python_version]
+            ]
+            for python_version, packages in packages_by_python_version.items()
+        }
+    dependency_releases = event.get("dependency_releases")
+    if dependency_releases:
+        # Targeted invalidation from the reverse-dependency index, instead of rebuilding everything
+        layers = get_layers_to_rebuild(dependency_releases, python_versions)
+        packages_by_python_version = {
+            python_version: [
+                package
+                for package in packages
+                if package in layers.get(python_version, {})
+            ]
+            for python_version, packages in packages_by_python_version.items()
+        }
+
+    if event.get("deploy_only", False):
+        # One scan of the deployed layers, shared by the plan of every python version
+        deployed_layers = get_latest_layers(table_name=os.environ["DB_NAME"])
+
+    for python_version in python_versions:
+        packages = packages_by_python_version[python_version]
         logger.info(f"{packages}")
+        if event.get("deploy_only", False):
+            plan = plan_deploys(
+                python_version=python_version,
+                packages=packages,
+                regions=get_from_common_service(
+                    resource=f"/api/v1/config/{python_version}/rgns"
+                ),
+                layers=deployed_layers,
+            )
+            packages = [package for package in packages if package in plan]
+            logger.info({"message": "Packages with deploy work", "packages": packages})
+        bytecode_packages = get_optional_packages(python_version, "pycPckgs")
+        slim_packages = get_optional_packages(python_version, "slmPckgs")
 
         # post message to EventBridge to trigger step functions
         seconds_delay = 30  # Start with no delay
@@ -47,6 +96,9 @@ def main(event, context):
                         "python_version": python_version,
                         "force_build": False,
                         "force_deploy": False,
+                        "compile_bytecode": package in bytecode_packages,
+                        "slim": package in slim_packages,
+                        "dependency_released": bool(dependency_releases),
                         "secondsDelay": seconds_delay,
                     }
                 ),
@@ -56,3 +108,20 @@ def main(event, context):
             client.put_events(Entries=[entry])
 
     return python_versions
+
+
+def get_optional_packages(python_version: str, config_type: str) -> list:
+    """
+    Args:
+      python_version: Version of python (e.g. p3.12)
+      config_type: pycPckgs (layers ship precompiled bytecode) or slmPckgs (layers are slimmed)
+    return:
+      packages: Packages with the build option set, empty if the config isn't loaded yet
+    """
+    try:
+        return get_from_common_service(
+            resource=f"/api/v1/config/{python_version}/{config_type}"
+        )
+    except Exception as e:
+        logger.warning({"message": f"No {config_type} config", "error": str(e)})
+        return []
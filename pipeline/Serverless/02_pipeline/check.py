@@ -1,12 +1,15 @@
-import json
+import os
+from datetime import datetime, timedelta
 
-import requests
+import boto3
 from packaging.version import parse
 
 from aws_lambda_powertools.logging import Logger
 
 logger = Logger()
 
+from common import pypi_cache
+
 
 def get_latest_release(package):
     """
@@ -16,27 +19,80 @@ def get_latest_release(package):
       version: Version number of latest release that is **not** a pre-release as packaging.version
     """
     clean_package_name = package.split("[")[0]
-    req = requests.get(f"https://pypi.python.org/pypi/{clean_package_name}/json")
-    version = parse("0")
-    license_info = None
-
-    if req.status_code == requests.codes.ok:
-        j = json.loads(req.text)
-        releases = j.get("releases", [])
-        for release in releases:
-            ver = parse(release)
-            if not ver.is_prerelease:
-                version = max(version, ver)
-
-        license_info = j.get("info", {}).get("license", None)
-        if license_info is None:
-            license_info = "No-License-In-PyPI"
-
-    else:
+    # Conditional request, an unchanged package is answered from the cache without downloading its metadata
+    version, license_info = pypi_cache.get_latest_release(clean_package_name)
+
+    if version is None:
         logger.info("Unable to determine latest version, exiting")
         exit(1)
 
-    return version, license_info
+    return parse(version), license_info
+
+
+# Values of the decision field, the state machine skips the build on DECISION_SKIP
+DECISION_SKIP = "skip"
+DECISION_REBUILD = "rebuild"
+DECISION_NEW_VERSION = "new_version"
+
+
+def get_latest_build(package: str, python_version: str) -> dict:
+    """
+    Args:
+      package: Name of package as configured
+      python_version: Version of python (e.g. p3.12)
+    returns:
+      build: bldVrsn0# item of the latest build, empty if the package was never built
+    """
+    client = boto3.client("dynamodb")
+    response = client.get_item(
+        TableName=os.environ["DB_NAME"],
+        Key={
+            "pk": {"S": f"bldVrsn0#{python_version}"},
+            "sk": {"S": f"pckg#{package}"},
+        },
+        ProjectionExpression="pckgVrsn, rqrmntsHsh, crtdDt, chckdDt",
+    )
+    return response.get("Item", {})
+
+
+def get_decision(
+    latest_version, build: dict, force_build: bool, dependency_released: bool = False
+) -> tuple:
+    """
+    Args:
+      latest_version: Latest release on PyPI as packaging.version
+      build: bldVrsn0# item of the latest build
+      force_build: Rebuild even if the package is up to date
+      dependency_released: A dependency pinned by the latest build has a newer release (see common.dependency_index)
+    returns:
+      decision: DECISION_SKIP, DECISION_REBUILD or DECISION_NEW_VERSION
+      reason: Why, for the logs
+    """
+    if force_build:
+        return DECISION_REBUILD, "force_build"
+    if "pckgVrsn" not in build or "rqrmntsHsh" not in build:
+        return DECISION_NEW_VERSION, "never built"
+    if parse(build["pckgVrsn"]["S"]) != latest_version:
+        return DECISION_NEW_VERSION, f"built version is {build['pckgVrsn']['S']}"
+    if dependency_released:
+        return DECISION_REBUILD, "dependency released"
+
+    # Same version, but transitive requirements may have moved on, so builds are redone every interval
+    # Runs are spread out with a delay after the weekly cron, the margin stops a build checked a little
+    # less than an interval ago being skipped until the run after
+    rebuild_interval = timedelta(
+        days=int(os.environ.get("REBUILD_INTERVAL_DAYS", 7))
+    ) - timedelta(hours=int(os.environ.get("REBUILD_MARGIN_HOURS", 12)))
+    last_checked = max(
+        build.get(attribute, {}).get("S", "") for attribute in ("crtdDt", "chckdDt")
+    )
+    if (
+        not last_checked
+        or datetime.utcnow() - datetime.fromisoformat(last_checked) >= rebuild_interval
+    ):
+        return DECISION_REBUILD, f"last checked {last_checked or 'never'}"
+
+    return DECISION_SKIP, f"up to date, last checked {last_checked}"
 
 
 @logger.inject_lambda_context
@@ -45,10 +101,13 @@ def main(event, context):
     Args:
       package: Package to check for
       python_version: Version of python (e.g. p3.8, p3.9, p3.10)
+      dependency_released: Rebuild even if up to date, a dependency has a newer release
     return:
       package: Name of package
       version: Version of package to deploy
       license_info: License as per PyPI
+      decision: skip (up to date, straight to deploy), rebuild (age, force or dependency) or new_version
+      zip_file_S3key, requirements_hash, build_flag: Latest build, for the deploy, only when skipping the build
     """
 
     logger.debug(event)
@@ -56,6 +115,9 @@ def main(event, context):
     python_version = event.get("detail").get("python_version", "p3.8")  # default to 3.8
     force_build = event.get("detail").get("force_build", False)
     force_deploy = event.get("detail").get("force_deploy", False)
+    compile_bytecode = event.get("detail").get("compile_bytecode", False)
+    slim = event.get("detail").get("slim", False)
+    dependency_released = event.get("detail").get("dependency_released", False)
 
     logger.debug(f"Checking {package}")
 
@@ -66,15 +128,35 @@ def main(event, context):
     if len(license_info) > 512:
         license_info = license_info[:500] + "..."
 
-    return {
+    build = get_latest_build(package, python_version)
+    decision, reason = get_decision(
+        latest_version, build, force_build, dependency_released
+    )
+    logger.info({"package": package, "decision": decision, "reason": reason})
+
+    result = {
         "version": str(latest_version),
         "package": package,
         "license_info": license_info,
         "python_version": python_version,
         "force_build": force_build,
         "force_deploy": force_deploy,
+        "compile_bytecode": compile_bytecode,
+        "slim": slim,
+        "decision": decision,
         "type": 0,  # You must specify a $.type field for a step function choice field, see below
     }
+    if decision == DECISION_SKIP:
+        # Same fields the build returns, so Deploy can run without it
+        result.update(
+            {
+                "zip_file_S3key": f"{python_version}/{package}.zip",
+                "requirements_hash": build["rqrmntsHsh"]["S"],
+                "build_flag": False,
+            }
+        )
+
+    return result
 
 
 # https://docs.aws.amazon.com/step-functions/latest/dg/amazon-states-language-choice-state.html
@@ -1,11 +1,16 @@
 import os
-import shutil
-from zipfile import ZipFile
+import json
+import hashlib
+from datetime import datetime
 
 import boto3
 
 from common.get_config import get_from_common_service
 from common.get_compatible import get_compatible_runtimes, get_compatible_architectures
+from common.staging import stage_artifact
+from common.rate_limiter import lambda_rate_limiter, LAMBDA_CLIENT_CONFIG
+from common.artifact_cache import artifact_cache
+from common.layer_archive import merge_archives, preflight, read_central_directory
 
 from aws_lambda_powertools.logging import Logger
 
@@ -18,7 +23,7 @@ s3 = boto3.client("s3")
 def main(event, context):
     """
     Combines multiple packages into a single zip file
-    Function downloads layer for packages from S3, unzips them, and combines them all into a single zip
+    Function downloads layer for packages from S3, and merges their entries into a single zip
     Uploads zip into S3 with a new name
     Deploys to all regions
     """
@@ -29,6 +34,34 @@ def main(event, context):
     zip_file_S3key = f"{python_version}/{combined_package_name}.zip"
     license_info = "Refer for individual package"
 
+    regions = get_from_common_service(resource=f"/api/v1/config/{python_version}/rgns")
+    logger.info({"regions": regions})
+
+    # Same components with the same builds produce the same layer, reuse what's already published
+    component_hashes = get_component_hashes(
+        packages=packages, python_version=python_version
+    )
+    combined_hash = get_combined_hash(
+        packages=packages, component_hashes=component_hashes
+    )
+    published = get_combined_layers(
+        python_version=python_version, combined_hash=combined_hash
+    )
+    regions_to_publish = [region for region in regions if region not in published]
+    logger.info(
+        {
+            "message": "Combined layer lookup",
+            "combined_hash": combined_hash,
+            "published_regions": list(published.keys()),
+            "regions_to_publish": regions_to_publish,
+        }
+    )
+    if not regions_to_publish:
+        return [published[region] for region in regions]
+
+    # Fail before any download if the components can't be combined
+    check_components(packages=packages, python_version=python_version)
+
     archive_path = combine_packages(
         packages=packages,
         python_version=python_version,
@@ -36,18 +69,162 @@ def main(event, context):
     )
     upload_to_s3(archive_path=archive_path, s3_location=zip_file_S3key)
 
-    regions = get_from_common_service(resource=f"/api/v1/config/{python_version}/rgns")
-    logger.info({"regions": regions})
-
+    put_combined_layers(
+        python_version=python_version,
+        combined_hash=combined_hash,
+        combined_name=combined_package_name,
+        component_hashes=component_hashes,
+    )
+    # Each region is recorded once it's published, a retry after a failure only publishes the rest
     layers = publish_layer(
-        regions=regions,
+        regions=regions_to_publish,
         archive_path=archive_path,
+        s3_location=zip_file_S3key,
         python_version=python_version,
         license_info=license_info,
         combined_name=combined_package_name,
+        combined_hash=combined_hash,
+    )
+    published.update(zip(regions_to_publish, layers))
+
+    return [published[region] for region in regions]
+
+
+def get_component_hashes(packages: list[str], python_version: str) -> dict:
+    """
+    Args:
+        packages: List of strings of packages to combine
+        python_version: String of python version
+    returns:
+        component_hashes: package -> rqrmntsHsh of its latest build
+    """
+    client = boto3.client("dynamodb")
+    table_name = os.environ["DB_NAME"]
+
+    request = {
+        table_name: {
+            "Keys": [
+                {
+                    "pk": {"S": f"bldVrsn0#{python_version}"},
+                    "sk": {"S": f"pckg#{package}"},
+                }
+                for package in sorted(set(packages))
+            ],
+            "ProjectionExpression": "sk, rqrmntsHsh",
+        }
+    }
+    component_hashes = {}
+    while request:
+        response = client.batch_get_item(RequestItems=request)
+        for item in response["Responses"].get(table_name, []):
+            component_hashes[item["sk"]["S"][len("pckg#") :]] = item["rqrmntsHsh"]["S"]
+        request = response.get("UnprocessedKeys")
+
+    missing = [package for package in packages if package not in component_hashes]
+    if missing:
+        raise ValueError(f"Packages never built for {python_version}: {missing}")
+
+    return component_hashes
+
+
+def get_combined_hash(packages: list[str], component_hashes: dict) -> str:
+    """
+    Components are hashed in request order, the same order combined_name() and merge_archives() use,
+    since overlapping entries are resolved by their position
+    Args:
+        packages: List of strings of packages to combine, in request order
+        component_hashes: package -> rqrmntsHsh of its latest build
+    returns:
+        combined_hash: SHA256 of the ordered components and their requirements hashes
+    """
+    components = json.dumps(
+        [[package, component_hashes[package]] for package in packages]
+    )
+    return hashlib.sha256(components.encode("utf-8")).hexdigest()
+
+
+def get_combined_layers(python_version: str, combined_hash: str) -> dict:
+    """
+    Args:
+        python_version: String of python version
+        combined_hash: Hash of the ordered components, from get_combined_hash
+    returns:
+        layers: region -> layer ARN already published for this component set, empty if never combined
+    """
+    client = boto3.client("dynamodb")
+    response = client.get_item(
+        TableName=os.environ["DB_NAME"],
+        Key={
+            "pk": {"S": f"cmbnd#{python_version}"},
+            "sk": {"S": combined_hash},
+        },
+        ProjectionExpression="arns",
     )
+    arns = response.get("Item", {}).get("arns", {}).get("M", {})
+    return {region: arn["S"] for region, arn in arns.items()}
+
 
-    return layers
+def put_combined_layers(
+    python_version: str,
+    combined_hash: str,
+    combined_name: str,
+    component_hashes: dict,
+) -> None:
+    """
+    Records a component set before its layers are published, so the next combine of the same set is a lookup
+    ARNs recorded by an earlier, partly failed, combine are kept
+    Args:
+        python_version: String of python version
+        combined_hash: Hash of the ordered components, from get_combined_hash
+        combined_name: Name of combined package
+        component_hashes: package -> rqrmntsHsh of its latest build
+    """
+    client = boto3.client("dynamodb")
+    client.update_item(
+        TableName=os.environ["DB_NAME"],
+        Key={
+            "pk": {"S": f"cmbnd#{python_version}"},
+            "sk": {"S": combined_hash},
+        },
+        UpdateExpression="set cmbndNm = :cmbndNm, pckgs = :pckgs, pyVrsn = :pyVrsn, "
+        "crtdDt = if_not_exists(crtdDt, :crtdDt), arns = if_not_exists(arns, :arns)",
+        ExpressionAttributeValues={
+            ":cmbndNm": {"S": combined_name},
+            ":pckgs": {
+                "M": {
+                    package: {"S": requirements_hash}
+                    for package, requirements_hash in component_hashes.items()
+                }
+            },
+            ":pyVrsn": {"S": python_version},
+            ":crtdDt": {"S": datetime.utcnow().isoformat()},
+            ":arns": {"M": {}},
+        },
+    )
+
+
+def record_combined_layer(
+    python_version: str, combined_hash: str, region: str, arn: str
+) -> None:
+    """
+    Adds the layer published in region to the record of the component set, see put_combined_layers
+    Args:
+        python_version: String of python version
+        combined_hash: Hash of the ordered components, from get_combined_hash
+        region: Region the layer was published to
+        arn: Layer version ARN
+    """
+    client = boto3.client("dynamodb")
+    client.update_item(
+        TableName=os.environ["DB_NAME"],
+        Key={
+            "pk": {"S": f"cmbnd#{python_version}"},
+            "sk": {"S": combined_hash},
+        },
+        UpdateExpression="set arns.#region = :arn",
+        ExpressionAttributeNames={"#region": region},
+        ExpressionAttributeValues={":arn": {"S": arn}},
+    )
 
 
 def combined_name(packages: list[str]) -> str:
@@ -74,6 +251,29 @@ def combined_name(packages: list[str]) -> str:
     return combined_name
 
 
+def check_components(packages: list[str], python_version: str) -> dict:
+    """
+    Reads only the central directory of each component in S3, and checks the combined layer is under Lambda's
+    unzipped size limit and has no conflicting distribution versions
+    Args:
+        packages: List of strings of packages to combine
+        python_version: String of python version
+    returns:
+        report: per-component sizes and the unzipped size of the combined layer
+    raises:
+        PreflightError: components can't be combined
+    """
+    components = {
+        package: read_central_directory(
+            s3_client=s3,
+            bucket=os.environ["BUCKET_NAME"],
+            key=f"{python_version}/{package}.zip",
+        )
+        for package in packages
+    }
+    return preflight(components)
+
+
 def combine_packages(
     packages: list[str], python_version: str, combined_name: str
 ) -> None:
@@ -88,21 +288,17 @@ def combine_packages(
 
     archive_path = f"/tmp/{combined_name}.zip"
 
+    sources = []
     for package in packages:
         s3_key = f"{python_version}/{package}.zip"
-        download_path = f"/tmp/{package}.zip"
-        s3.download_file(os.environ["BUCKET_NAME"], s3_key, download_path)
+        download_path = artifact_cache.get(
+            bucket=os.environ["BUCKET_NAME"], key=s3_key, s3_client=s3
+        )
         logger.info(f"Download {s3_key} to {download_path}")
-        # Unzip file
-        with ZipFile(download_path, "r") as zip_object:
-            zip_object.extractall("/tmp")
-
-    result = shutil.make_archive(
-        base_name=archive_path.split(".")[0],  # remove the .zip
-        format="zip",
-        base_dir="python",
-        root_dir="/tmp",
-    )
+        sources.append((package, download_path))
+
+    # Entries are copied still compressed, nothing is extracted to /tmp
+    merge_archives(sources=sources, destination_path=archive_path)
 
     return archive_path
 
@@ -128,35 +324,52 @@ def upload_to_s3(archive_path: str, s3_location: str):
 def publish_layer(
     regions: list[str],
     archive_path: str,
+    s3_location: str,
     python_version: str,
     combined_name: str,
     license_info: str,
+    combined_hash: str,
 ):
     """
     Args:
         regions: List of regions to deploy to
         archive_path: Location of zip file to be uploaded to S3 bucket
+        s3_location: Key of the uploaded zip file in the layers bucket
         combined_name: Name of combined package
+        combined_hash: Hash of the ordered components, each region's layer is recorded under it once public
     returns:
         layer_arns: List of layer ARNs deployed
     """
 
     layer_name = f"{os.environ['LAMBDA_LAYER_PREFIX']}{python_version.replace('.','')}-{combined_name}"
 
-    with open(archive_path, "rb") as zip_file:
-        zip_binary = zip_file.read()
-
     layer_arns = []
+    # Staged regions publish straight from S3, the zip is only read for inline uploads
+    zip_binary = None
 
     for region in regions:
         logger.info(
             {"message": "Deploying", "region": region, "package": combined_name}
         )
-        lambda_client = boto3.client("lambda", region_name=region)
-        response = lambda_client.publish_layer_version(
+        content = stage_artifact(
+            source_bucket=os.environ["BUCKET_NAME"],
+            s3_key=s3_location,
+            region=region,
+        )
+        if content is None:
+            if zip_binary is None:
+                with open(archive_path, "rb") as zip_file:
+                    zip_binary = zip_file.read()
+            content = {"ZipFile": zip_binary}
+        lambda_client = boto3.client(
+            "lambda", region_name=region, config=LAMBDA_CLIENT_CONFIG
+        )
+        response = lambda_rate_limiter.call(
+            lambda_client,
+            "publish_layer_version",
             LayerName=layer_name,
             Description=f"{combined_name}",
-            Content={"ZipFile": zip_binary},
+            Content=content,
             CompatibleRuntimes=get_compatible_runtimes(python_version=python_version),
             CompatibleArchitectures=get_compatible_architectures(
                 python_version=python_version
@@ -177,14 +390,28 @@ def publish_layer(
                 "arn": layer_version_arn,
             }
         )
-        lambda_client.add_layer_version_permission(
+        lambda_rate_limiter.call(
+            lambda_client,
+            "add_layer_version_permission",
             LayerName=layer_name,
             VersionNumber=layer_version,
             StatementId="make_public",
             Action="lambda:GetLayerVersion",
             Principal="*",
         )
+        record_combined_layer(
+            python_version=python_version,
+            combined_hash=combined_hash,
+            region=region,
+            arn=layer_version_arn,
+        )
 
-    logger.info({"message": "Layer ARNs", "layer_arns": layer_arns})
+    logger.info(
+        {
+            "message": "Layer ARNs",
+            "layer_arns": layer_arns,
+            "rate_limiter": lambda_rate_limiter.stats(),
+        }
+    )
 
     return layer_arns
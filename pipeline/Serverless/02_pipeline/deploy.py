@@ -1,5 +1,7 @@
 import os
 import time
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime
 
 import boto3
@@ -12,8 +14,9 @@ logger = Logger()
 
 from common.get_config import get_from_common_service
 from common.get_compatible import get_compatible_runtimes, get_compatible_architectures
-
-dynamo_client = boto3.client("dynamodb")
+from common.staging import stage_artifact
+from common.rate_limiter import lambda_rate_limiter, LAMBDA_CLIENT_CONFIG
+from common.artifact_cache import artifact_cache
 
 
 def check_regions_to_deploy(
@@ -39,14 +42,21 @@ def check_regions_to_deploy(
     table_name = os.environ["DB_NAME"]
     dynamodb = boto3.resource("dynamodb")
     table = dynamodb.Table(table_name)
-    response = table.query(
-        IndexName="package_global_by_python_version",
-        KeyConditionExpression=Key("pckg#PyVrsn").eq(f"{package}:{python_version}")
+    query_kwargs = {
+        "IndexName": "package_global_by_python_version",
+        "KeyConditionExpression": Key("pckg#PyVrsn").eq(f"{package}:{python_version}")
         & Key("dplySts").eq("latest"),
-    )
+    }
+    items = []
+    while True:
+        response = table.query(**query_kwargs)
+        items.extend(response["Items"])
+        if "LastEvaluatedKey" not in response:
+            break
+        query_kwargs["ExclusiveStartKey"] = response["LastEvaluatedKey"]
 
     # check if there are any region in regions that aren't deployed
-    regions_deployed = [item["rgn"] for item in response["Items"]]
+    regions_deployed = [item["rgn"] for item in items]
     regions_to_deploy = [region for region in regions if region not in regions_deployed]
     logger.info(
         {
@@ -57,7 +67,7 @@ def check_regions_to_deploy(
     )
 
     # for all deployed regions, check if it has the latest version
-    for item in response["Items"]:
+    for item in items:
         if item["rqrmntsHsh"] != requirements_hash:
             if item["rgn"] in regions:
                 regions_to_deploy.append(item["rgn"])
@@ -72,25 +82,38 @@ def check_regions_to_deploy(
 
 def download_artifact(zip_file_S3Key):
     """
-    Downloads s3://bucket_name/zip_file_S3Key to /tmp directory
+    Downloads s3://bucket_name/zip_file_S3Key to the /tmp artifact cache, reusing the copy of a warm container
+    if the ETag still matches
     Returns the full zip binary for easier upload
     """
 
     bucket_name = os.environ["BUCKET_NAME"]
-    s3 = boto3.resource("s3")
-    tmp_file_path = "/tmp/package.zip"
-
-    logger.info(
-        f"Downloading package from S3 : {zip_file_S3Key} to location: {tmp_file_path}"
-    )
-    s3.meta.client.download_file(bucket_name, zip_file_S3Key, tmp_file_path)
-    logger.debug(f"Downloaded package from S3")
+    logger.info(f"Downloading package from S3 : {zip_file_S3Key}")
+    tmp_file_path = artifact_cache.get(bucket=bucket_name, key=zip_file_S3Key)
     with open(tmp_file_path, "rb") as zip_file:
         zip_binary = zip_file.read()
 
     return zip_binary
 
 
+class LayerZip:
+    """
+    Zip binary shared by every region of a deploy, downloaded once, by the first region that uploads it inline
+    Regions publishing from a staging bucket never read it
+    """
+
+    def __init__(self, zip_file_S3key: str):
+        self.zip_file_S3key = zip_file_S3key
+        self.zip_binary = None
+        self.lock = threading.Lock()
+
+    def read(self) -> bytes:
+        with self.lock:
+            if self.zip_binary is None:
+                self.zip_binary = download_artifact(self.zip_file_S3key)
+        return self.zip_binary
+
+
 def get_requirements_txt(package: str, python_version: str) -> str:
     """
     Args:
@@ -115,6 +138,542 @@ def get_requirements_txt(package: str, python_version: str) -> str:
     return requirements_txt
 
 
+# Deploy stages of a region, in order, recorded in the checkpoint as each one completes
+STAGE_PUBLISHED = "published"
+STAGE_PUBLIC = "public"
+STAGE_RECORDED = "recorded"
+
+# Checkpoints only matter while the execution can still be retried
+CHECKPOINT_EXPIRY_DAYS = 7
+
+
+class DeployIncomplete(Exception):
+    """
+    Raised when regions are still failing after retries, the state machine retries the deploy
+    """
+
+
+class DeployCheckpoint:
+    """
+    Progress of a deploy per region, stored in DynamoDB so that a retried execution resumes where it stopped
+    pk: dplyChkpt#<package>:<python_version>  sk: <requirements_hash>#<execution_id>
+    Checkpointing is disabled when there's no execution_id (e.g. invoked outside the state machine),
+    regions still tracks the stages completed in this invocation, for the retries of failed regions
+    """
+
+    def __init__(
+        self,
+        package: str,
+        python_version: str,
+        requirements_hash: str,
+        execution_id: str,
+    ):
+        self.enabled = execution_id is not None
+        self.table_name = os.environ["DB_NAME"]
+        self.key = {
+            "pk": {"S": f"dplyChkpt#{package}:{python_version}"},
+            "sk": {"S": f"{requirements_hash}#{execution_id}"},
+        }
+        # boto3 clients are thread safe, one client is shared by all regions
+        self.client = boto3.client("dynamodb")
+        # region -> {"stg": stage, "arn": layer version arn}, as loaded and saved since
+        self.regions = {}
+
+    def load(self) -> dict:
+        """
+        Creates the checkpoint if it doesn't exist
+        return:
+            regions: region -> {"stg": stage, "arn": layer version arn} of regions that made progress
+        """
+        if not self.enabled:
+            return self.regions
+
+        response = self.client.update_item(
+            TableName=self.table_name,
+            Key=self.key,
+            UpdateExpression="set rgns = if_not_exists(rgns, :empty), exDt = :exDt",
+            ExpressionAttributeValues={
+                ":empty": {"M": {}},
+                ":exDt": {
+                    "N": str(int(time.time() + 24 * 3600 * CHECKPOINT_EXPIRY_DAYS))
+                },
+            },
+            ReturnValues="ALL_NEW",
+        )
+        self.regions = {
+            region: {key: value["S"] for key, value in state["M"].items()}
+            for region, state in response["Attributes"]["rgns"]["M"].items()
+        }
+        return self.regions
+
+    def save(self, region: str, stage: str, arn: str) -> None:
+        """
+        Args:
+            region: Region that completed the stage
+            stage: Stage completed (published, public, recorded)
+            arn: Layer Version Arn published in the region
+        """
+        self.regions[region] = {"stg": stage, "arn": arn}
+        if not self.enabled:
+            return
+
+        self.client.update_item(
+            TableName=self.table_name,
+            Key=self.key,
+            UpdateExpression="set rgns.#rgn = :state",
+            ExpressionAttributeNames={"#rgn": region},
+            ExpressionAttributeValues={
+                ":state": {"M": {"stg": {"S": stage}, "arn": {"S": arn}}}
+            },
+        )
+
+    def save_all(self, stage: str, arns: dict) -> None:
+        """
+        Saves the same stage for many regions in a single write
+        Args:
+            stage: Stage completed (published, public, recorded)
+            arns: region -> Layer Version Arn published in the region
+        """
+        for region, arn in arns.items():
+            self.regions[region] = {"stg": stage, "arn": arn}
+        if not self.enabled or not arns:
+            return
+
+        names, values, assignments = {}, {}, []
+        for i, (region, arn) in enumerate(arns.items()):
+            names[f"#rgn{i}"] = region
+            values[f":state{i}"] = {"M": {"stg": {"S": stage}, "arn": {"S": arn}}}
+            assignments.append(f"rgns.#rgn{i} = :state{i}")
+
+        self.client.update_item(
+            TableName=self.table_name,
+            Key=self.key,
+            UpdateExpression="set " + ", ".join(assignments),
+            ExpressionAttributeNames=names,
+            ExpressionAttributeValues=values,
+        )
+
+
+def publish_to_region(
+    region: str,
+    package: str,
+    version: str,
+    python_version: str,
+    layer_name: str,
+    zip_file_S3key: str,
+    layer_zip: LayerZip,
+    requirements_hash: str,
+    license_info: str,
+    checkpoint: DeployCheckpoint,
+    state: dict,
+) -> dict:
+    """
+    Publishes the layer to a single region and makes it public, record_layers records it in DynamoDB
+    Stages already in the checkpoint are skipped, the layer is never published twice for the same execution
+    Args:
+        region: Region to deploy to
+        package: Name of package to deploy
+        version: Version of the package
+        python_version: version of python
+        layer_name: Name of the Lambda Layer
+        zip_file_S3key: Key of the layer zip file in the layers bucket
+        layer_zip: Layer zip file shared by the regions, only read if the region has no usable staging bucket
+        requirements_hash: Hash of requirements.txt file
+        license_info: License of the package
+        checkpoint: Checkpoint of the deploy
+        state: Checkpointed state of the region, empty if the region hasn't started
+    return:
+        published: region, arn and created date of the published layer
+    """
+    # boto3 sessions aren't thread safe, each region gets its own
+    session = boto3.session.Session()
+    lambda_client = session.client(
+        "lambda", region_name=region, config=LAMBDA_CLIENT_CONFIG
+    )
+    stage = state.get("stg")
+    layer_version_arn = state.get("arn")
+
+    if layer_version_arn is None:
+        # Publish Layer Version
+        logger.info({"message": "Deploying", "region": region, "package": package})
+
+        # Publish from a copy in the region, falling back to uploading the zip inline
+        content = stage_artifact(
+            source_bucket=os.environ["BUCKET_NAME"],
+            s3_key=zip_file_S3key,
+            region=region,
+            session=session,
+        ) or {"ZipFile": layer_zip.read()}
+
+        response = lambda_rate_limiter.call(
+            lambda_client,
+            "publish_layer_version",
+            LayerName=layer_name,
+            Description=f"{package}=={version} | {requirements_hash}",
+            Content=content,
+            CompatibleRuntimes=get_compatible_runtimes(python_version=python_version),
+            CompatibleArchitectures=get_compatible_architectures(
+                python_version=python_version
+            ),
+            LicenseInfo=license_info,
+        )
+        layer_version_arn = response["LayerVersionArn"]
+        stage = STAGE_PUBLISHED
+        checkpoint.save(region=region, stage=stage, arn=layer_version_arn)
+    else:
+        logger.info(
+            {
+                "message": "Resuming from checkpoint",
+                "region": region,
+                "package": package,
+                "stage": stage,
+                "arn": layer_version_arn,
+            }
+        )
+    layer_version_created_date = datetime.utcnow().isoformat()
+    layer_version = int(layer_version_arn.split(":")[-1])
+
+    if stage == STAGE_PUBLISHED:
+        # Make Layer Publicly accessible
+        logger.info(
+            {
+                "message": "Making Public",
+                "region": region,
+                "package": package,
+                "python_version": python_version,
+                "arn": layer_version_arn,
+                "created_date": layer_version_created_date,
+            }
+        )
+        try:
+            lambda_rate_limiter.call(
+                lambda_client,
+                "add_layer_version_permission",
+                LayerName=layer_name,
+                VersionNumber=layer_version,
+                StatementId="make_public",
+                Action="lambda:GetLayerVersion",
+                Principal="*",
+            )
+        except ClientError as e:
+            # Made public before the checkpoint was saved
+            if e.response["Error"]["Code"] != "ResourceConflictException":
+                raise
+        stage = STAGE_PUBLIC
+        checkpoint.save(region=region, stage=stage, arn=layer_version_arn)
+
+    return {
+        "region": region,
+        "arn": layer_version_arn,
+        "crtdDt": layer_version_created_date,
+    }
+
+
+# DynamoDB limit on actions in a single transact_write_items
+TRANSACTION_MAX_ITEMS = 100
+
+# DynamoDB limit on keys in a single batch_get_item
+BATCH_GET_MAX_KEYS = 100
+
+
+def layer_transact_items(
+    layer: dict,
+    new_layer_version: int,
+    package: str,
+    version: str,
+    python_version: str,
+    requirements_txt: str,
+    requirements_hash: str,
+) -> list:
+    """
+    Args:
+        layer: region, arn and created date of the published layer
+        new_layer_version: Klayers version of the layer, one more than the current lyrVrsn0# version
+        package: Name of package
+        version: Version of the package
+        python_version: version of python
+        requirements_txt: requirements.txt of the build
+        requirements_hash: Hash of requirements.txt file
+    return:
+        items: TransactItems updating lyrVrsn0#, putting lyrVrsn#v<new> and deprecating the previous version
+    """
+    table_name = os.environ["DB_NAME"]
+    expiry_days = int(os.environ["EXPIRY_DAYS"])
+    region = layer["region"]
+
+    pk = f"lyr#{region}:{package}:{python_version}"
+    sk_v0 = "lyrVrsn0#"
+    sk = f"lyrVrsn#v{new_layer_version}"
+    sk_previous = f"lyrVrsn#v{new_layer_version-1}"
+
+    items = [
+        {
+            "Update": {
+                "TableName": table_name,
+                "Key": {
+                    "pk": {"S": pk},
+                    "sk": {"S": sk_v0},
+                },
+                "UpdateExpression": "set "
+                "rqrmntsTxt = :rqrmntsTxt, "
+                "pckgVrsn = :pckgVrsn, "
+                "rqrmntsHsh = :rqrmntsHsh,"
+                "arn = :arn,"
+                "crtdDt = :crtdDt,"
+                "lyrVrsn = :lyrVrsn,"
+                "pyVrsn = :pyVrsn",
+                "ExpressionAttributeValues": {
+                    ":rqrmntsTxt": {"S": requirements_txt},
+                    ":crtdDt": {"S": layer["crtdDt"]},
+                    ":pckgVrsn": {"S": version},
+                    ":rqrmntsHsh": {"S": requirements_hash},
+                    ":arn": {"S": layer["arn"]},
+                    ":lyrVrsn": {"N": str(new_layer_version)},
+                    ":pyVrsn": {"S": python_version},
+                },
+                # Allow update only if
+                # Current lyrVrsn is less than updated value
+                # or lyrVrsn doesn't exists
+                "ConditionExpression": "lyrVrsn <= :lyrVrsn OR attribute_not_exists(lyrVrsn)",
+            }
+        },
+        {
+            "Put": {
+                "TableName": table_name,
+                "Item": {
+                    "pk": {"S": pk},
+                    "sk": {"S": sk},
+                    "pckgVrsn": {"S": version},
+                    "crtdDt": {"S": layer["crtdDt"]},
+                    "rqrmntsTxt": {"S": requirements_txt},
+                    "rqrmntsHsh": {"S": requirements_hash},
+                    "arn": {"S": layer["arn"]},
+                    "pckg": {"S": package},
+                    "rgn": {"S": region},
+                    "dplySts": {"S": "latest"},
+                    "lyrVrsn": {"N": str(new_layer_version)},
+                    "pyVrsn": {"S": python_version},
+                    "rgn#PyVrsn": {"S": f"{region}:{python_version}"},
+                    "pckg#PyVrsn": {"S": f"{package}:{python_version}"},
+                },
+            }
+        },
+    ]
+    if new_layer_version > 1:
+        items.append(
+            {
+                "Update": {
+                    "TableName": table_name,
+                    "Key": {"pk": {"S": pk}, "sk": {"S": sk_previous}},
+                    "UpdateExpression": "set " "dplySts = :dplySts, " "exDt = :exDt",
+                    "ExpressionAttributeValues": {
+                        ":dplySts": {"S": "deprecated"},
+                        ":exDt": {"N": str(int(time.time() + 24 * 3600 * expiry_days))},
+                    },
+                    "ConditionExpression": "attribute_exists(sk)",
+                }
+            }
+        )
+
+    return items
+
+
+def get_layer_versions(dynamo_client, pks: list) -> dict:
+    """
+    Args:
+        pks: pk of the lyr# items to read
+    return:
+        layer_versions: pk -> current lyrVrsn of the lyrVrsn0# item, pks never deployed are left out
+    """
+    table_name = os.environ["DB_NAME"]
+    layer_versions = {}
+    for i in range(0, len(pks), BATCH_GET_MAX_KEYS):
+        request = {
+            table_name: {
+                "Keys": [
+                    {"pk": {"S": pk}, "sk": {"S": "lyrVrsn0#"}}
+                    for pk in pks[i : i + BATCH_GET_MAX_KEYS]
+                ],
+                "ProjectionExpression": "pk, lyrVrsn",
+            }
+        }
+        while request:
+            response = dynamo_client.batch_get_item(RequestItems=request)
+            for item in response["Responses"].get(table_name, []):
+                layer_versions[item["pk"]["S"]] = int(item["lyrVrsn"]["N"])
+            request = response.get("UnprocessedKeys")
+            if request:
+                time.sleep(0.1)
+
+    return layer_versions
+
+
+def record_layer(dynamo_client, layer: dict, **kwargs) -> int:
+    """
+    Records a single layer with its own read and writes, used when a batched transaction is cancelled
+    Args:
+        layer: region, arn and created date of the published layer
+        kwargs: package, version, python_version, requirements_txt, requirements_hash
+    return:
+        new_layer_version: Klayers version recorded
+    """
+    pk = f"lyr#{layer['region']}:{kwargs['package']}:{kwargs['python_version']}"
+    layer_versions = get_layer_versions(dynamo_client=dynamo_client, pks=[pk])
+    # This version is different from the Lambda Layer Version -- this is the Klayer Version
+    new_layer_version = layer_versions.get(pk, 0) + 1
+    items = layer_transact_items(
+        layer=layer, new_layer_version=new_layer_version, **kwargs
+    )
+
+    dynamo_client.transact_write_items(TransactItems=items[:2])
+    if len(items) > 2:
+        logger.info(
+            {
+                "message": "Updating Expiry on previous version",
+                "region": layer["region"],
+                "package": kwargs["package"],
+                "arn": layer["arn"],
+            }
+        )
+        try:
+            dynamo_client.update_item(**items[2]["Update"])
+        except ClientError as e:
+            if e.response["Error"]["Code"] == "ConditionalCheckFailedException":
+                logger.warning(
+                    {
+                        "message": "Conditional Check failed",
+                        "new_layer_version": new_layer_version,
+                        "sk_previous": items[2]["Update"]["Key"]["sk"]["S"],
+                    }
+                )
+
+    return new_layer_version
+
+
+def record_layers(published: list, checkpoint: DeployCheckpoint, **kwargs) -> list:
+    """
+    Records the layers published in all regions with one batch read and as few transactions as possible
+    Regions are never split across transactions, a cancelled transaction falls back to record_layer per region
+    Args:
+        published: region, arn and created date of each published layer
+        checkpoint: Checkpoint of the deploy
+        kwargs: package, version, python_version, requirements_txt, requirements_hash
+    return:
+        deployed: region, arn and klayers version of each recorded layer
+    """
+    if not published:
+        return []
+
+    dynamo_client = boto3.client("dynamodb")
+    pks = {
+        layer[
+            "region"
+        ]: f"lyr#{layer['region']}:{kwargs['package']}:{kwargs['python_version']}"
+        for layer in published
+    }
+    layer_versions = get_layer_versions(
+        dynamo_client=dynamo_client, pks=list(pks.values())
+    )
+
+    # Group whole regions into transactions of at most TRANSACTION_MAX_ITEMS
+    batches, batch, batch_items = [], [], []
+    for layer in published:
+        new_layer_version = layer_versions.get(pks[layer["region"]], 0) + 1
+        items = layer_transact_items(
+            layer=layer, new_layer_version=new_layer_version, **kwargs
+        )
+        if len(batch_items) + len(items) > TRANSACTION_MAX_ITEMS:
+            batches.append((batch, batch_items))
+            batch, batch_items = [], []
+        batch.append({**layer, "lyrVrsn": new_layer_version})
+        batch_items.extend(items)
+    batches.append((batch, batch_items))
+
+    deployed = []
+    for batch, batch_items in batches:
+        logger.info(
+            {
+                "message": "Inserting to table",
+                "regions": [layer["region"] for layer in batch],
+                "package": kwargs["package"],
+                "python_version": kwargs["python_version"],
+                "items": len(batch_items),
+            }
+        )
+        try:
+            dynamo_client.transact_write_items(TransactItems=batch_items)
+        except ClientError as e:
+            if e.response["Error"]["Code"] != "TransactionCanceledException":
+                raise
+            # A condition failed (e.g. previous version already expired), record these regions one at a time
+            logger.warning(
+                {
+                    "message": "Batched transaction cancelled, recording regions one by one",
+                    "reasons": e.response.get("CancellationReasons"),
+                }
+            )
+            for layer in batch:
+                layer["lyrVrsn"] = record_layer(
+                    dynamo_client=dynamo_client,
+                    layer={key: layer[key] for key in ("region", "arn", "crtdDt")},
+                    **kwargs,
+                )
+        checkpoint.save_all(
+            stage=STAGE_RECORDED,
+            arns={layer["region"]: layer["arn"] for layer in batch},
+        )
+        deployed.extend(
+            {
+                "region": layer["region"],
+                "arn": layer["arn"],
+                "lyrVrsn": layer["lyrVrsn"],
+            }
+            for layer in batch
+        )
+
+    return deployed
+
+
+def publish_regions(
+    regions: list, max_workers: int, checkpoint: DeployCheckpoint, **kwargs
+) -> tuple:
+    """
+    Publishes to regions concurrently, a failure in one region doesn't stop the others
+    Args:
+        regions: Regions to deploy to
+        max_workers: Maximum number of regions deployed at the same time
+        checkpoint: Checkpoint of the deploy, loaded by main, retries resume from the last stage it saved
+        kwargs: Passed through to publish_to_region
+    return:
+        published: results of regions successfully published
+        failed: region -> error message for regions that failed
+    """
+    states = dict(checkpoint.regions)
+    published, failed = [], {}
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {
+            executor.submit(
+                publish_to_region,
+                region=region,
+                checkpoint=checkpoint,
+                state=states.get(region, {}),
+                **kwargs,
+            ): region
+            for region in regions
+        }
+        for future in as_completed(futures):
+            region = futures[future]
+            try:
+                published.append(future.result())
+            except Exception as e:
+                logger.exception(
+                    {"message": "Deploy failed", "region": region, "error": str(e)}
+                )
+                failed[region] = str(e)
+
+    return published, failed
+
+
 @logger.inject_lambda_context
 def main(event, context):
     package = event["package"]
@@ -124,9 +683,8 @@ def main(event, context):
     requirements_hash = event["requirements_hash"]
     license_info = event["license_info"]
     force_deploy = event["force_deploy"]
-    table_name = os.environ["DB_NAME"]
-    expiry_days = int(os.environ["EXPIRY_DAYS"])
     python_version = event["python_version"]
+    execution_id = event.get("execution_id")
 
     regions = get_from_common_service(resource=f"/api/v1/config/{python_version}/rgns")
     logger.info({"regions": regions})
@@ -154,178 +712,131 @@ def main(event, context):
             "requirements_hash": requirements_hash,
         }
 
+    # Resume a retried execution, regions already recorded aren't deployed again
+    checkpoint = DeployCheckpoint(
+        package=package,
+        python_version=python_version,
+        requirements_hash=requirements_hash,
+        execution_id=execution_id,
+    )
+    states = checkpoint.load()
+    skipped_regions = [
+        region
+        for region in regions_to_deploy
+        if states.get(region, {}).get("stg") == STAGE_RECORDED
+    ]
+    resumed_regions = {
+        region: states[region]["stg"]
+        for region in regions_to_deploy
+        if region in states and region not in skipped_regions
+    }
+    regions_to_deploy = [
+        region for region in regions_to_deploy if region not in skipped_regions
+    ]
+    resume = {
+        "skipped_regions": skipped_regions,
+        "resumed_regions": resumed_regions,
+        "publishes_skipped": len(skipped_regions) + len(resumed_regions),
+    }
     logger.info(
-        {"message": "Regions to deploy", "regions_to_deploy": regions_to_deploy}
+        {
+            "message": "Regions to deploy",
+            "regions_to_deploy": regions_to_deploy,
+            "execution_id": execution_id,
+            "resume": resume,
+        }
     )
+    if len(regions_to_deploy) == 0:
+        logger.info({"message": "All regions deployed by previous attempt"})
+        return {
+            "deployed_to": skipped_regions,
+            "deployed_flag": len(skipped_regions) > 0,
+            "build_flag": build_flag,
+            "package": package,
+            "version": version,
+            "requirements_hash": requirements_hash,
+            "python_version": python_version,
+            "resume": resume,
+        }
 
     layer_name = (
         f"{os.environ['LAMBDA_LAYER_PREFIX']}{python_version.replace('.','')}-{package}"
     )
-    zip_binary = download_artifact(zip_file_S3key)
-
     requirements_txt = get_requirements_txt(
         package=package, python_version=python_version
     )
 
-    for region in regions_to_deploy:
-        # Publish Layer Version
-        logger.info({"message": "Deploying", "region": region, "package": package})
-
-        lambda_client = boto3.client("lambda", region_name=region)
-        response = lambda_client.publish_layer_version(
-            LayerName=layer_name,
-            Description=f"{package}=={version} | {requirements_hash}",
-            Content={"ZipFile": zip_binary},
-            CompatibleRuntimes=get_compatible_runtimes(python_version=python_version),
-            CompatibleArchitectures=get_compatible_architectures(
-                python_version=python_version
-            ),
-            LicenseInfo=license_info,
+    publish_args = {
+        "package": package,
+        "version": version,
+        "python_version": python_version,
+        "layer_name": layer_name,
+        "zip_file_S3key": zip_file_S3key,
+        # Staged regions publish straight from S3, the zip is only downloaded for inline uploads
+        "layer_zip": LayerZip(zip_file_S3key),
+        "requirements_hash": requirements_hash,
+        "license_info": license_info,
+    }
+    max_workers = int(os.environ.get("DEPLOY_CONCURRENCY", 8))
+    max_attempts = int(os.environ.get("DEPLOY_ATTEMPTS", 3))
+
+    # Only regions that failed are retried, successful regions are never republished
+    published, failed = [], {}
+    pending = regions_to_deploy
+    for attempt in range(1, max_attempts + 1):
+        succeeded, failed = publish_regions(
+            regions=pending,
+            max_workers=max_workers,
+            checkpoint=checkpoint,
+            **publish_args,
         )
-        layer_version_arn = response["LayerVersionArn"]
-        layer_version_created_date = datetime.utcnow().isoformat()
-        layer_version = int(layer_version_arn.split(":")[-1])
-
-        # Make Layer Publicly accessible
-        logger.info(
+        published.extend(succeeded)
+        if not failed or attempt == max_attempts:
+            break
+        pending = list(failed.keys())
+        logger.warning(
             {
-                "message": "Making Public",
-                "region": region,
-                "package": package,
-                "python_version": python_version,
-                "arn": layer_version_arn,
-                "created_date": layer_version_created_date,
+                "message": "Retrying failed regions",
+                "attempt": attempt,
+                "failed": failed,
             }
         )
-        lambda_client.add_layer_version_permission(
-            LayerName=layer_name,
-            VersionNumber=layer_version,
-            StatementId="make_public",
-            Action="lambda:GetLayerVersion",
-            Principal="*",
-        )
+        time.sleep(2**attempt)
 
-        # Insert new entry into DynamoDB
-        logger.info(
-            {
-                "message": "Inserting to table",
-                "region": region,
-                "package": package,
-                "arn": layer_version_arn,
-                "python_version": python_version,
-            }
-        )
+    # Regions that published are recorded even if others failed, a retry then only resumes the failed ones
+    deployed = record_layers(
+        published=published,
+        checkpoint=checkpoint,
+        package=package,
+        version=version,
+        python_version=python_version,
+        requirements_txt=requirements_txt,
+        requirements_hash=requirements_hash,
+    )
 
-        pk = f"lyr#{region}:{package}:{python_version}"
-        sk_v0 = "lyrVrsn0#"
-        # This version is different from the Lambda Layer Version -- this is the Klayer Version
-        try:
-            layer_version = dynamo_client.get_item(
-                TableName=table_name,
-                Key={
-                    "pk": {"S": pk},
-                    "sk": {"S": sk_v0},
-                },
-                ProjectionExpression="lyrVrsn",
-            )["Item"]["lyrVrsn"]["N"]
-            new_layer_version = int(layer_version) + 1
-        except KeyError:
-            new_layer_version = 1
-        sk = f"lyrVrsn#v{new_layer_version}"
-        sk_previous = f"lyrVrsn#v{new_layer_version-1}"
-
-        dynamo_client.transact_write_items(
-            TransactItems=[
-                {
-                    "Update": {
-                        "TableName": table_name,
-                        "Key": {
-                            "pk": {"S": pk},
-                            "sk": {"S": sk_v0},
-                        },
-                        "UpdateExpression": "set "
-                        "rqrmntsTxt = :rqrmntsTxt, "
-                        "pckgVrsn = :pckgVrsn, "
-                        "rqrmntsHsh = :rqrmntsHsh,"
-                        "arn = :arn,"
-                        "crtdDt = :crtdDt,"
-                        "lyrVrsn = :lyrVrsn,"
-                        "pyVrsn = :pyVrsn",
-                        "ExpressionAttributeValues": {
-                            ":rqrmntsTxt": {"S": requirements_txt},
-                            ":crtdDt": {"S": layer_version_created_date},
-                            ":pckgVrsn": {"S": version},
-                            ":rqrmntsHsh": {"S": requirements_hash},
-                            ":arn": {"S": layer_version_arn},
-                            ":lyrVrsn": {"N": str(new_layer_version)},
-                            ":pyVrsn": {"S": python_version},
-                        },
-                        # Allow update only if
-                        # Current lyrVrsn is less than updated value
-                        # or lyrVrsn doesn't exists
-                        "ConditionExpression": "lyrVrsn <= :lyrVrsn OR attribute_not_exists(lyrVrsn)",
-                    }
-                },
-                {
-                    "Put": {
-                        "TableName": table_name,
-                        "Item": {
-                            "pk": {"S": pk},
-                            "sk": {"S": sk},
-                            "pckgVrsn": {"S": version},
-                            "crtdDt": {"S": layer_version_created_date},
-                            "rqrmntsTxt": {"S": requirements_txt},
-                            "rqrmntsHsh": {"S": requirements_hash},
-                            "arn": {"S": layer_version_arn},
-                            "pckg": {"S": package},
-                            "rgn": {"S": region},
-                            "dplySts": {"S": "latest"},
-                            "lyrVrsn": {"N": str(new_layer_version)},
-                            "pyVrsn": {"S": python_version},
-                            "rgn#PyVrsn": {"S": f"{region}:{python_version}"},
-                            "pckg#PyVrsn": {"S": f"{package}:{python_version}"},
-                        },
-                    }
-                },
-            ]
-        )
-        if new_layer_version > 1:
-            logger.info(
-                {
-                    "message": "Updating Expiry on previous version",
-                    "region": region,
-                    "package": package,
-                    "arn": layer_version_arn,
-                }
-            )
-            try:
-                dynamo_client.update_item(
-                    TableName=table_name,
-                    Key={"pk": {"S": pk}, "sk": {"S": sk_previous}},
-                    UpdateExpression="set " "dplySts = :dplySts, " "exDt = :exDt",
-                    ExpressionAttributeValues={
-                        ":dplySts": {"S": "deprecated"},
-                        ":exDt": {"N": str(int(time.time() + 24 * 3600 * expiry_days))},
-                    },
-                    ConditionExpression="attribute_exists(sk)",
-                )
-            except ClientError as e:
-                if e.response["Error"]["Code"] == "ConditionalCheckFailedException":
-                    logger.warning(
-                        {
-                            "message": "Conditional Check failed",
-                            "new_layer_version": new_layer_version,
-                            "sk_previous": sk_previous,
-                        }
-                    )
-        deployed_flag = True
+    logger.info(
+        {
+            "message": "Deploy results",
+            "deployed": deployed,
+            "failed": failed,
+            "resume": resume,
+            "rate_limiter": lambda_rate_limiter.stats(),
+        }
+    )
+    if failed:
+        # Let the state machine retry, the checkpoint skips what's already done
+        raise DeployIncomplete(f"Failed to deploy {package} to regions: {failed}")
+
+    deployed_to = skipped_regions + [result["region"] for result in deployed]
+    deployed_flag = len(deployed_to) > 0
 
     return {
-        "deployed_to": regions_to_deploy,
+        "deployed_to": deployed_to,
         "deployed_flag": deployed_flag,
         "build_flag": build_flag,
         "package": package,
         "version": version,
         "requirements_hash": requirements_hash,
         "python_version": python_version,
+        "resume": resume,
     }
@@ -0,0 +1,7 @@
+import os
+import sys
+
+# Handlers import common.* from the root of the Lambda package, which is Serverless/
+sys.path.insert(
+    0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+)
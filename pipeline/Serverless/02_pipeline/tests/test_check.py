@@ -0,0 +1,33 @@
+from datetime import datetime, timedelta
+
+from packaging.version import parse
+
+import check
+
+
+def build_checked(age: timedelta) -> dict:
+    return {
+        "pckgVrsn": {"S": "2.32.0"},
+        "rqrmntsHsh": {"S": "hash"},
+        "crtdDt": {"S": (datetime.utcnow() - timedelta(days=30)).isoformat()},
+        "chckdDt": {"S": (datetime.utcnow() - age).isoformat()},
+    }
+
+
+def test_rebuild_interval_boundary(monkeypatch):
+    monkeypatch.setenv("REBUILD_INTERVAL_DAYS", "7")
+    monkeypatch.setenv("REBUILD_MARGIN_HOURS", "12")
+    latest = parse("2.32.0")
+
+    def decision(age):
+        return check.get_decision(latest, build_checked(age), force_build=False)[0]
+
+    # Last week's run started later than this week's, it's still due
+    assert decision(timedelta(days=6, hours=13)) == check.DECISION_REBUILD
+    assert decision(timedelta(days=6, hours=12, minutes=1)) == check.DECISION_REBUILD
+    assert decision(timedelta(days=6, hours=11, minutes=59)) == check.DECISION_SKIP
+    assert decision(timedelta(days=1)) == check.DECISION_SKIP
+    assert (
+        check.get_decision(parse("2.33.0"), build_checked(timedelta(0)), False)[0]
+        == check.DECISION_NEW_VERSION
+    )
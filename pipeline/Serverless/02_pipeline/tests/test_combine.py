@@ -0,0 +1,144 @@
+import io
+import zipfile
+from types import SimpleNamespace
+
+import boto3
+import pytest
+from botocore.exceptions import ClientError
+from moto import mock_aws
+
+import combine
+from common.artifact_cache import ArtifactCache
+from common.tests.table_helpers import TABLE_NAME, create_table, put_build
+
+BUCKET_NAME = "kl-test-bucket"
+REGIONS = ["us-east-1", "eu-west-1", "ap-southeast-1"]
+COMPONENT_HASHES = {"requests": "a", "idna": "b"}
+
+
+def layer_zip(package: str) -> bytes:
+    archive = io.BytesIO()
+    with zipfile.ZipFile(archive, "w") as layer:
+        layer.writestr(f"python/{package}/__init__.py", "")
+    return archive.getvalue()
+
+
+@pytest.fixture
+def aws(monkeypatch, tmp_path):
+    monkeypatch.setenv("AWS_DEFAULT_REGION", "us-east-1")
+    monkeypatch.setenv("DB_NAME", TABLE_NAME)
+    monkeypatch.setenv("BUCKET_NAME", BUCKET_NAME)
+    monkeypatch.setenv("LAMBDA_LAYER_PREFIX", "Klayers-")
+    monkeypatch.delenv("STAGING_BUCKET_PREFIX", raising=False)
+    monkeypatch.setattr(combine, "get_from_common_service", lambda resource: REGIONS)
+    monkeypatch.setattr(
+        combine, "artifact_cache", ArtifactCache(directory=str(tmp_path / "cache"))
+    )
+
+    with mock_aws():
+        client = create_table()
+        monkeypatch.setattr(combine, "s3", boto3.client("s3"))
+        combine.s3.create_bucket(Bucket=BUCKET_NAME)
+        for package, requirements_hash in COMPONENT_HASHES.items():
+            put_build(client, package, "p3.12", rqrmntsHsh=requirements_hash)
+            combine.s3.put_object(
+                Bucket=BUCKET_NAME, Key=f"p3.12/{package}.zip", Body=layer_zip(package)
+            )
+        yield client
+
+
+@pytest.fixture
+def publishes(monkeypatch):
+    """
+    Regions published to, in order, publishing fails in the regions in publishes.failing
+    """
+    calls = SimpleNamespace(regions=[], failing=set())
+    call = combine.lambda_rate_limiter.call
+
+    def recorded_call(client, operation, **kwargs):
+        region = client.meta.region_name
+        if operation == "publish_layer_version":
+            calls.regions.append(region)
+            if region in calls.failing:
+                raise ClientError(
+                    {"Error": {"Code": "AccessDeniedException", "Message": "Denied"}},
+                    "PublishLayerVersion",
+                )
+        return call(client, operation, **kwargs)
+
+    monkeypatch.setattr(combine.lambda_rate_limiter, "call", recorded_call)
+    return calls
+
+
+def lambda_context():
+    return SimpleNamespace(
+        function_name="combine",
+        memory_limit_in_mb=1769,
+        invoked_function_arn="arn:aws:lambda:us-east-1:123456789012:function:combine",
+        aws_request_id="request",
+    )
+
+
+def test_combined_hash_is_stable():
+    combined_hash = combine.get_combined_hash(["requests", "idna"], COMPONENT_HASHES)
+
+    # However the component hashes were read
+    assert combined_hash == combine.get_combined_hash(
+        ["requests", "idna"], dict(reversed(COMPONENT_HASHES.items()))
+    )
+    # Later components overwrite earlier ones, reordering them is another layer
+    assert combined_hash != combine.get_combined_hash(
+        ["idna", "requests"], COMPONENT_HASHES
+    )
+    # A rebuilt component is another layer
+    assert combined_hash != combine.get_combined_hash(
+        ["requests", "idna"], {**COMPONENT_HASHES, "idna": "c"}
+    )
+
+
+def test_combined_layer_lookup(aws):
+    component_hashes = combine.get_component_hashes(["requests", "idna"], "p3.12")
+    assert component_hashes == COMPONENT_HASHES
+    combined_hash = combine.get_combined_hash(["requests", "idna"], component_hashes)
+    assert combine.get_combined_layers("p3.12", combined_hash) == {}
+
+    combine.put_combined_layers(
+        "p3.12", combined_hash, "custom-requests-idna", component_hashes
+    )
+    combine.record_combined_layer("p3.12", combined_hash, "eu-west-1", "arn:eu")
+    # Recording the set again keeps the regions already published
+    combine.put_combined_layers(
+        "p3.12", combined_hash, "custom-requests-idna", component_hashes
+    )
+    assert combine.get_combined_layers("p3.12", combined_hash) == {
+        "eu-west-1": "arn:eu"
+    }
+
+    with pytest.raises(ValueError, match="never built"):
+        combine.get_component_hashes(["requests", "missing"], "p3.12")
+
+
+def test_partial_publish_resumes_and_reuses(aws, publishes, monkeypatch):
+    event = {"packages": ["requests", "idna"], "python_version": "p3.12"}
+    publishes.failing = {"eu-west-1"}
+
+    with pytest.raises(ClientError):
+        combine.main(event, lambda_context())
+    assert publishes.regions == ["us-east-1", "eu-west-1"]
+
+    # The retry only publishes the regions that weren't recorded
+    publishes.failing = set()
+    publishes.regions.clear()
+    arns = combine.main(event, lambda_context())
+    assert publishes.regions == ["eu-west-1", "ap-southeast-1"]
+    assert [arn.split(":")[3] for arn in arns] == REGIONS
+
+    # Every region published, the same set is a lookup, nothing is read or merged
+    def unexpected(**kwargs):
+        raise AssertionError("combined layer rebuilt")
+
+    monkeypatch.setattr(combine, "check_components", unexpected)
+    monkeypatch.setattr(combine, "combine_packages", unexpected)
+    publishes.regions.clear()
+    assert combine.main(event, lambda_context()) == arns
+    assert publishes.regions == []
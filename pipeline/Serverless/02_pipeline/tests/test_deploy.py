@@ -0,0 +1,249 @@
+import io
+import zipfile
+from types import SimpleNamespace
+
+import boto3
+import pytest
+from botocore.exceptions import ClientError
+from moto import mock_aws
+
+import deploy
+from common.tests.table_helpers import TABLE_NAME, create_table
+
+BUCKET_NAME = "kl-test-bucket"
+REGIONS = ["us-east-1", "eu-west-1", "ap-southeast-1"]
+
+
+def layer_zip() -> bytes:
+    archive = io.BytesIO()
+    with zipfile.ZipFile(archive, "w") as layer:
+        layer.writestr("python/requests/__init__.py", "")
+    return archive.getvalue()
+
+
+@pytest.fixture
+def aws(monkeypatch):
+    monkeypatch.setenv("AWS_DEFAULT_REGION", "us-east-1")
+    monkeypatch.setenv("DB_NAME", TABLE_NAME)
+    monkeypatch.setenv("BUCKET_NAME", BUCKET_NAME)
+    monkeypatch.setenv("LAMBDA_LAYER_PREFIX", "Klayers-")
+    monkeypatch.setenv("EXPIRY_DAYS", "365")
+    monkeypatch.setenv("DEPLOY_ATTEMPTS", "2")
+    monkeypatch.delenv("STAGING_BUCKET_PREFIX", raising=False)
+    monkeypatch.setattr(deploy.time, "sleep", lambda seconds: None)
+    monkeypatch.setattr(deploy, "get_from_common_service", lambda resource: REGIONS)
+
+    with mock_aws():
+        client = create_table()
+        s3 = boto3.client("s3")
+        s3.create_bucket(Bucket=BUCKET_NAME)
+        s3.put_object(Bucket=BUCKET_NAME, Key="p3.12/requests.zip", Body=layer_zip())
+        yield client
+
+
+@pytest.fixture
+def lambda_calls(monkeypatch):
+    """
+    Records every Lambda call as (region, operation), publishes fail in the regions in lambda_calls.failing,
+    making the layer public fails once in the regions in lambda_calls.failing_once
+    """
+    calls = SimpleNamespace(made=[], failing=set(), failing_once=set())
+    call = deploy.lambda_rate_limiter.call
+
+    def recorded_call(client, operation, **kwargs):
+        region = client.meta.region_name
+        calls.made.append((region, operation))
+        if operation == "publish_layer_version" and region in calls.failing:
+            raise ClientError(
+                {"Error": {"Code": "AccessDeniedException", "Message": "Denied"}},
+                "PublishLayerVersion",
+            )
+        if operation == "add_layer_version_permission" and region in calls.failing_once:
+            calls.failing_once.remove(region)
+            raise ClientError(
+                {"Error": {"Code": "AccessDeniedException", "Message": "Denied"}},
+                "AddLayerVersionPermission",
+            )
+        return call(client, operation, **kwargs)
+
+    monkeypatch.setattr(deploy.lambda_rate_limiter, "call", recorded_call)
+    return calls
+
+
+def deploy_event(execution_id="execution-1") -> dict:
+    return {
+        "package": "requests",
+        "version": "2.32.0",
+        "build_flag": True,
+        "zip_file_S3key": "p3.12/requests.zip",
+        "requirements_hash": "hash",
+        "license_info": "Apache-2.0",
+        "force_deploy": False,
+        "python_version": "p3.12",
+        "execution_id": execution_id,
+    }
+
+
+def lambda_context():
+    return SimpleNamespace(
+        function_name="deploy",
+        memory_limit_in_mb=512,
+        invoked_function_arn="arn:aws:lambda:us-east-1:123456789012:function:deploy",
+        aws_request_id="request",
+    )
+
+
+def new_checkpoint():
+    return deploy.DeployCheckpoint(
+        package="requests",
+        python_version="p3.12",
+        requirements_hash="hash",
+        execution_id="execution-1",
+    )
+
+
+def publishes(calls) -> list:
+    return sorted(
+        region
+        for region, operation in calls.made
+        if operation == "publish_layer_version"
+    )
+
+
+def test_resume_skips_regions_already_done(aws, lambda_calls):
+    # A previous attempt recorded us-east-1, and published eu-west-1 without making it public
+    published = boto3.client("lambda", region_name="eu-west-1").publish_layer_version(
+        LayerName="Klayers-p312-requests", Content={"ZipFile": layer_zip()}
+    )
+    checkpoint = new_checkpoint()
+    checkpoint.load()
+    checkpoint.save("us-east-1", deploy.STAGE_RECORDED, "arn:recorded")
+    checkpoint.save("eu-west-1", deploy.STAGE_PUBLISHED, published["LayerVersionArn"])
+
+    result = deploy.main(deploy_event(), lambda_context())
+
+    assert publishes(lambda_calls) == ["ap-southeast-1"]
+    assert ("eu-west-1", "add_layer_version_permission") in lambda_calls.made
+    assert result["resume"]["skipped_regions"] == ["us-east-1"]
+    assert result["resume"]["resumed_regions"] == {"eu-west-1": "published"}
+    assert sorted(result["deployed_to"]) == sorted(REGIONS)
+
+    stages = new_checkpoint().load()
+    assert {region: state["stg"] for region, state in stages.items()} == {
+        region: deploy.STAGE_RECORDED for region in REGIONS
+    }
+
+
+def test_partial_failure_raises_and_resumes(aws, lambda_calls):
+    lambda_calls.failing = {"eu-west-1"}
+
+    with pytest.raises(deploy.DeployIncomplete, match="eu-west-1"):
+        deploy.main(deploy_event(), lambda_context())
+
+    # Retried once in process, the regions that succeeded are published once and recorded
+    assert publishes(lambda_calls) == [
+        "ap-southeast-1",
+        "eu-west-1",
+        "eu-west-1",
+        "us-east-1",
+    ]
+    for region in ("us-east-1", "ap-southeast-1"):
+        layer = aws.get_item(
+            TableName=TABLE_NAME,
+            Key={
+                "pk": {"S": f"lyr#{region}:requests:p3.12"},
+                "sk": {"S": "lyrVrsn0#"},
+            },
+        )
+        assert layer["Item"]["lyrVrsn"]["N"] == "1"
+
+    # The state machine's retry only deploys the failed region
+    lambda_calls.failing = set()
+    lambda_calls.made.clear()
+    result = deploy.main(deploy_event(), lambda_context())
+    assert publishes(lambda_calls) == ["eu-west-1"]
+    assert result["deployed_to"] == ["eu-west-1"]
+
+
+@pytest.mark.parametrize("execution_id", ["execution-1", None])
+def test_retry_resumes_from_saved_stage(aws, lambda_calls, execution_id):
+    lambda_calls.failing_once = {"eu-west-1"}
+
+    result = deploy.main(deploy_event(execution_id), lambda_context())
+
+    # Published once, the retry only makes the layer public, with or without a stored checkpoint
+    assert publishes(lambda_calls) == sorted(REGIONS)
+    assert lambda_calls.made.count(("eu-west-1", "add_layer_version_permission")) == 2
+    assert sorted(result["deployed_to"]) == sorted(REGIONS)
+
+
+def test_record_layers_falls_back_when_cancelled(aws, monkeypatch):
+    # lyrVrsn0# says version 1 exists, but its lyrVrsn#v1 item is gone, so deprecating it fails the batch
+    aws.put_item(
+        TableName=TABLE_NAME,
+        Item={
+            "pk": {"S": "lyr#us-east-1:requests:p3.12"},
+            "sk": {"S": "lyrVrsn0#"},
+            "lyrVrsn": {"N": "1"},
+        },
+    )
+    transactions = []
+    transact_write_items = aws.transact_write_items
+
+    def recorded_transaction(**kwargs):
+        transactions.append(len(kwargs["TransactItems"]))
+        return transact_write_items(**kwargs)
+
+    monkeypatch.setattr(aws, "transact_write_items", recorded_transaction)
+    monkeypatch.setattr(deploy.boto3, "client", lambda service: aws)
+    checkpoint = new_checkpoint()
+    checkpoint.load()
+
+    deployed = deploy.record_layers(
+        published=[
+            {"region": region, "arn": f"arn:{region}", "crtdDt": "2024-01-01"}
+            for region in ("us-east-1", "eu-west-1")
+        ],
+        checkpoint=checkpoint,
+        package="requests",
+        version="2.32.0",
+        python_version="p3.12",
+        requirements_txt="requests==2.32.0",
+        requirements_hash="hash",
+    )
+
+    # One batched transaction, cancelled, then one per region
+    assert transactions == [5, 2, 2]
+    assert sorted((layer["region"], layer["lyrVrsn"]) for layer in deployed) == [
+        ("eu-west-1", 1),
+        ("us-east-1", 2),
+    ]
+    for region, version in (("us-east-1", 2), ("eu-west-1", 1)):
+        item = aws.get_item(
+            TableName=TABLE_NAME,
+            Key={
+                "pk": {"S": f"lyr#{region}:requests:p3.12"},
+                "sk": {"S": f"lyrVrsn#v{version}"},
+            },
+        )
+        assert item["Item"]["dplySts"]["S"] == "latest"
+    assert checkpoint.regions == {
+        region: {"stg": deploy.STAGE_RECORDED, "arn": f"arn:{region}"}
+        for region in ("us-east-1", "eu-west-1")
+    }
+
+
+def test_inline_regions_share_one_download(aws, lambda_calls, monkeypatch):
+    downloads = []
+    download_artifact = deploy.download_artifact
+
+    def recorded_download(zip_file_S3Key):
+        downloads.append(zip_file_S3Key)
+        return download_artifact(zip_file_S3Key)
+
+    monkeypatch.setattr(deploy, "download_artifact", recorded_download)
+
+    result = deploy.main(deploy_event(), lambda_context())
+
+    assert sorted(result["deployed_to"]) == sorted(REGIONS)
+    assert downloads == ["p3.12/requests.zip"]
@@ -0,0 +1,63 @@
+from aws_lambda_powertools.logging import Logger
+
+logger = Logger()
+
+from common.dependency_index import index_writes, write_index
+
+
+@logger.inject_lambda_context
+def main(event, context):
+    """
+    Consumes bldVrsn0# records straight from the table's stream, where the records of an item are in order.
+    Each record's diff is applied on top of the ones before it, so an older build never overwrites a newer one.
+    On a failure the record is reported, and it's retried together with every record after it in the shard.
+    """
+    for record in event.get("Records", []):
+        logger.debug({"record": record})
+        try:
+            update(record)
+        except Exception:
+            logger.exception(
+                {
+                    "message": "Unable to update dependency index",
+                    "keys": record["dynamodb"]["Keys"],
+                }
+            )
+            return {
+                "batchItemFailures": [
+                    {"itemIdentifier": record["dynamodb"]["SequenceNumber"]}
+                ]
+            }
+
+    return {"batchItemFailures": []}
+
+
+def update(record: dict) -> None:
+    """
+    Keeps the dpndncy# index in line with the rqrmntsTxt of a bldVrsn0# item
+    record: record from DynamoDB Table
+    """
+
+    keys = record["dynamodb"]["Keys"]
+    python_version = keys["pk"]["S"][len("bldVrsn0#") :]
+    package = keys["sk"]["S"][len("pckg#") :]
+    old_image = record["dynamodb"].get("OldImage", {})
+    new_image = record["dynamodb"].get("NewImage", {})
+
+    writes = index_writes(
+        package=package,
+        python_version=python_version,
+        old_requirements=old_image.get("rqrmntsTxt", {}).get("S", ""),
+        new_requirements=new_image.get("rqrmntsTxt", {}).get("S", ""),
+    )
+    write_index(writes)
+    logger.info(
+        {
+            "message": "Updated dependency index",
+            "package": package,
+            "python_version": python_version,
+            "writes": len(writes),
+        }
+    )
+
+    return
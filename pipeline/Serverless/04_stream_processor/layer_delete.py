@@ -6,6 +6,8 @@ from aws_lambda_powertools.logging import Logger
 
 logger = Logger()
 
+from common.rate_limiter import lambda_rate_limiter, LAMBDA_CLIENT_CONFIG
+
 
 @logger.inject_lambda_context
 def main(event, context):
@@ -40,14 +42,20 @@ def remove(record: dict) -> None:
     layer_name = arn_elements[6]
     layer_version = int(arn_elements[7])
 
-    client = boto3.client("lambda", region_name=region)
+    client = boto3.client("lambda", region_name=region, config=LAMBDA_CLIENT_CONFIG)
 
     insert_expired_record(old_image)
-    client.delete_layer_version(LayerName=layer_name, VersionNumber=layer_version)
+    lambda_rate_limiter.call(
+        client,
+        "delete_layer_version",
+        LayerName=layer_name,
+        VersionNumber=layer_version,
+    )
     logger.info(
         {
             "message": "Deleted Layer",
             "arn": layer_version_arn,
+            "rate_limiter": lambda_rate_limiter.stats(),
         }
     )
 
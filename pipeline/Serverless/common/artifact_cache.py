@@ -0,0 +1,115 @@
+import os
+import shutil
+import hashlib
+from collections import OrderedDict
+
+import boto3
+from botocore.exceptions import ClientError
+
+from aws_lambda_powertools.logging import Logger
+
+logger = Logger()
+
+
+class ArtifactCache:
+    """
+    Size bounded LRU cache of S3 objects in /tmp, survives between invocations of a warm container
+    Every get is validated against the object's ETag with a conditional GET, so a stale copy is never used
+    """
+
+    def __init__(self, directory: str = None, max_bytes: int = None):
+        self.directory = directory or os.environ.get(
+            "ARTIFACT_CACHE_DIR", "/tmp/artifact_cache"
+        )
+        self.max_bytes = max_bytes or int(
+            os.environ.get("ARTIFACT_CACHE_MAX_BYTES", 256 * 1024 * 1024)
+        )
+        # s3://bucket/key -> {"path", "etag", "size"}, least recently used first
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def path(self, bucket: str, key: str) -> str:
+        name = hashlib.sha256(f"{bucket}/{key}".encode("utf-8")).hexdigest()
+        return os.path.join(self.directory, f"{name}.zip")
+
+    def get(self, bucket: str, key: str, s3_client=None) -> str:
+        """
+        Args:
+            bucket: Bucket of the object
+            key: Key of the object
+        return:
+            path: Local path of the object, downloaded only if missing or changed in S3
+        """
+        s3_client = s3_client or boto3.client("s3")
+        uri = f"s3://{bucket}/{key}"
+        entry = self.entries.get(uri)
+        if entry is not None and not os.path.exists(entry["path"]):
+            del self.entries[uri]
+            entry = None
+
+        kwargs = {"Bucket": bucket, "Key": key}
+        if entry is not None:
+            kwargs["IfNoneMatch"] = entry["etag"]
+        try:
+            response = s3_client.get_object(**kwargs)
+        except ClientError as e:
+            if entry is None or e.response["Error"]["Code"] not in (
+                "304",
+                "NotModified",
+            ):
+                raise
+            self.hits += 1
+            self.entries.move_to_end(uri)
+            logger.info({"message": "Artifact cache hit", "s3": uri, **self.stats()})
+            return entry["path"]
+
+        self.misses += 1
+        if entry is not None:
+            self.remove(uri)
+        os.makedirs(self.directory, exist_ok=True)
+        path = self.path(bucket, key)
+        with open(path, "wb") as artifact:
+            shutil.copyfileobj(response["Body"], artifact, 1024 * 1024)
+        self.entries[uri] = {
+            "path": path,
+            "etag": response["ETag"],
+            "size": os.path.getsize(path),
+        }
+        self.evict(keep=uri)
+        logger.info({"message": "Artifact cache miss", "s3": uri, **self.stats()})
+
+        return path
+
+    def remove(self, uri: str) -> None:
+        entry = self.entries.pop(uri)
+        try:
+            os.remove(entry["path"])
+        except FileNotFoundError:
+            pass
+
+    def evict(self, keep: str) -> None:
+        """
+        Removes least recently used objects until the cache fits in max_bytes, never removes keep
+        """
+        while self.size() > self.max_bytes:
+            uri = next(iter(self.entries))
+            if uri == keep:
+                break
+            logger.info({"message": "Artifact cache evict", "s3": uri})
+            self.remove(uri)
+
+    def size(self) -> int:
+        return sum(entry["size"] for entry in self.entries.values())
+
+    def stats(self) -> dict:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "cached": len(self.entries),
+            "cached_bytes": self.size(),
+        }
+
+
+# Module level, so warm containers reuse what previous invocations downloaded
+artifact_cache = ArtifactCache()
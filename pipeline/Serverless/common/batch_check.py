@@ -0,0 +1,210 @@
+import os
+import json
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+
+import boto3
+import requests
+from botocore.exceptions import ClientError
+from packaging.version import InvalidVersion, parse
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from aws_lambda_powertools.logging import Logger
+
+from common import pypi_cache
+from common.deploy_planner import layer_package_name
+
+logger = Logger()
+
+# Retried with exponential backoff, anything else is returned to pypi_cache as is
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+
+def pypi_session(max_workers: int, attempts: int = 3) -> requests.Session:
+    """
+    Args:
+        max_workers: Number of concurrent lookups, the connection pool is sized to match
+        attempts: Attempts per request on connection errors and RETRY_STATUSES
+    return:
+        session: Session whose keep-alive connections are shared by every lookup
+    """
+    retry = Retry(
+        total=attempts - 1,
+        backoff_factor=0.5,
+        status_forcelist=RETRY_STATUSES,
+        allowed_methods=("GET",),
+        raise_on_status=False,
+    )
+    adapter = HTTPAdapter(
+        pool_connections=1, pool_maxsize=max_workers, max_retries=retry
+    )
+    session = requests.Session()
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+def get_built_versions(python_version: str, table_name: str, client=None) -> dict:
+    """
+    Args:
+        python_version: Version of python (e.g. p3.12)
+        table_name: Name of the DynamoDB table
+    return:
+        versions: package -> pckgVrsn of its latest build, from the bldVrsn0#<python_version> partition
+    """
+    client = client or boto3.client("dynamodb")
+    paginator = client.get_paginator("query")
+
+    versions = {}
+    for page in paginator.paginate(
+        TableName=table_name,
+        KeyConditionExpression="pk = :pk",
+        ExpressionAttributeValues={":pk": {"S": f"bldVrsn0#{python_version}"}},
+        ProjectionExpression="sk, pckgVrsn",
+    ):
+        for item in page["Items"]:
+            if "pckgVrsn" in item:
+                versions[item["sk"]["S"][len("pckg#") :]] = item["pckgVrsn"]["S"]
+
+    return versions
+
+
+def get_latest_versions(packages: list, max_workers: int = None, client=None) -> dict:
+    """
+    Looks up every package on PyPI concurrently, over one pooled session, with conditional requests from pypi_cache
+    Args:
+        packages: Names of packages, with or without extras
+        max_workers: Concurrency cap, defaults to PYPI_CONCURRENCY
+    return:
+        versions: package name without extras -> latest stable version, None if PyPI couldn't be reached
+    """
+    max_workers = max_workers or int(os.environ.get("PYPI_CONCURRENCY", 16))
+    client = client or boto3.client("dynamodb")
+    session = pypi_session(max_workers=max_workers)
+    names = sorted({layer_package_name(package) for package in packages})
+
+    def lookup(name):
+        try:
+            try:
+                version, _ = pypi_cache.get_latest_release(
+                    name, client=client, session=session
+                )
+            except ClientError as e:
+                # The cache is only an optimization, this package is fetched in full instead
+                logger.warning(
+                    {
+                        "message": "PyPI metadata cache unavailable, fetching uncached",
+                        "package": name,
+                        "error_code": e.response["Error"]["Code"],
+                    }
+                )
+                version, _ = pypi_cache.get_latest_release(
+                    name, session=session, use_cache=False
+                )
+        except requests.RequestException as e:
+            logger.warning(
+                {"message": "PyPI lookup failed", "package": name, "error": str(e)}
+            )
+            version = None
+        return name, version
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        versions = dict(executor.map(lookup, names))
+    session.close()
+
+    return versions
+
+
+def is_changed(latest: str, built: str) -> bool:
+    """
+    Args:
+        latest: Latest version on PyPI, None if PyPI couldn't be reached
+        built: Version of the latest build, None if never built
+    return:
+        changed: True unless both are the same version, compared as packaging versions like check.py does
+    """
+    if latest is None or built is None:
+        return True
+    try:
+        return parse(latest) != parse(built)
+    except InvalidVersion:
+        return latest != built
+
+
+def check_packages(
+    packages_by_python_version: dict, table_name: str = None, max_workers: int = None
+) -> dict:
+    """
+    Args:
+        packages_by_python_version: python_version -> packages configured for it
+        table_name: Name of the DynamoDB table, defaults to DB_NAME
+        max_workers: Concurrency cap of the PyPI lookups
+    return:
+        changed: python_version -> {package: latest version} of packages whose latest version on PyPI differs
+                 from their latest build, or that were never built. Packages PyPI couldn't answer for are included
+                 with a None version, so the pipeline reports them instead of them being silently skipped.
+    """
+    table_name = table_name or os.environ["DB_NAME"]
+    client = boto3.client("dynamodb")
+
+    # PyPI's answer doesn't depend on the python version, each package is looked up once
+    latest = get_latest_versions(
+        [
+            package
+            for packages in packages_by_python_version.values()
+            for package in packages
+        ],
+        max_workers=max_workers,
+        client=client,
+    )
+
+    changed = {}
+    for python_version, packages in packages_by_python_version.items():
+        built = get_built_versions(python_version, table_name, client=client)
+        changed[python_version] = {
+            package: latest[layer_package_name(package)]
+            for package in packages
+            if is_changed(latest[layer_package_name(package)], built.get(package))
+        }
+        logger.info(
+            {
+                "message": "Batch check",
+                "python_version": python_version,
+                "packages": len(packages),
+                "changed": len(changed[python_version]),
+            }
+        )
+
+    return changed
+
+
+if __name__ == "__main__":
+    from common.get_config import get_from_common_service
+
+    parser = argparse.ArgumentParser(
+        description="Dry run: print the packages whose latest version on PyPI hasn't been built"
+    )
+    parser.add_argument(
+        "--python-versions",
+        nargs="*",
+        help="Versions of python, defaults to the common service config",
+    )
+    parser.add_argument("--table", help="DynamoDB table, defaults to DB_NAME")
+    parser.add_argument("--max-workers", type=int, help="Concurrent PyPI lookups")
+    args = parser.parse_args()
+
+    python_versions = args.python_versions or get_from_common_service(
+        resource="/api/v1/python-versions"
+    )
+    changed = check_packages(
+        {
+            python_version: get_from_common_service(
+                resource=f"/api/v1/config/{python_version}/pckgs"
+            )
+            for python_version in python_versions
+        },
+        table_name=args.table,
+        max_workers=args.max_workers,
+    )
+    print(json.dumps(changed, indent=2))
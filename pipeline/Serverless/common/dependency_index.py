@@ -0,0 +1,228 @@
+import os
+import re
+import json
+import argparse
+
+import boto3
+from packaging.version import parse, InvalidVersion
+
+from aws_lambda_powertools.logging import Logger
+
+logger = Logger()
+
+# DynamoDB's limit on the requests of a batch_write_item
+BATCH_WRITE_MAX_ITEMS = 25
+
+
+def dependency_name(name: str) -> str:
+    """
+    Args:
+        name: Distribution name as pinned in a requirements.txt
+    return:
+        name: PEP 503 normalized name, so requests_toolbelt and requests-toolbelt share an index entry
+    """
+    return re.sub(r"[-_.]+", "-", name).lower()
+
+
+def parse_requirements(requirements_txt: str) -> dict:
+    """
+    Args:
+        requirements_txt: rqrmntsTxt of a build, name==version lines
+    return:
+        pins: normalized dependency name -> pinned version
+    """
+    pins = {}
+    for line in requirements_txt.split("\n"):
+        if "==" not in line:
+            continue
+        name, version = line.split("==", 1)
+        pins[dependency_name(name.strip())] = version.strip()
+    return pins
+
+
+def index_key(dependency: str, package: str, python_version: str) -> dict:
+    return {
+        "pk": {"S": f"dpndncy#{dependency}"},
+        "sk": {"S": f"pckg#{python_version}:{package}"},
+    }
+
+
+def index_writes(
+    package: str, python_version: str, old_requirements: str, new_requirements: str
+) -> list:
+    """
+    Args:
+        package: Package of the layer, as in the sk of its bldVrsn0# item
+        python_version: Version of python (e.g. p3.12)
+        old_requirements: rqrmntsTxt before the change, empty for a new build
+        new_requirements: rqrmntsTxt after the change, empty if the build was removed
+    return:
+        writes: batch_write_item requests that bring the index in line with new_requirements,
+                nothing for unchanged pins (e.g. when only the checked date of the build changed)
+    """
+    old_pins = parse_requirements(old_requirements)
+    new_pins = parse_requirements(new_requirements)
+
+    writes = []
+    for dependency, version in new_pins.items():
+        if old_pins.get(dependency) == version:
+            continue
+        item = {
+            **index_key(dependency, package, python_version),
+            "dpndncyVrsn": {"S": version},
+            "pckg": {"S": package},
+            "pyVrsn": {"S": python_version},
+        }
+        writes.append({"PutRequest": {"Item": item}})
+    for dependency in old_pins.keys() - new_pins.keys():
+        writes.append(
+            {"DeleteRequest": {"Key": index_key(dependency, package, python_version)}}
+        )
+
+    return writes
+
+
+def write_index(writes: list, table_name: str = None, client=None) -> None:
+    """
+    Args:
+        writes: batch_write_item requests from index_writes
+        table_name: Name of the DynamoDB table, defaults to DB_NAME
+    """
+    client = client or boto3.client("dynamodb")
+    table_name = table_name or os.environ["DB_NAME"]
+
+    for start in range(0, len(writes), BATCH_WRITE_MAX_ITEMS):
+        request = {table_name: writes[start : start + BATCH_WRITE_MAX_ITEMS]}
+        while request:
+            response = client.batch_write_item(RequestItems=request)
+            request = response.get("UnprocessedItems")
+
+
+def get_dependents(dependency: str, table_name: str = None, client=None) -> list:
+    """
+    Args:
+        dependency: Name of a dependency, normalized or not
+        table_name: Name of the DynamoDB table, defaults to DB_NAME
+    return:
+        dependents: (python_version, package, pinned version) of every latest build that pins the dependency
+    """
+    client = client or boto3.client("dynamodb")
+    table_name = table_name or os.environ["DB_NAME"]
+    paginator = client.get_paginator("query")
+
+    dependents = []
+    for page in paginator.paginate(
+        TableName=table_name,
+        KeyConditionExpression="pk = :pk",
+        ExpressionAttributeValues={
+            ":pk": {"S": f"dpndncy#{dependency_name(dependency)}"}
+        },
+        ProjectionExpression="pckg, pyVrsn, dpndncyVrsn",
+    ):
+        for item in page["Items"]:
+            dependents.append(
+                (item["pyVrsn"]["S"], item["pckg"]["S"], item["dpndncyVrsn"]["S"])
+            )
+
+    return dependents
+
+
+def get_layers_to_rebuild(
+    releases: dict, python_versions: list = None, table_name: str = None, client=None
+) -> dict:
+    """
+    Args:
+        releases: dependency name -> newly released version
+        python_versions: Only layers of these python versions, all if None
+        table_name: Name of the DynamoDB table, defaults to DB_NAME
+    return:
+        layers: python_version -> {package: {dependency: pinned version}} of the layers that pin a released
+                dependency to an older version. Whether the layer can take the new release is up to the resolver,
+                a rebuild that resolves to the same requirements hash is skipped by the build.
+    """
+    layers = {}
+    for dependency, released in releases.items():
+        try:
+            released_version = parse(released)
+        except InvalidVersion:
+            logger.warning({"dependency": dependency, "invalid_version": released})
+            continue
+        for python_version, package, pinned in get_dependents(
+            dependency, table_name=table_name, client=client
+        ):
+            if python_versions is not None and python_version not in python_versions:
+                continue
+            try:
+                if parse(pinned) >= released_version:
+                    continue
+            except InvalidVersion:
+                pass  # unparseable pin, rebuild to be safe
+            layers.setdefault(python_version, {}).setdefault(package, {})[
+                dependency_name(dependency)
+            ] = pinned
+
+    logger.info(
+        {
+            "message": "Layers to rebuild",
+            "releases": len(releases),
+            "layers": sum(len(packages) for packages in layers.values()),
+        }
+    )
+    return layers
+
+
+def backfill(python_versions: list, table_name: str = None, client=None) -> int:
+    """
+    Indexes the latest build of every package, for builds that landed before the index existed
+    Args:
+        python_versions: Versions of python to index
+        table_name: Name of the DynamoDB table, defaults to DB_NAME
+    return:
+        count: Number of index items written
+    """
+    client = client or boto3.client("dynamodb")
+    table_name = table_name or os.environ["DB_NAME"]
+    paginator = client.get_paginator("query")
+
+    count = 0
+    for python_version in python_versions:
+        for page in paginator.paginate(
+            TableName=table_name,
+            KeyConditionExpression="pk = :pk",
+            ExpressionAttributeValues={":pk": {"S": f"bldVrsn0#{python_version}"}},
+            ProjectionExpression="sk, rqrmntsTxt",
+        ):
+            for item in page["Items"]:
+                writes = index_writes(
+                    package=item["sk"]["S"][len("pckg#") :],
+                    python_version=python_version,
+                    old_requirements="",
+                    new_requirements=item.get("rqrmntsTxt", {}).get("S", ""),
+                )
+                write_index(writes, table_name=table_name, client=client)
+                count += len(writes)
+
+    return count
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Reverse-dependency index of layers")
+    parser.add_argument("--table", help="DynamoDB table, defaults to DB_NAME")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    backfill_parser = subparsers.add_parser(
+        "backfill", help="Index the latest build of every package"
+    )
+    backfill_parser.add_argument("python_versions", nargs="+")
+    query_parser = subparsers.add_parser(
+        "query", help="Print the layers to rebuild for new dependency releases"
+    )
+    query_parser.add_argument("releases", nargs="+", help="name==version")
+    args = parser.parse_args()
+
+    if args.command == "backfill":
+        print(backfill(args.python_versions, table_name=args.table))
+    else:
+        layers = get_layers_to_rebuild(
+            parse_requirements("\n".join(args.releases)), table_name=args.table
+        )
+        print(json.dumps(layers, indent=2))
@@ -0,0 +1,164 @@
+import os
+import json
+import argparse
+
+import boto3
+
+from aws_lambda_powertools.logging import Logger
+
+logger = Logger()
+
+
+def layer_package_name(package: str) -> str:
+    """
+    Args:
+        package: Package name as configured, optionally with extras (e.g. requests[security])
+    return:
+        package: Package name used in layer names and lyr# items, without extras
+    """
+    return package.split("[")[0]
+
+
+def get_latest_builds(python_version: str, table_name: str, client=None) -> dict:
+    """
+    Args:
+        python_version: Version of python (e.g. p3.12)
+        table_name: Name of the DynamoDB table
+    return:
+        builds: package -> requirements_hash of the latest build, from the bldVrsn0#<python_version> partition
+    """
+    client = client or boto3.client("dynamodb")
+    paginator = client.get_paginator("query")
+
+    builds = {}
+    for page in paginator.paginate(
+        TableName=table_name,
+        KeyConditionExpression="pk = :pk",
+        ExpressionAttributeValues={":pk": {"S": f"bldVrsn0#{python_version}"}},
+        ProjectionExpression="sk, rqrmntsHsh",
+    ):
+        for item in page["Items"]:
+            if "rqrmntsHsh" not in item:
+                continue
+            package = item["sk"]["S"][len("pckg#") :]
+            builds[package] = item["rqrmntsHsh"]["S"]
+
+    return builds
+
+
+def get_latest_layers(table_name: str, client=None) -> dict:
+    """
+    Reads every layer currently deployed, for every python version, with one paginated scan of the sparse
+    package_global_by_python_version index. Its partition key combines package and python version, so it
+    can't be queried by python version alone, callers planning several python versions share the result
+    Args:
+        table_name: Name of the DynamoDB table
+    return:
+        layers: python_version -> package -> {region: requirements_hash} of the latest layer in each region
+    """
+    client = client or boto3.client("dynamodb")
+    paginator = client.get_paginator("scan")
+
+    layers = {}
+    for page in paginator.paginate(
+        TableName=table_name,
+        IndexName="package_global_by_python_version",
+        FilterExpression="dplySts = :latest",
+        ExpressionAttributeValues={":latest": {"S": "latest"}},
+        ProjectionExpression="#pckgPyVrsn, rgn, rqrmntsHsh",
+        ExpressionAttributeNames={"#pckgPyVrsn": "pckg#PyVrsn"},
+    ):
+        for item in page["Items"]:
+            package, python_version = item["pckg#PyVrsn"]["S"].rsplit(":", 1)
+            layers.setdefault(python_version, {}).setdefault(package, {})[
+                item["rgn"]["S"]
+            ] = item["rqrmntsHsh"]["S"]
+
+    return layers
+
+
+def plan_deploys(
+    python_version: str,
+    packages: list,
+    regions: list,
+    table_name: str = None,
+    client=None,
+    layers: dict = None,
+) -> dict:
+    """
+    Diffs the latest build of every package against the layers deployed in every region
+    Args:
+        python_version: Version of python (e.g. p3.12)
+        packages: Packages configured for the python version
+        regions: Regions configured for the python version
+        table_name: Name of the DynamoDB table, defaults to DB_NAME
+        layers: Result of get_latest_layers(), scanned here if not given
+    return:
+        plan: package -> {"requirements_hash", "regions"} for packages with regions to publish to,
+              packages that have never been built are left out, they need a build before a deploy
+    """
+    table_name = table_name or os.environ["DB_NAME"]
+    builds = get_latest_builds(
+        python_version=python_version, table_name=table_name, client=client
+    )
+    if layers is None:
+        layers = get_latest_layers(table_name=table_name, client=client)
+    layers = layers.get(python_version, {})
+
+    plan = {}
+    for package in packages:
+        requirements_hash = builds.get(package)
+        if requirements_hash is None:
+            continue
+        deployed = layers.get(layer_package_name(package), {})
+        regions_to_deploy = [
+            region for region in regions if deployed.get(region) != requirements_hash
+        ]
+        if regions_to_deploy:
+            plan[package] = {
+                "requirements_hash": requirements_hash,
+                "regions": regions_to_deploy,
+            }
+
+    logger.info(
+        {
+            "message": "Deploy plan",
+            "python_version": python_version,
+            "packages": len(plan),
+            "publishes": sum(len(work["regions"]) for work in plan.values()),
+            "not_built": [package for package in packages if package not in builds],
+        }
+    )
+
+    return plan
+
+
+if __name__ == "__main__":
+    from common.get_config import get_from_common_service
+
+    parser = argparse.ArgumentParser(
+        description="Dry run: print the (package, region) publishes needed for a python version"
+    )
+    parser.add_argument("python_version", help="Version of python (e.g. p3.12)")
+    parser.add_argument("--table", help="DynamoDB table, defaults to DB_NAME")
+    parser.add_argument(
+        "--regions", nargs="*", help="Regions, defaults to the common service config"
+    )
+    parser.add_argument(
+        "--packages", nargs="*", help="Packages, defaults to the common service config"
+    )
+    args = parser.parse_args()
+
+    regions = args.regions or get_from_common_service(
+        resource=f"/api/v1/config/{args.python_version}/rgns"
+    )
+    packages = args.packages or get_from_common_service(
+        resource=f"/api/v1/config/{args.python_version}/pckgs"
+    )
+    plan = plan_deploys(
+        python_version=args.python_version,
+        packages=packages,
+        regions=regions,
+        table_name=args.table,
+    )
+    print(json.dumps(plan, indent=2))
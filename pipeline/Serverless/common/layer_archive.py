@@ -0,0 +1,277 @@
+import io
+import copy
+import struct
+import zipfile
+
+from aws_lambda_powertools.logging import Logger
+
+logger = Logger()
+
+# General purpose flag bit 3: sizes and CRC follow the data in a data descriptor
+FLAG_DATA_DESCRIPTOR = 0x08
+
+# General purpose flag bit 0: entry is encrypted
+FLAG_ENCRYPTED = 0x01
+
+
+def raw_entry_offset(source, info: zipfile.ZipInfo) -> int:
+    """
+    Args:
+        source: Open file of the source archive
+        info: Entry in the source archive
+    return:
+        offset: Offset of the entry's compressed data, just after its local file header
+    """
+    source.seek(info.header_offset)
+    header = struct.unpack(
+        zipfile.structFileHeader, source.read(zipfile.sizeFileHeader)
+    )
+    filename_length, extra_length = header[10], header[11]
+    return info.header_offset + zipfile.sizeFileHeader + filename_length + extra_length
+
+
+def copy_raw_entry(source, info: zipfile.ZipInfo, destination: zipfile.ZipFile):
+    """
+    Copies an entry's compressed bytes into the destination archive without decompressing them
+    Args:
+        source: Open file of the source archive
+        info: Entry in the source archive
+        destination: Archive opened for writing
+    """
+    source.seek(raw_entry_offset(source, info))
+
+    entry = copy.copy(info)
+    # Sizes and CRC are known and written in the local header, there's no data descriptor in the output
+    entry.flag_bits &= ~FLAG_DATA_DESCRIPTOR
+    entry.header_offset = destination.fp.tell()
+    destination.fp.write(entry.FileHeader())
+
+    remaining = info.compress_size
+    while remaining > 0:
+        chunk = source.read(min(remaining, 1024 * 1024))
+        if not chunk:
+            raise zipfile.BadZipFile(f"Truncated entry {info.filename}")
+        destination.fp.write(chunk)
+        remaining -= len(chunk)
+
+    destination.filelist.append(entry)
+    destination.NameToInfo[entry.filename] = entry
+    destination.start_dir = destination.fp.tell()
+    destination._didModify = True
+
+
+def merge_archives(sources: list, destination_path: str) -> dict:
+    """
+    Merges zip archives entry by entry, copying compressed data as is, nothing is extracted to disk
+    The first archive to contain a path wins, identical duplicates are dropped and differing ones reported
+    Args:
+        sources: (name, path) of each archive in priority order
+        destination_path: Path of the merged archive
+    return:
+        report: entries written, duplicates dropped, and conflicts as path -> names of archives with differing content
+    """
+    written = {}  # path -> (name, crc, file_size)
+    duplicates = 0
+    conflicts = {}
+
+    with zipfile.ZipFile(destination_path, "w") as destination:
+        for name, path in sources:
+            with open(path, "rb") as source, zipfile.ZipFile(source) as archive:
+                for info in archive.infolist():
+                    if info.flag_bits & FLAG_ENCRYPTED:
+                        raise zipfile.BadZipFile(
+                            f"Encrypted entry {info.filename} in {name}"
+                        )
+                    existing = written.get(info.filename)
+                    if existing is None:
+                        copy_raw_entry(source, info, destination)
+                        written[info.filename] = (name, info.CRC, info.file_size)
+                        continue
+
+                    duplicates += 1
+                    if info.is_dir() or existing[1:] == (info.CRC, info.file_size):
+                        continue
+                    conflicts.setdefault(info.filename, [existing[0]]).append(name)
+
+    report = {
+        "entries": len(written),
+        "duplicates": duplicates,
+        "conflicts": conflicts,
+    }
+    if conflicts:
+        logger.warning(
+            {
+                "message": "Conflicting files, kept the first archive's copy",
+                "conflicts": conflicts,
+            }
+        )
+    logger.info({"message": "Merged archives", **report})
+
+    return report
+
+
+# Lambda's limit on the unzipped size of a function and all its layers
+LAMBDA_LAYER_UNZIPPED_LIMIT = 262144000
+
+
+class PreflightError(Exception):
+    """
+    Raised when components can't be combined into a single layer
+    """
+
+
+class S3RangeReader(io.RawIOBase):
+    """
+    Seekable read-only file over an S3 object, reads are served with ranged GETs
+    The first request fetches the tail of the object, where zip archives keep their central directory,
+    so zipfile can list an archive without downloading it
+    """
+
+    def __init__(self, s3_client, bucket: str, key: str, tail_bytes: int = 1024 * 1024):
+        self.s3_client = s3_client
+        self.bucket = bucket
+        self.key = key
+        self.requests = 0
+        self.position = 0
+
+        response = self.get_range(f"bytes=-{tail_bytes}")
+        # Content-Range: bytes <start>-<end>/<size>
+        self.size = int(response["ContentRange"].split("/")[-1])
+        self.buffer = response["Body"].read()
+        self.buffer_start = self.size - len(self.buffer)
+
+    def get_range(self, byte_range: str) -> dict:
+        self.requests += 1
+        return self.s3_client.get_object(
+            Bucket=self.bucket, Key=self.key, Range=byte_range
+        )
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def tell(self) -> int:
+        return self.position
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        if whence == io.SEEK_SET:
+            self.position = offset
+        elif whence == io.SEEK_CUR:
+            self.position += offset
+        elif whence == io.SEEK_END:
+            self.position = self.size + offset
+        return self.position
+
+    def readinto(self, b) -> int:
+        length = min(len(b), self.size - self.position)
+        if length <= 0:
+            return 0
+        start = self.position - self.buffer_start
+        if start >= 0:
+            data = self.buffer[start : start + length]
+        else:
+            end = self.position + length - 1
+            data = self.get_range(f"bytes={self.position}-{end}")["Body"].read()
+        b[: len(data)] = data
+        self.position += len(data)
+        return len(data)
+
+
+def read_central_directory(s3_client, bucket: str, key: str) -> list:
+    """
+    Args:
+        bucket: Bucket of the archive
+        key: Key of the archive
+    return:
+        entries: ZipInfo of every entry, read without downloading the archive
+    """
+    with S3RangeReader(s3_client, bucket, key) as reader:
+        with zipfile.ZipFile(reader) as archive:
+            entries = archive.infolist()
+        logger.debug({"key": key, "requests": reader.requests, "size": reader.size})
+    return entries
+
+
+def get_dist_info_versions(entries: list) -> dict:
+    """
+    Args:
+        entries: ZipInfo of every entry in the archive
+    return:
+        versions: normalized distribution name -> version, from <name>-<version>.dist-info directories
+    """
+    versions = {}
+    for info in entries:
+        for part in info.filename.split("/"):
+            if part.endswith(".dist-info") and "-" in part:
+                name, version = part[: -len(".dist-info")].split("-", 1)
+                name = name.lower().replace("_", "-").replace(".", "-")
+                versions[name] = version
+                break
+    return versions
+
+
+def preflight(components: dict, limit: int = LAMBDA_LAYER_UNZIPPED_LIMIT) -> dict:
+    """
+    Checks that components fit in a single layer before anything is downloaded
+    Args:
+        components: name -> ZipInfo of every entry of the component archive, in priority order
+        limit: Maximum unzipped size of the combined layer
+    return:
+        report: per-component sizes, total unzipped size of the merge, overlapping and conflicting paths
+    raises:
+        PreflightError: The combined layer is over the limit, or components ship different versions of a distribution
+    """
+    sizes = {}
+    written = {}  # path -> (name, crc, file_size)
+    overlapping = 0
+    conflicts = {}
+    distributions = {}  # name -> {version: [components]}
+
+    for name, entries in components.items():
+        sizes[name] = {
+            "entries": len(entries),
+            "compressed": sum(info.compress_size for info in entries),
+            "uncompressed": sum(info.file_size for info in entries),
+        }
+        for info in entries:
+            existing = written.get(info.filename)
+            if existing is None:
+                written[info.filename] = (name, info.CRC, info.file_size)
+                continue
+            overlapping += 1
+            if not info.is_dir() and existing[1:] != (info.CRC, info.file_size):
+                conflicts.setdefault(info.filename, [existing[0]]).append(name)
+        for distribution, version in get_dist_info_versions(entries).items():
+            distributions.setdefault(distribution, {}).setdefault(version, []).append(
+                name
+            )
+
+    version_conflicts = {
+        distribution: versions
+        for distribution, versions in distributions.items()
+        if len(versions) > 1
+    }
+    total = sum(file_size for _, _, file_size in written.values())
+    report = {
+        "components": sizes,
+        "unzipped_size": total,
+        "limit": limit,
+        "overlapping_paths": overlapping,
+        "conflicting_paths": len(conflicts),
+        "version_conflicts": version_conflicts,
+    }
+    logger.info({"message": "Preflight", **report})
+
+    if total > limit:
+        raise PreflightError(
+            f"Combined layer is {total} bytes unzipped, over the {limit} byte limit. "
+            f"Per component: { {name: size['uncompressed'] for name, size in sizes.items()} }"
+        )
+    if version_conflicts:
+        raise PreflightError(
+            f"Components ship different versions of the same distribution: {version_conflicts}"
+        )
+
+    return report
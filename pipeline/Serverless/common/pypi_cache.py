@@ -0,0 +1,221 @@
+import os
+import re
+import threading
+from datetime import datetime
+
+import boto3
+import requests
+from packaging.version import parse, InvalidVersion
+
+from aws_lambda_powertools.logging import Logger
+
+logger = Logger()
+
+# Hits and bytes saved over the lifetime of the container
+cache_stats = {"hits": 0, "misses": 0, "bytes_saved": 0}
+stats_lock = threading.Lock()
+
+# PEP 691 JSON form of the simple index, PEP 700 adds the versions list to it
+SIMPLE_JSON = "application/vnd.pypi.simple.v1+json"
+
+# Plain final releases (e.g. 2.31.0) are compared as integer tuples without building a Version
+FINAL_RELEASE = re.compile(r"^[0-9]+(\.[0-9]+)*$")
+
+
+def normalize(package: str) -> str:
+    """
+    Args:
+        package: Name of package
+    return:
+        name: PEP 503 normalized name, as used in simple index URLs
+    """
+    return re.sub(r"[-_.]+", "-", package).lower()
+
+
+def get_latest_stable_version(releases) -> str:
+    """
+    Single pass over the releases, only versions that aren't plain final releases are parsed by packaging
+    Args:
+        releases: Release versions listed by PyPI
+    return:
+        version: Highest release that is **not** a pre-release, "0" if there is none
+    """
+    best_final, best_final_key = None, ()
+    best_other = None
+    for release in releases:
+        if FINAL_RELEASE.match(release):
+            key = tuple(int(part) for part in release.split("."))
+            if key > best_final_key:
+                best_final, best_final_key = release, key
+            continue
+        try:
+            ver = parse(release)
+        except InvalidVersion:
+            continue
+        if not ver.is_prerelease and (best_other is None or ver > best_other):
+            best_other = ver
+
+    candidates = [ver for ver in (best_other,) if ver is not None]
+    if best_final is not None:
+        candidates.append(parse(best_final))
+    return str(max(candidates, default=parse("0")))
+
+
+def get_license(package: str, version: str, pypi_url: str, session=None) -> str:
+    """
+    Args:
+        package: Name of package, without extras
+        version: Release to get the license of
+        pypi_url: Base URL of the index
+    return:
+        license_info: License as per PyPI, from the release's (much smaller) legacy JSON document
+    """
+    response = (session or requests).get(f"{pypi_url}/pypi/{package}/{version}/json")
+    if response.status_code != requests.codes.ok:
+        return "No-License-In-PyPI"
+    license_info = response.json().get("info", {}).get("license", None)
+    return license_info if license_info is not None else "No-License-In-PyPI"
+
+
+def get_legacy_release(package: str, pypi_url: str, session=None) -> tuple:
+    """
+    Fallback for indexes that don't serve the JSON simple API
+    Args:
+        package: Name of package, without extras
+        pypi_url: Base URL of the index
+    return:
+        version: Latest stable version, None if PyPI couldn't be reached
+        license_info: License as per PyPI
+    """
+    response = (session or requests).get(f"{pypi_url}/pypi/{package}/json")
+    if response.status_code != requests.codes.ok:
+        return None, None
+    document = response.json()
+    license_info = document.get("info", {}).get("license", None)
+    if license_info is None:
+        license_info = "No-License-In-PyPI"
+    return get_latest_stable_version(document.get("releases", {})), license_info
+
+
+def get_cached_metadata(package: str, client=None) -> dict:
+    """
+    Args:
+        package: Name of package, without extras
+    return:
+        item: pypi#<package> item with the validators and latest version of the last full fetch, empty if never fetched
+    """
+    client = client or boto3.client("dynamodb")
+    response = client.get_item(
+        TableName=os.environ["DB_NAME"],
+        Key={"pk": {"S": f"pypi#{package}"}, "sk": {"S": "mtdt#"}},
+    )
+    return response.get("Item", {})
+
+
+def put_cached_metadata(
+    package: str,
+    response: requests.Response,
+    version: str,
+    license_info: str,
+    client=None,
+) -> None:
+    """
+    Args:
+        package: Name of package, without extras
+        response: Full (200) response from the simple index
+        version: Latest stable version computed from the response
+        license_info: License from the response
+    """
+    client = client or boto3.client("dynamodb")
+    item = {
+        "pk": {"S": f"pypi#{package}"},
+        "sk": {"S": "mtdt#"},
+        "ltstVrsn": {"S": version},
+        "lcns": {"S": license_info},
+        "sz": {"N": str(len(response.content))},
+        "chckdDt": {"S": datetime.utcnow().isoformat()},
+    }
+    if response.headers.get("ETag"):
+        item["etg"] = {"S": response.headers["ETag"]}
+    if response.headers.get("Last-Modified"):
+        item["lstMdfd"] = {"S": response.headers["Last-Modified"]}
+    client.put_item(TableName=os.environ["DB_NAME"], Item=item)
+
+
+def get_latest_release(
+    package: str, client=None, session=None, use_cache: bool = True
+) -> tuple:
+    """
+    Gets the latest stable release from the JSON simple index, with a conditional request against the cached ETag
+    and Last-Modified. On a 304 the cached version is used and the document is neither downloaded nor parsed.
+    The license is only fetched, from the release's own JSON document, when the latest version changed.
+    Args:
+        package: Name of package, without extras
+        session: requests.Session to share a connection pool between lookups, module level requests if None
+        use_cache: False for a full fetch that neither reads nor writes the pypi# item
+    return:
+        version: Latest stable version, None if PyPI couldn't be reached
+        license_info: License as per PyPI
+    """
+    client = client or boto3.client("dynamodb")
+    session = session or requests
+    pypi_url = os.environ.get("PYPI_URL", "https://pypi.org")
+    cached = get_cached_metadata(package, client=client) if use_cache else {}
+
+    headers = {"Accept": SIMPLE_JSON}
+    if "etg" in cached:
+        headers["If-None-Match"] = cached["etg"]["S"]
+    if "lstMdfd" in cached:
+        headers["If-Modified-Since"] = cached["lstMdfd"]["S"]
+
+    response = session.get(f"{pypi_url}/simple/{normalize(package)}/", headers=headers)
+
+    if response.status_code == requests.codes.not_modified and "ltstVrsn" in cached:
+        with stats_lock:
+            cache_stats["hits"] += 1
+            cache_stats["bytes_saved"] += int(cached["sz"]["N"])
+        version = cached["ltstVrsn"]["S"]
+        license_info = cached["lcns"]["S"]
+    elif response.status_code == requests.codes.ok:
+        with stats_lock:
+            cache_stats["misses"] += 1
+        document = {}
+        if response.headers.get("Content-Type", "").startswith(SIMPLE_JSON):
+            document = response.json()
+        if "versions" not in document:
+            # HTML only, or a pre PEP 700 index without the versions list
+            logger.info({"message": "No JSON simple index", "package": package})
+            version, license_info = get_legacy_release(package, pypi_url, session)
+            if version is None:
+                return None, None
+        else:
+            version = get_latest_stable_version(document["versions"])
+            if cached.get("ltstVrsn", {}).get("S") == version and "lcns" in cached:
+                license_info = cached["lcns"]["S"]
+            else:
+                license_info = get_license(package, version, pypi_url, session)
+        if use_cache:
+            put_cached_metadata(
+                package=package,
+                response=response,
+                version=version,
+                license_info=license_info,
+                client=client,
+            )
+    else:
+        logger.warning({"package": package, "status_code": response.status_code})
+        return None, None
+
+    with stats_lock:
+        stats = dict(cache_stats)
+    logger.info(
+        {
+            "message": "PyPI metadata",
+            "package": package,
+            "cache": "hit" if response.status_code == 304 else "miss",
+            "hit_rate": round(stats["hits"] / (stats["hits"] + stats["misses"]), 3),
+            **stats,
+        }
+    )
+
+    return version, license_info
@@ -0,0 +1,253 @@
+import os
+import time
+import random
+import threading
+
+from botocore.config import Config
+from botocore.exceptions import (
+    ClientError,
+    ConnectionClosedError,
+    ConnectTimeoutError,
+    EndpointConnectionError,
+    ReadTimeoutError,
+)
+
+from aws_lambda_powertools.logging import Logger
+
+logger = Logger()
+
+# Error codes the Lambda control plane returns when the account is over its request rate
+THROTTLE_ERROR_CODES = (
+    "TooManyRequestsException",
+    "ThrottlingException",
+    "Throttling",
+    "RequestLimitExceeded",
+)
+
+# Server side and network errors, retried with backoff without slowing the region down
+TRANSIENT_ERROR_CODES = (
+    "ServiceException",
+    "InternalFailure",
+    "InternalError",
+    "ServiceUnavailable",
+    "ServiceUnavailableException",
+    "RequestTimeout",
+    "RequestTimeoutException",
+)
+CONNECTION_ERRORS = (
+    ConnectionClosedError,
+    ConnectTimeoutError,
+    EndpointConnectionError,
+    ReadTimeoutError,
+)
+
+
+def is_transient(error: Exception) -> bool:
+    """
+    Args:
+        error: Exception raised by a boto3 client call
+    return:
+        True for errors botocore's standard retry mode would retry, other than throttles
+    """
+    if isinstance(error, CONNECTION_ERRORS):
+        return True
+    if isinstance(error, ClientError):
+        status = error.response.get("ResponseMetadata", {}).get("HTTPStatusCode", 0)
+        return error.response["Error"]["Code"] in TRANSIENT_ERROR_CODES or status >= 500
+    return False
+
+
+# botocore retries throttles on its own, which hides them from the limiter, so lambda clients don't retry
+# RateLimiter.call retries throttles and transient errors instead
+LAMBDA_CLIENT_CONFIG = Config(retries={"mode": "standard", "max_attempts": 1})
+
+
+class TokenBucket:
+    """
+    Token bucket for a single region, the rate is adjusted with AIMD:
+    additive increase after every success, multiplicative decrease after a throttle
+    """
+
+    def __init__(
+        self,
+        rate: float,
+        min_rate: float,
+        max_rate: float,
+        increase: float,
+        decrease: float,
+    ):
+        self.rate = rate
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.increase = increase
+        self.decrease = decrease
+        self.tokens = 1.0
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+        self.calls = 0
+        self.waits = 0
+        self.wait_seconds = 0.0
+        self.throttles = 0
+
+    def reserve(self) -> float:
+        """
+        Takes a token, going into debt if there's none left
+        return:
+            wait: Seconds to wait before the token can be used
+        """
+        with self.lock:
+            now = time.monotonic()
+            # Burst is capped at one second worth of calls
+            self.tokens = min(
+                max(self.rate, 1.0), self.tokens + (now - self.updated) * self.rate
+            )
+            self.updated = now
+            self.tokens -= 1
+            self.calls += 1
+            wait = max(0.0, -self.tokens / self.rate)
+            if wait > 0:
+                self.waits += 1
+                self.wait_seconds += wait
+            return wait
+
+    def on_success(self) -> None:
+        with self.lock:
+            self.rate = min(self.max_rate, self.rate + self.increase)
+
+    def on_throttle(self) -> None:
+        with self.lock:
+            self.throttles += 1
+            self.rate = max(self.min_rate, self.rate * self.decrease)
+            # Drop tokens accrued at the old rate
+            self.tokens = min(self.tokens, 0.0)
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {
+                "rate": round(self.rate, 2),
+                "calls": self.calls,
+                "waits": self.waits,
+                "wait_seconds": round(self.wait_seconds, 3),
+                "throttles": self.throttles,
+            }
+
+
+class RateLimiter:
+    """
+    Paces AWS API calls per region, shared by all threads of the function
+    Rates are in calls per second, defaults can be overridden with LAMBDA_API_RATE, LAMBDA_API_MIN_RATE
+    and LAMBDA_API_MAX_RATE
+    """
+
+    def __init__(
+        self,
+        rate: float = None,
+        min_rate: float = None,
+        max_rate: float = None,
+        increase: float = 0.5,
+        decrease: float = 0.5,
+        max_attempts: int = 8,
+        backoff: float = 0.5,
+        max_backoff: float = 20,
+    ):
+        self.rate = rate or float(os.environ.get("LAMBDA_API_RATE", 5))
+        self.min_rate = min_rate or float(os.environ.get("LAMBDA_API_MIN_RATE", 0.2))
+        self.max_rate = max_rate or float(os.environ.get("LAMBDA_API_MAX_RATE", 20))
+        self.increase = increase
+        self.decrease = decrease
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.buckets = {}
+        self.lock = threading.Lock()
+
+    def bucket(self, region: str) -> TokenBucket:
+        with self.lock:
+            if region not in self.buckets:
+                self.buckets[region] = TokenBucket(
+                    rate=self.rate,
+                    min_rate=self.min_rate,
+                    max_rate=self.max_rate,
+                    increase=self.increase,
+                    decrease=self.decrease,
+                )
+            return self.buckets[region]
+
+    def call(self, client, operation: str, **kwargs):
+        """
+        Calls the operation once a token is available for the client's region, retrying throttles,
+        server errors and connection errors
+        Args:
+            client: boto3 client, ideally created with LAMBDA_CLIENT_CONFIG
+            operation: Name of the client method (e.g. publish_layer_version)
+            kwargs: Arguments of the operation
+        return:
+            response: Response of the operation
+        """
+        region = client.meta.region_name
+        bucket = self.bucket(region)
+
+        for attempt in range(1, self.max_attempts + 1):
+            wait = bucket.reserve()
+            if wait > 0:
+                time.sleep(wait)
+            try:
+                response = getattr(client, operation)(**kwargs)
+            except ClientError as e:
+                if e.response["Error"]["Code"] in THROTTLE_ERROR_CODES:
+                    bucket.on_throttle()
+                    logger.warning(
+                        {
+                            "message": "Throttled",
+                            "region": region,
+                            "operation": operation,
+                            "attempt": attempt,
+                            "rate": bucket.rate,
+                        }
+                    )
+                    if attempt == self.max_attempts:
+                        raise
+                    continue
+                if not is_transient(e) or attempt == self.max_attempts:
+                    raise
+                self.back_off(region, operation, attempt, e)
+                continue
+            except CONNECTION_ERRORS as e:
+                if attempt == self.max_attempts:
+                    raise
+                self.back_off(region, operation, attempt, e)
+                continue
+            bucket.on_success()
+            return response
+
+    def back_off(self, region: str, operation: str, attempt: int, error: Exception):
+        """
+        Sleeps before retrying a transient error, exponential with full jitter like botocore's standard mode
+        """
+        delay = random.uniform(
+            0, min(self.max_backoff, self.backoff * 2 ** (attempt - 1))
+        )
+        logger.warning(
+            {
+                "message": "Transient error, retrying",
+                "region": region,
+                "operation": operation,
+                "attempt": attempt,
+                "error": str(error),
+                "delay": round(delay, 3),
+            }
+        )
+        time.sleep(delay)
+
+    def stats(self) -> dict:
+        """
+        return:
+            stats: region -> current rate, calls, waits, seconds waited and throttles
+        """
+        with self.lock:
+            buckets = dict(self.buckets)
+        return {region: bucket.stats() for region, bucket in buckets.items()}
+
+
+# Shared by every module in the function, so all calls to a region draw from the same bucket
+lambda_rate_limiter = RateLimiter()
@@ -0,0 +1,116 @@
+import os
+
+import boto3
+from botocore.exceptions import ClientError
+
+from aws_lambda_powertools.logging import Logger
+
+logger = Logger()
+
+# Buckets checked in this execution environment, bucket name -> usable
+_staging_buckets = {}
+
+# Account of the function, staging buckets must belong to it
+_account_id = None
+
+
+def staging_enabled() -> bool:
+    """
+    return:
+        True if layers are published from regional staging buckets instead of inline zip bytes
+    """
+    return bool(os.environ.get("STAGING_BUCKET_PREFIX"))
+
+
+def staging_bucket_name(region: str) -> str:
+    """
+    Args:
+        region: Region of the staging bucket
+    return:
+        bucket_name: Name of the staging bucket in the region, or None if staging isn't configured
+    """
+    if not staging_enabled():
+        return None
+    return f"{os.environ['STAGING_BUCKET_PREFIX']}-{region}"
+
+
+def get_account_id(session) -> str:
+    """
+    return:
+        account_id: Account of the caller, looked up once per execution environment
+    """
+    global _account_id
+    if _account_id is None:
+        _account_id = session.client("sts").get_caller_identity()["Account"]
+    return _account_id
+
+
+def check_staging_bucket(s3_client, bucket_name: str, account_id: str) -> bool:
+    """
+    Staging buckets are created by Terraform (see Terraform/s3.tf), this only checks the region has one
+    Args:
+        s3_client: S3 client in the region of the bucket
+        bucket_name: Name of the staging bucket
+        account_id: Account that must own the bucket
+    return:
+        usable: False if the bucket doesn't exist, or belongs to another account
+    """
+    if bucket_name not in _staging_buckets:
+        try:
+            s3_client.head_bucket(Bucket=bucket_name, ExpectedBucketOwner=account_id)
+            _staging_buckets[bucket_name] = True
+        except ClientError as e:
+            if e.response["Error"]["Code"] not in ("403", "404", "NoSuchBucket"):
+                raise
+            # 403: the name is taken by a bucket in another account, never copy layers into it
+            logger.error(
+                {
+                    "message": "Staging bucket unusable, publishing inline",
+                    "bucket": bucket_name,
+                    "error_code": e.response["Error"]["Code"],
+                }
+            )
+            _staging_buckets[bucket_name] = False
+
+    return _staging_buckets[bucket_name]
+
+
+def stage_artifact(source_bucket: str, s3_key: str, region: str, session=None) -> dict:
+    """
+    Copies the artifact into the staging bucket of the region with a server-side copy
+    Args:
+        source_bucket: Bucket holding the built artifact
+        s3_key: Key of the artifact, also used as the key in the staging bucket
+        region: Region the layer will be published to
+        session: boto3 session to create the client from, required when called from threads
+    return:
+        content: Content argument for publish_layer_version, None if staging isn't configured or the
+                 region's staging bucket is unusable, the layer is then published inline
+    """
+    bucket_name = staging_bucket_name(region)
+    if bucket_name is None:
+        return None
+
+    session = session or boto3.session.Session()
+    s3_client = session.client("s3", region_name=region)
+    account_id = get_account_id(session)
+    if not check_staging_bucket(
+        s3_client=s3_client, bucket_name=bucket_name, account_id=account_id
+    ):
+        return None
+
+    logger.info(
+        {
+            "message": "Staging artifact",
+            "source": f"s3://{source_bucket}/{s3_key}",
+            "destination": f"s3://{bucket_name}/{s3_key}",
+        }
+    )
+    s3_client.copy_object(
+        Bucket=bucket_name,
+        Key=s3_key,
+        CopySource={"Bucket": source_bucket, "Key": s3_key},
+        ExpectedBucketOwner=account_id,
+    )
+
+    return {"S3Bucket": bucket_name, "S3Key": s3_key}
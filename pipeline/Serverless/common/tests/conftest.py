@@ -0,0 +1,103 @@
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+from moto import mock_aws
+
+from .. import pypi_cache
+from .table_helpers import TABLE_NAME, create_table
+
+# Releases served for each package unless a test changes pypi.versions
+VERSIONS = {
+    "requests": ["2.31.0", "2.32.0"],
+    "boto3": ["1.0.0", "1.1.0", "2.0.0b1"],
+    "flaky": ["1.0.0"],
+}
+
+
+class PyPIStandIn(BaseHTTPRequestHandler):
+    """
+    Serves /simple/<package>/ from versions with an ETag, answering 304 when If-None-Match matches,
+    and /pypi/<package>/json and /pypi/<package>/<version>/json for licenses and the legacy fallback
+    Unknown packages are a 404, the first request for a flaky package fails with a 503
+    """
+
+    versions = VERSIONS
+    simple_json = True
+    requests = []
+    failed = set()
+
+    def send_document(self, body: bytes, content_type: str, etag: str = None):
+        if etag is not None and self.headers.get("If-None-Match") == etag:
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.end_headers()
+            return
+        self.send_response(200)
+        if etag is not None:
+            self.send_header("ETag", etag)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_status(self, status: int):
+        self.send_response(status)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def do_GET(self):
+        self.requests.append((self.path, self.headers.get("If-None-Match")))
+        name = self.path.split("/")[2]
+        if name == "flaky" and name not in self.failed:
+            self.failed.add(name)
+            return self.send_status(503)
+        if name not in self.versions:
+            return self.send_status(404)
+
+        versions = self.versions[name]
+        if self.path.startswith("/simple/") and self.simple_json:
+            body = json.dumps({"name": name, "versions": versions}).encode()
+            self.send_document(body, pypi_cache.SIMPLE_JSON, f'"{hash(body)}"')
+        elif self.path.startswith("/simple/"):
+            links = "".join(f"<a>{name}-{version}.tar.gz</a>" for version in versions)
+            body = f"<html><body>{links}</body></html>".encode()
+            self.send_document(body, "text/html", f'"{hash(body)}"')
+        elif self.path == f"/pypi/{name}/json":
+            releases = {version: [] for version in versions}
+            body = json.dumps({"info": {"license": "MIT"}, "releases": releases})
+            self.send_document(body.encode(), "application/json")
+        else:
+            body = json.dumps({"info": {"license": "MIT"}}).encode()
+            self.send_document(body, "application/json")
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def pypi(monkeypatch):
+    monkeypatch.setattr(
+        PyPIStandIn,
+        "versions",
+        {name: list(versions) for name, versions in VERSIONS.items()},
+    )
+    monkeypatch.setattr(PyPIStandIn, "simple_json", True)
+    monkeypatch.setattr(PyPIStandIn, "requests", [])
+    monkeypatch.setattr(PyPIStandIn, "failed", set())
+    server = ThreadingHTTPServer(("127.0.0.1", 0), PyPIStandIn)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    monkeypatch.setenv("PYPI_URL", f"http://127.0.0.1:{server.server_port}")
+    yield PyPIStandIn
+    server.shutdown()
+
+
+@pytest.fixture
+def table(monkeypatch):
+    monkeypatch.setenv("AWS_DEFAULT_REGION", "us-east-1")
+    monkeypatch.setenv("DB_NAME", TABLE_NAME)
+    with mock_aws():
+        client = create_table()
+        yield client
@@ -0,0 +1,60 @@
+"""
+Klayers table for moto backed tests and benchmarks, shared by the Serverless tests and pipeline/benchmarks
+"""
+
+import boto3
+
+TABLE_NAME = "kl.Klayers-test.db"
+
+
+def create_table(client=None, table_name: str = TABLE_NAME):
+    """
+    Creates the table with the same keys and package_global_by_python_version index as Terraform/dynamodb
+    return:
+        client: DynamoDB client the table was created with
+    """
+    client = client or boto3.client("dynamodb")
+    client.create_table(
+        TableName=table_name,
+        KeySchema=[
+            {"AttributeName": "pk", "KeyType": "HASH"},
+            {"AttributeName": "sk", "KeyType": "RANGE"},
+        ],
+        AttributeDefinitions=[
+            {"AttributeName": "pk", "AttributeType": "S"},
+            {"AttributeName": "sk", "AttributeType": "S"},
+            {"AttributeName": "pckg#PyVrsn", "AttributeType": "S"},
+            {"AttributeName": "dplySts", "AttributeType": "S"},
+        ],
+        GlobalSecondaryIndexes=[
+            {
+                "IndexName": "package_global_by_python_version",
+                "KeySchema": [
+                    {"AttributeName": "pckg#PyVrsn", "KeyType": "HASH"},
+                    {"AttributeName": "dplySts", "KeyType": "RANGE"},
+                ],
+                "Projection": {
+                    "ProjectionType": "INCLUDE",
+                    "NonKeyAttributes": ["rgn", "rqrmntsHsh"],
+                },
+            }
+        ],
+        BillingMode="PAY_PER_REQUEST",
+    )
+    return client
+
+
+def put_build(client, package: str, python_version: str, **attributes):
+    """
+    Puts the bldVrsn0# item of the latest build
+    Args:
+        attributes: String attributes of the build, e.g. rqrmntsHsh="..."
+    """
+    client.put_item(
+        TableName=TABLE_NAME,
+        Item={
+            "pk": {"S": f"bldVrsn0#{python_version}"},
+            "sk": {"S": f"pckg#{package}"},
+            **{name: {"S": value} for name, value in attributes.items()},
+        },
+    )
@@ -0,0 +1,29 @@
+import boto3
+from moto import mock_aws
+
+from ..artifact_cache import ArtifactCache
+
+
+@mock_aws
+def test_cache_validates_etag_and_evicts(tmp_path, monkeypatch):
+    monkeypatch.setenv("AWS_DEFAULT_REGION", "us-east-1")
+    s3 = boto3.client("s3")
+    s3.create_bucket(Bucket="bucket")
+    s3.put_object(Bucket="bucket", Key="p3.12/a.zip", Body=b"a" * 10)
+    s3.put_object(Bucket="bucket", Key="p3.12/b.zip", Body=b"b" * 10)
+    cache = ArtifactCache(directory=str(tmp_path), max_bytes=15)
+
+    path = cache.get("bucket", "p3.12/a.zip", s3_client=s3)
+    assert cache.get("bucket", "p3.12/a.zip", s3_client=s3) == path
+    assert (cache.hits, cache.misses) == (1, 1)
+
+    # Changed in S3, downloaded again
+    s3.put_object(Bucket="bucket", Key="p3.12/a.zip", Body=b"c" * 10)
+    path = cache.get("bucket", "p3.12/a.zip", s3_client=s3)
+    assert open(path, "rb").read() == b"c" * 10
+    assert (cache.hits, cache.misses) == (1, 2)
+
+    # Over max_bytes, the least recently used object is evicted
+    cache.get("bucket", "p3.12/b.zip", s3_client=s3)
+    assert list(cache.entries) == ["s3://bucket/p3.12/b.zip"]
+    assert not (tmp_path / path).exists()
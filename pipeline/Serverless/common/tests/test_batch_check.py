@@ -0,0 +1,66 @@
+from botocore.exceptions import ClientError
+
+from .. import batch_check, pypi_cache
+from .table_helpers import TABLE_NAME, put_build
+
+
+def test_check_packages(pypi, table):
+    pypi.versions["boto3"] = ["1.34.0"]
+    put_build(table, "requests[security]", "p3.12", pckgVrsn="2.31.0")
+    put_build(table, "boto3", "p3.12", pckgVrsn="1.34.0")
+    put_build(table, "flaky", "p3.12", pckgVrsn="1.0.0")
+    put_build(table, "requests", "p3.13", pckgVrsn="2.32.0")
+
+    changed = batch_check.check_packages(
+        {
+            "p3.12": ["requests[security]", "boto3", "flaky", "missing"],
+            "p3.13": ["requests", "boto3"],
+        },
+        max_workers=4,
+    )
+
+    assert changed == {
+        # flaky succeeded on retry, missing isn't on PyPI and is reported rather than dropped
+        "p3.12": {"requests[security]": "2.32.0", "missing": None},
+        # boto3 was never built for p3.13
+        "p3.13": {"boto3": "1.34.0"},
+    }
+    assert pypi.failed == {"flaky"}
+
+
+def test_versions_are_compared_parsed(pypi, table):
+    pypi.versions["boto3"] = ["1.34.0"]
+    pypi.versions["flaky"] = ["2.0.0rc1", "1.0"]
+    put_build(table, "boto3", "p3.12", pckgVrsn="1.34")
+    put_build(table, "flaky", "p3.12", pckgVrsn="1.0.0")
+    put_build(table, "requests", "p3.12", pckgVrsn="2.31.0")
+
+    changed = batch_check.check_packages({"p3.12": ["boto3", "flaky", "requests"]})
+
+    assert changed == {"p3.12": {"requests": "2.32.0"}}
+
+
+def test_cache_errors_fall_back_per_package(pypi, table, monkeypatch):
+    get_cached_metadata = pypi_cache.get_cached_metadata
+
+    def throttled(package, client=None):
+        if package == "boto3":
+            raise ClientError(
+                {"Error": {"Code": "ProvisionedThroughputExceededException"}},
+                "GetItem",
+            )
+        return get_cached_metadata(package, client=client)
+
+    monkeypatch.setattr(pypi_cache, "get_cached_metadata", throttled)
+
+    assert batch_check.get_latest_versions(["boto3", "requests"]) == {
+        "boto3": "1.1.0",
+        "requests": "2.32.0",
+    }
+    # Only requests went through the cache
+    assert "Item" not in table.get_item(
+        TableName=TABLE_NAME, Key={"pk": {"S": "pypi#boto3"}, "sk": {"S": "mtdt#"}}
+    )
+    assert "Item" in table.get_item(
+        TableName=TABLE_NAME, Key={"pk": {"S": "pypi#requests"}, "sk": {"S": "mtdt#"}}
+    )
@@ -0,0 +1,63 @@
+from moto import mock_aws
+
+from .. import dependency_index
+from .table_helpers import TABLE_NAME, create_table, put_build
+
+
+def test_index_writes_only_changed_pins():
+    old = "certifi==2024.2.2\nrequests==2.31.0\nurllib3==2.2.1"
+    new = "certifi==2024.2.2\nrequests==2.32.0\nidna==3.7"
+    writes = dependency_index.index_writes("requests", "p3.12", old, new)
+
+    puts = {w["PutRequest"]["Item"]["pk"]["S"] for w in writes if "PutRequest" in w}
+    deletes = {
+        w["DeleteRequest"]["Key"]["pk"]["S"] for w in writes if "DeleteRequest" in w
+    }
+    assert puts == {"dpndncy#requests", "dpndncy#idna"}
+    assert deletes == {"dpndncy#urllib3"}
+    assert dependency_index.index_writes("requests", "p3.12", new, new) == []
+
+
+@mock_aws
+def test_layers_to_rebuild(monkeypatch):
+    monkeypatch.setenv("AWS_DEFAULT_REGION", "us-east-1")
+    monkeypatch.setenv("DB_NAME", TABLE_NAME)
+    client = create_table()
+    put_build(
+        client, "requests", "p3.12", rqrmntsTxt="requests==2.32.0\nurllib3==2.2.1"
+    )
+    put_build(client, "boto3", "p3.12", rqrmntsTxt="boto3==1.34.0\nurllib3==1.26.18")
+    put_build(client, "boto3", "p3.13", rqrmntsTxt="boto3==1.34.0\nurllib3==2.2.2")
+    put_build(client, "pyyaml", "p3.12", rqrmntsTxt="PyYAML==6.0.1")
+
+    assert dependency_index.backfill(["p3.12", "p3.13"]) == 7
+
+    layers = dependency_index.get_layers_to_rebuild({"urllib3": "2.2.2"})
+    assert layers == {
+        "p3.12": {"requests": {"urllib3": "2.2.1"}, "boto3": {"urllib3": "1.26.18"}}
+    }
+    assert (
+        dependency_index.get_layers_to_rebuild(
+            {"urllib3": "2.2.2"}, python_versions=["p3.13"]
+        )
+        == {}
+    )
+    # Names are normalized on both sides, PyYAML is pinned as PyYAML
+    assert dependency_index.get_layers_to_rebuild({"pyyaml": "6.0.2"}) == {
+        "p3.12": {"pyyaml": {"pyyaml": "6.0.1"}}
+    }
+
+    # A build that moves urllib3 to 2.2.2 takes requests out of the result
+    writes = dependency_index.index_writes(
+        "requests",
+        "p3.12",
+        "requests==2.32.0\nurllib3==2.2.1",
+        "requests==2.32.0\nurllib3==2.2.2",
+    )
+    dependency_index.write_index(writes)
+    assert list(dependency_index.get_layers_to_rebuild({"urllib3": "2.2.2"})) == [
+        "p3.12"
+    ]
+    assert list(
+        dependency_index.get_layers_to_rebuild({"urllib3": "2.2.2"})["p3.12"]
+    ) == ["boto3"]
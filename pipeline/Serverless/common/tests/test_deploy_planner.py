@@ -0,0 +1,84 @@
+from moto import mock_aws
+
+from .. import deploy_planner
+from .table_helpers import TABLE_NAME, create_table, put_build
+
+
+def put_layer(client, package, python_version, region, requirements_hash, status):
+    client.put_item(
+        TableName=TABLE_NAME,
+        Item={
+            "pk": {"S": f"lyr#{region}:{package}:{python_version}"},
+            "sk": {"S": f"lyrVrsn#v{1 if status == 'deprecated' else 2}"},
+            "rgn": {"S": region},
+            "rqrmntsHsh": {"S": requirements_hash},
+            "dplySts": {"S": status},
+            "pckg#PyVrsn": {"S": f"{package}:{python_version}"},
+        },
+    )
+
+
+@mock_aws
+def test_plan_deploys(monkeypatch):
+    monkeypatch.setenv("AWS_DEFAULT_REGION", "us-east-1")
+    client = create_table()
+    regions = ["us-east-1", "eu-west-1"]
+
+    # Up to date everywhere, the deprecated layer is ignored
+    put_build(client, "boto3", "p3.12", rqrmntsHsh="a")
+    for region in regions:
+        put_layer(client, "boto3", "p3.12", region, "a", "latest")
+        put_layer(client, "boto3", "p3.12", region, "old", "deprecated")
+    # Outdated in one region, missing in the other, extras are stripped in layer items
+    put_build(client, "requests[security]", "p3.12", rqrmntsHsh="b")
+    put_layer(client, "requests", "p3.12", "us-east-1", "old", "latest")
+    # Same package on another python version doesn't count
+    put_layer(client, "requests", "p3.12-arm64", "eu-west-1", "b", "latest")
+
+    plan = deploy_planner.plan_deploys(
+        python_version="p3.12",
+        packages=["boto3", "requests[security]", "not-built"],
+        regions=regions,
+        table_name=TABLE_NAME,
+    )
+
+    assert plan == {
+        "requests[security]": {"requirements_hash": "b", "regions": regions},
+    }
+
+
+@mock_aws
+def test_layers_scanned_once_for_every_python_version(monkeypatch):
+    monkeypatch.setenv("AWS_DEFAULT_REGION", "us-east-1")
+    client = create_table()
+    put_build(client, "requests", "p3.12", rqrmntsHsh="a")
+    put_build(client, "requests", "p3.13", rqrmntsHsh="a")
+    put_layer(client, "requests", "p3.12", "us-east-1", "a", "latest")
+    put_layer(client, "requests", "p3.13", "us-east-1", "old", "latest")
+
+    layers = deploy_planner.get_latest_layers(table_name=TABLE_NAME, client=client)
+    assert layers == {
+        "p3.12": {"requests": {"us-east-1": "a"}},
+        "p3.13": {"requests": {"us-east-1": "old"}},
+    }
+
+    scans = []
+    monkeypatch.setattr(
+        deploy_planner, "get_latest_layers", lambda **kwargs: scans.append(kwargs)
+    )
+    plans = {
+        python_version: deploy_planner.plan_deploys(
+            python_version=python_version,
+            packages=["requests"],
+            regions=["us-east-1"],
+            table_name=TABLE_NAME,
+            client=client,
+            layers=layers,
+        )
+        for python_version in ("p3.12", "p3.13")
+    }
+    assert scans == []
+    assert plans == {
+        "p3.12": {},
+        "p3.13": {"requests": {"requirements_hash": "a", "regions": ["us-east-1"]}},
+    }
@@ -0,0 +1,111 @@
+import io
+import zipfile
+
+import boto3
+import pytest
+from moto import mock_aws
+
+from ..layer_archive import (
+    PreflightError,
+    merge_archives,
+    preflight,
+    read_central_directory,
+)
+
+
+class Unseekable(io.RawIOBase):
+    """
+    Forces zipfile to write data descriptors, like archives streamed to S3
+    """
+
+    def __init__(self, fp):
+        self.fp = fp
+
+    def writable(self):
+        return True
+
+    def write(self, b):
+        return self.fp.write(b)
+
+
+def make_archive(path, files, streamed=False):
+    with open(path, "wb") as fp:
+        target = Unseekable(fp) if streamed else fp
+        with zipfile.ZipFile(target, "w", zipfile.ZIP_DEFLATED) as archive:
+            for name, data in files.items():
+                archive.writestr(name, data)
+
+
+def test_merge_archives(tmp_path):
+    make_archive(
+        tmp_path / "pandas.zip",
+        {
+            "python/pandas/__init__.py": "import numpy\n" * 100,
+            "python/numpy/__init__.py": "version = '1'\n",
+            "python/six.py": "six\n",
+        },
+        streamed=True,
+    )
+    make_archive(
+        tmp_path / "scipy.zip",
+        {
+            "python/scipy/__init__.py": "import numpy\n",
+            "python/numpy/__init__.py": "version = '2'\n",
+            "python/six.py": "six\n",
+        },
+    )
+
+    report = merge_archives(
+        sources=[
+            ("pandas", tmp_path / "pandas.zip"),
+            ("scipy", tmp_path / "scipy.zip"),
+        ],
+        destination_path=tmp_path / "combined.zip",
+    )
+
+    assert report == {
+        "entries": 4,
+        "duplicates": 2,
+        "conflicts": {"python/numpy/__init__.py": ["pandas", "scipy"]},
+    }
+    with zipfile.ZipFile(tmp_path / "combined.zip") as combined:
+        assert combined.testzip() is None
+        assert combined.read("python/numpy/__init__.py") == b"version = '1'\n"
+        assert combined.read("python/pandas/__init__.py") == b"import numpy\n" * 100
+        info = combined.getinfo("python/pandas/__init__.py")
+        assert info.compress_type == zipfile.ZIP_DEFLATED
+        assert info.compress_size < info.file_size
+
+
+@mock_aws
+def test_preflight_reads_central_directory_only(tmp_path, monkeypatch):
+    monkeypatch.setenv("AWS_DEFAULT_REGION", "us-east-1")
+    s3 = boto3.client("s3")
+    s3.create_bucket(Bucket="bucket")
+    components = {
+        "pandas": {
+            "python/pandas/__init__.py": "x" * 3_000_000,
+            "python/numpy-1.26.0.dist-info/METADATA": "numpy",
+        },
+        "scipy": {
+            "python/scipy/__init__.py": "y" * 100,
+            "python/numpy-2.0.0.dist-info/METADATA": "numpy",
+        },
+    }
+    for name, files in components.items():
+        make_archive(tmp_path / f"{name}.zip", files)
+        s3.upload_file(str(tmp_path / f"{name}.zip"), "bucket", f"p3.12/{name}.zip")
+
+    entries = {
+        name: read_central_directory(s3, "bucket", f"p3.12/{name}.zip")
+        for name in components
+    }
+    assert [info.filename for info in entries["scipy"]] == list(components["scipy"])
+
+    with pytest.raises(PreflightError, match="numpy"):
+        preflight(entries)
+    with pytest.raises(PreflightError, match="'pandas': 3000005"):
+        preflight({"pandas": entries["pandas"]}, limit=1_000_000)
+
+    report = preflight({"pandas": entries["pandas"]})
+    assert report["unzipped_size"] == 3_000_005
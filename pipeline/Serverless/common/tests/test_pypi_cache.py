@@ -0,0 +1,50 @@
+import pytest
+
+from .. import pypi_cache
+
+
+@pytest.fixture(autouse=True)
+def cache_stats(monkeypatch):
+    monkeypatch.setattr(
+        pypi_cache, "cache_stats", {"hits": 0, "misses": 0, "bytes_saved": 0}
+    )
+
+
+def test_get_latest_stable_version():
+    releases = ["0.9", "1.10.0", "1.9.2", "2.0.0rc1", "1.10.0.post1", "1!0.1", "x"]
+    assert pypi_cache.get_latest_stable_version(releases) == "1!0.1"
+    assert pypi_cache.get_latest_stable_version(releases[:5]) == "1.10.0.post1"
+    assert pypi_cache.get_latest_stable_version(["2.0.0a1"]) == "0"
+
+
+def test_conditional_requests(pypi, table, monkeypatch):
+    # First check downloads the index and the release's license, the second is a 304 answered from the cache
+    assert pypi_cache.get_latest_release("boto3") == ("1.1.0", "MIT")
+    assert pypi_cache.get_latest_release("boto3") == ("1.1.0", "MIT")
+    assert [path for path, _ in pypi.requests] == [
+        "/simple/boto3/",
+        "/pypi/boto3/1.1.0/json",
+        "/simple/boto3/",
+    ]
+    assert pypi.requests[2][1] is not None
+    assert pypi_cache.cache_stats["hits"] == 1
+    assert pypi_cache.cache_stats["bytes_saved"] > 0
+
+    # A new release changes the ETag, the index is downloaded again
+    pypi.versions["boto3"].append("1.2.0")
+    assert pypi_cache.get_latest_release("boto3") == ("1.2.0", "MIT")
+    assert pypi.requests[-1][0] == "/pypi/boto3/1.2.0/json"
+    assert pypi_cache.cache_stats["misses"] == 2
+
+    # A pre-release changes the index but not the latest version, the cached license is reused
+    pypi.versions["boto3"].append("1.3.0rc1")
+    assert pypi_cache.get_latest_release("boto3") == ("1.2.0", "MIT")
+    assert pypi.requests[-1][0] == "/simple/boto3/"
+
+
+def test_html_simple_index(pypi, table, monkeypatch):
+    monkeypatch.setattr(pypi, "simple_json", False)
+    assert pypi_cache.get_latest_release("boto3") == ("1.1.0", "MIT")
+    assert pypi.requests[-1][0] == "/pypi/boto3/json"
+    assert pypi_cache.get_latest_release("boto3") == ("1.1.0", "MIT")
+    assert pypi_cache.cache_stats["hits"] == 1
@@ -0,0 +1,112 @@
+from types import SimpleNamespace
+
+import pytest
+from botocore.exceptions import ClientError, EndpointConnectionError
+
+from .. import rate_limiter
+from ..rate_limiter import RateLimiter
+
+
+class FakeLambdaClient:
+    """
+    Throttles the first `throttles` calls, then succeeds
+    """
+
+    def __init__(self, region, throttles, errors=()):
+        self.meta = SimpleNamespace(region_name=region)
+        self.throttles = throttles
+        self.errors = list(errors)
+        self.calls = 0
+
+    def delete_layer_version(self, **kwargs):
+        self.calls += 1
+        if self.calls <= self.throttles:
+            raise ClientError(
+                {"Error": {"Code": "TooManyRequestsException", "Message": "Rate"}},
+                "DeleteLayerVersion",
+            )
+        if self.errors:
+            raise self.errors.pop(0)
+        return kwargs
+
+
+def client_error(code, status):
+    return ClientError(
+        {
+            "Error": {"Code": code, "Message": code},
+            "ResponseMetadata": {"HTTPStatusCode": status},
+        },
+        "DeleteLayerVersion",
+    )
+
+
+def test_backs_off_on_throttle_and_recovers():
+    limiter = RateLimiter(rate=100, min_rate=1, max_rate=200, increase=10)
+    client = FakeLambdaClient(region="us-east-1", throttles=2)
+
+    response = limiter.call(client, "delete_layer_version", VersionNumber=1)
+
+    assert response == {"VersionNumber": 1}
+    stats = limiter.stats()["us-east-1"]
+    assert stats["throttles"] == 2
+    assert stats["calls"] == 3
+    # halved twice, then one additive increase
+    assert stats["rate"] == 35
+
+    for _ in range(20):
+        limiter.call(client, "delete_layer_version", VersionNumber=1)
+    assert limiter.stats()["us-east-1"]["rate"] == 200
+
+
+def test_regions_are_independent():
+    limiter = RateLimiter(rate=100, min_rate=1, max_rate=200)
+    limiter.call(FakeLambdaClient("eu-west-1", throttles=1), "delete_layer_version")
+    limiter.call(FakeLambdaClient("us-east-1", throttles=0), "delete_layer_version")
+
+    stats = limiter.stats()
+    assert stats["eu-west-1"]["throttles"] == 1
+    assert stats["us-east-1"]["throttles"] == 0
+
+
+def test_retries_transient_errors_without_slowing_down(monkeypatch):
+    monkeypatch.setattr(rate_limiter.time, "sleep", lambda delay: None)
+    limiter = RateLimiter(rate=100, min_rate=1, max_rate=200, increase=10)
+    client = FakeLambdaClient(
+        region="us-east-1",
+        throttles=0,
+        errors=[
+            client_error("ServiceException", 500),
+            client_error("BadGateway", 502),
+            EndpointConnectionError(endpoint_url="https://lambda.us-east-1"),
+        ],
+    )
+
+    assert limiter.call(client, "delete_layer_version", VersionNumber=1) == {
+        "VersionNumber": 1
+    }
+    assert client.calls == 4
+    stats = limiter.stats()["us-east-1"]
+    assert stats["throttles"] == 0
+    # Only successes move the rate
+    assert stats["rate"] == 110
+
+
+def test_client_errors_are_not_retried(monkeypatch):
+    monkeypatch.setattr(rate_limiter.time, "sleep", lambda delay: None)
+    limiter = RateLimiter(rate=100, min_rate=1, max_rate=200, max_attempts=3)
+
+    client = FakeLambdaClient(
+        "us-east-1",
+        throttles=0,
+        errors=[client_error("ResourceNotFoundException", 404)],
+    )
+    with pytest.raises(ClientError):
+        limiter.call(client, "delete_layer_version")
+    assert client.calls == 1
+
+    client = FakeLambdaClient(
+        "us-east-1", throttles=0, errors=[client_error("ServiceException", 500)] * 3
+    )
+    with pytest.raises(ClientError):
+        limiter.call(client, "delete_layer_version")
+    assert client.calls == 3
@@ -0,0 +1,68 @@
+import boto3
+import pytest
+from botocore.exceptions import ClientError
+from moto import mock_aws
+
+from .. import staging
+
+
+@pytest.fixture(autouse=True)
+def clear_checked_buckets(monkeypatch):
+    monkeypatch.setattr(staging, "_staging_buckets", {})
+    monkeypatch.setattr(staging, "_account_id", None)
+
+
+@mock_aws
+def test_stage_artifact(monkeypatch):
+    monkeypatch.setenv("AWS_DEFAULT_REGION", "us-east-1")
+    monkeypatch.setenv("STAGING_BUCKET_PREFIX", "kl-layers-stg")
+    s3 = boto3.client("s3", region_name="us-east-1")
+    s3.create_bucket(Bucket="kl-layers")
+    s3.put_object(Bucket="kl-layers", Key="p3.12/requests.zip", Body=b"zip")
+    # Terraform only created the us-east-1 staging bucket
+    s3.create_bucket(Bucket="kl-layers-stg-us-east-1")
+
+    assert staging.stage_artifact("kl-layers", "p3.12/requests.zip", "us-east-1") == {
+        "S3Bucket": "kl-layers-stg-us-east-1",
+        "S3Key": "p3.12/requests.zip",
+    }
+    staged = s3.get_object(Bucket="kl-layers-stg-us-east-1", Key="p3.12/requests.zip")
+    assert staged["Body"].read() == b"zip"
+
+    # Missing buckets are never created, the layer is published inline instead
+    assert (
+        staging.stage_artifact("kl-layers", "p3.12/requests.zip", "eu-west-1") is None
+    )
+    assert "kl-layers-stg-eu-west-1" not in [
+        bucket["Name"] for bucket in s3.list_buckets()["Buckets"]
+    ]
+
+    monkeypatch.delenv("STAGING_BUCKET_PREFIX")
+    assert (
+        staging.stage_artifact("kl-layers", "p3.12/requests.zip", "us-east-1") is None
+    )
+
+
+class ForeignBucket:
+    """
+    S3 client for a bucket name owned by another account
+    """
+
+    def __init__(self, code):
+        self.code = code
+        self.calls = 0
+
+    def head_bucket(self, **kwargs):
+        self.calls += 1
+        raise ClientError({"Error": {"Code": self.code, "Message": ""}}, "HeadBucket")
+
+
+def test_foreign_bucket_is_unusable():
+    foreign = ForeignBucket("403")
+    assert not staging.check_staging_bucket(foreign, "kl-layers-stg-x", "123456789012")
+    assert not staging.check_staging_bucket(foreign, "kl-layers-stg-x", "123456789012")
+    # Checked once per execution environment
+    assert foreign.calls == 1
+
+    with pytest.raises(ClientError):
+        staging.check_staging_bucket(ForeignBucket("500"), "kl-layers-stg-y", "1")
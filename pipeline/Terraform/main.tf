@@ -34,6 +34,118 @@ provider "aws" {
   alias   = "cloudfront"
 }
 
+# Staging bucket regions, one provider per region in config/regions.csv
+
+provider "aws" {
+  region = "us-east-1"
+  alias  = "us_east_1"
+}
+
+provider "aws" {
+  region = "us-east-2"
+  alias  = "us_east_2"
+}
+
+provider "aws" {
+  region = "us-west-1"
+  alias  = "us_west_1"
+}
+
+provider "aws" {
+  region = "us-west-2"
+  alias  = "us_west_2"
+}
+
+provider "aws" {
+  region = "ca-central-1"
+  alias  = "ca_central_1"
+}
+
+provider "aws" {
+  region = "eu-central-1"
+  alias  = "eu_central_1"
+}
+
+provider "aws" {
+  region = "eu-west-1"
+  alias  = "eu_west_1"
+}
+
+provider "aws" {
+  region = "eu-west-2"
+  alias  = "eu_west_2"
+}
+
+provider "aws" {
+  region = "eu-west-3"
+  alias  = "eu_west_3"
+}
+
+provider "aws" {
+  region = "eu-north-1"
+  alias  = "eu_north_1"
+}
+
+provider "aws" {
+  region = "eu-south-1"
+  alias  = "eu_south_1"
+}
+
+provider "aws" {
+  region = "ap-northeast-1"
+  alias  = "ap_northeast_1"
+}
+
+provider "aws" {
+  region = "ap-northeast-2"
+  alias  = "ap_northeast_2"
+}
+
+provider "aws" {
+  region = "ap-southeast-1"
+  alias  = "ap_southeast_1"
+}
+
+provider "aws" {
+  region = "ap-southeast-2"
+  alias  = "ap_southeast_2"
+}
+
+provider "aws" {
+  region = "ap-southeast-3"
+  alias  = "ap_southeast_3"
+}
+
+provider "aws" {
+  region = "ap-southeast-4"
+  alias  = "ap_southeast_4"
+}
+
+provider "aws" {
+  region = "ap-southeast-5"
+  alias  = "ap_southeast_5"
+}
+
+provider "aws" {
+  region = "ap-south-1"
+  alias  = "ap_south_1"
+}
+
+provider "aws" {
+  region = "sa-east-1"
+  alias  = "sa_east_1"
+}
+
+provider "aws" {
+  region = "ap-east-1"
+  alias  = "ap_east_1"
+}
+
+provider "aws" {
+  region = "af-south-1"
+  alias  = "af_south_1"
+}
+
 # Version 1 has been deleted
 module "dynamo_table_ver_2" {
   source             = "./dynamodb"
@@ -35,6 +35,17 @@ resource "aws_s3_bucket_lifecycle_configuration" "s3bucket_layers_bucket_config"
     }
     status = "Enabled"
   }
+  rule {
+    id = "wheel-cache-lifecycle"
+    filter {
+      prefix = "wheel_cache/"
+    }
+    # evicted wheels shouldn't linger as noncurrent versions, a hit only retags the current version
+    noncurrent_version_expiration {
+      noncurrent_days = 1
+    }
+    status = "Enabled"
+  }
 }
 
 resource "aws_ssm_parameter" "layers_bucket_name" {
@@ -53,6 +64,208 @@ resource "aws_ssm_parameter" "layers_bucket_arn" {
   overwrite   = true
 }
 
+
+## Staging buckets -- deploy and combine publish layers from a copy in the region
+## Names must match STAGING_BUCKET_PREFIX in Serverless/02_pipeline/pipeline.yml (<layers bucket>-stg-<region>)
+
+module "staging_bucket_us_east_1" {
+  source      = "./staging_bucket"
+  bucket_name = "${aws_s3_bucket.s3bucket_layers.bucket}-stg-us-east-1"
+
+  providers = {
+    aws = aws.us_east_1
+  }
+}
+
+module "staging_bucket_us_east_2" {
+  source      = "./staging_bucket"
+  bucket_name = "${aws_s3_bucket.s3bucket_layers.bucket}-stg-us-east-2"
+
+  providers = {
+    aws = aws.us_east_2
+  }
+}
+
+module "staging_bucket_us_west_1" {
+  source      = "./staging_bucket"
+  bucket_name = "${aws_s3_bucket.s3bucket_layers.bucket}-stg-us-west-1"
+
+  providers = {
+    aws = aws.us_west_1
+  }
+}
+
+module "staging_bucket_us_west_2" {
+  source      = "./staging_bucket"
+  bucket_name = "${aws_s3_bucket.s3bucket_layers.bucket}-stg-us-west-2"
+
+  providers = {
+    aws = aws.us_west_2
+  }
+}
+
+module "staging_bucket_ca_central_1" {
+  source      = "./staging_bucket"
+  bucket_name = "${aws_s3_bucket.s3bucket_layers.bucket}-stg-ca-central-1"
+
+  providers = {
+    aws = aws.ca_central_1
+  }
+}
+
+module "staging_bucket_eu_central_1" {
+  source      = "./staging_bucket"
+  bucket_name = "${aws_s3_bucket.s3bucket_layers.bucket}-stg-eu-central-1"
+
+  providers = {
+    aws = aws.eu_central_1
+  }
+}
+
+module "staging_bucket_eu_west_1" {
+  source      = "./staging_bucket"
+  bucket_name = "${aws_s3_bucket.s3bucket_layers.bucket}-stg-eu-west-1"
+
+  providers = {
+    aws = aws.eu_west_1
+  }
+}
+
+module "staging_bucket_eu_west_2" {
+  source      = "./staging_bucket"
+  bucket_name = "${aws_s3_bucket.s3bucket_layers.bucket}-stg-eu-west-2"
+
+  providers = {
+    aws = aws.eu_west_2
+  }
+}
+
+module "staging_bucket_eu_west_3" {
+  source      = "./staging_bucket"
+  bucket_name = "${aws_s3_bucket.s3bucket_layers.bucket}-stg-eu-west-3"
+
+  providers = {
+    aws = aws.eu_west_3
+  }
+}
+
+module "staging_bucket_eu_north_1" {
+  source      = "./staging_bucket"
+  bucket_name = "${aws_s3_bucket.s3bucket_layers.bucket}-stg-eu-north-1"
+
+  providers = {
+    aws = aws.eu_north_1
+  }
+}
+
+module "staging_bucket_eu_south_1" {
+  source      = "./staging_bucket"
+  bucket_name = "${aws_s3_bucket.s3bucket_layers.bucket}-stg-eu-south-1"
+
+  providers = {
+    aws = aws.eu_south_1
+  }
+}
+
+module "staging_bucket_ap_northeast_1" {
+  source      = "./staging_bucket"
+  bucket_name = "${aws_s3_bucket.s3bucket_layers.bucket}-stg-ap-northeast-1"
+
+  providers = {
+    aws = aws.ap_northeast_1
+  }
+}
+
+module "staging_bucket_ap_northeast_2" {
+  source      = "./staging_bucket"
+  bucket_name = "${aws_s3_bucket.s3bucket_layers.bucket}-stg-ap-northeast-2"
+
+  providers = {
+    aws = aws.ap_northeast_2
+  }
+}
+
+module "staging_bucket_ap_southeast_1" {
+  source      = "./staging_bucket"
+  bucket_name = "${aws_s3_bucket.s3bucket_layers.bucket}-stg-ap-southeast-1"
+
+  providers = {
+    aws = aws.ap_southeast_1
+  }
+}
+
+module "staging_bucket_ap_southeast_2" {
+  source      = "./staging_bucket"
+  bucket_name = "${aws_s3_bucket.s3bucket_layers.bucket}-stg-ap-southeast-2"
+
+  providers = {
+    aws = aws.ap_southeast_2
+  }
+}
+
+module "staging_bucket_ap_southeast_3" {
+  source      = "./staging_bucket"
+  bucket_name = "${aws_s3_bucket.s3bucket_layers.bucket}-stg-ap-southeast-3"
+
+  providers = {
+    aws = aws.ap_southeast_3
+  }
+}
+
+module "staging_bucket_ap_southeast_4" {
+  source      = "./staging_bucket"
+  bucket_name = "${aws_s3_bucket.s3bucket_layers.bucket}-stg-ap-southeast-4"
+
+  providers = {
+    aws = aws.ap_southeast_4
+  }
+}
+
+module "staging_bucket_ap_southeast_5" {
+  source      = "./staging_bucket"
+  bucket_name = "${aws_s3_bucket.s3bucket_layers.bucket}-stg-ap-southeast-5"
+
+  providers = {
+    aws = aws.ap_southeast_5
+  }
+}
+
+module "staging_bucket_ap_south_1" {
+  source      = "./staging_bucket"
+  bucket_name = "${aws_s3_bucket.s3bucket_layers.bucket}-stg-ap-south-1"
+
+  providers = {
+    aws = aws.ap_south_1
+  }
+}
+
+module "staging_bucket_sa_east_1" {
+  source      = "./staging_bucket"
+  bucket_name = "${aws_s3_bucket.s3bucket_layers.bucket}-stg-sa-east-1"
+
+  providers = {
+    aws = aws.sa_east_1
+  }
+}
+
+module "staging_bucket_ap_east_1" {
+  source      = "./staging_bucket"
+  bucket_name = "${aws_s3_bucket.s3bucket_layers.bucket}-stg-ap-east-1"
+
+  providers = {
+    aws = aws.ap_east_1
+  }
+}
+
+module "staging_bucket_af_south_1" {
+  source      = "./staging_bucket"
+  bucket_name = "${aws_s3_bucket.s3bucket_layers.bucket}-stg-af-south-1"
+
+  providers = {
+    aws = aws.af_south_1
+  }
+}
+
 ## Config Bucket -- to be uploaded from github
 
 resource "aws_s3_bucket" "s3bucket_config" {
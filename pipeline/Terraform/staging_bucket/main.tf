@@ -0,0 +1,27 @@
+# Regional copy of the layers bucket, publish_layer_version reads from a bucket in its own region
+resource "aws_s3_bucket" "staging" {
+  bucket        = var.bucket_name
+  force_destroy = true
+}
+
+resource "aws_s3_bucket_public_access_block" "staging" {
+  bucket = aws_s3_bucket.staging.id
+
+  block_public_acls       = true
+  block_public_policy     = true
+  ignore_public_acls      = true
+  restrict_public_buckets = true
+}
+
+# Staged copies only need to outlive the publish, the layers bucket keeps the original
+resource "aws_s3_bucket_lifecycle_configuration" "staging" {
+  bucket = aws_s3_bucket.staging.id
+  rule {
+    id = "expire-staged-layers"
+    filter {}
+    expiration {
+      days = var.expiry_days
+    }
+    status = "Enabled"
+  }
+}
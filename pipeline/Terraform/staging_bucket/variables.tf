@@ -0,0 +1,2 @@
+variable "bucket_name" {}
+variable "expiry_days" { default = 1 }
@@ -0,0 +1,112 @@
+"""
+Counts DynamoDB round trips to record a deploy, per-region (record_layer) vs batched (record_layers)
+
+Runs against moto's in-memory DynamoDB, no AWS account needed.
+
+Usage:
+    python pipeline/benchmarks/deploy_bookkeeping.py --regions 22
+"""
+
+import os
+import sys
+import time
+import argparse
+from collections import Counter
+from datetime import datetime
+from unittest import mock
+
+import boto3
+import botocore.client
+from moto import mock_aws
+
+sys.path.insert(
+    0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "Serverless")
+)
+sys.path.insert(
+    0,
+    os.path.join(
+        os.path.dirname(os.path.abspath(__file__)), "..", "Serverless", "02_pipeline"
+    ),
+)
+os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+os.environ.setdefault("DB_NAME", "benchmark")
+os.environ.setdefault("EXPIRY_DAYS", "365")
+os.environ.setdefault("POWERTOOLS_LOG_LEVEL", "WARNING")
+import deploy  # noqa: E402
+from common.tests.table_helpers import create_table  # noqa: E402
+
+PACKAGE_ARGS = {
+    "package": "requests",
+    "version": "2.31.0",
+    "python_version": "p3.12",
+    "requirements_txt": "requests==2.31.0",
+    "requirements_hash": "benchmark",
+}
+
+
+def published_layers(regions: list) -> list:
+    return [
+        {
+            "region": region,
+            "arn": f"arn:aws:lambda:{region}:123456789012:layer:Klayers-p312-requests:{int(time.time())}",
+            "crtdDt": datetime.utcnow().isoformat(),
+        }
+        for region in regions
+    ]
+
+
+def count_calls(function, **kwargs) -> Counter:
+    calls = Counter()
+    make_api_call = botocore.client.BaseClient._make_api_call
+
+    def counting_api_call(self, operation_name, api_params):
+        calls[operation_name] += 1
+        return make_api_call(self, operation_name, api_params)
+
+    with mock.patch.object(
+        botocore.client.BaseClient, "_make_api_call", counting_api_call
+    ):
+        function(**kwargs)
+    return calls
+
+
+def serial(regions: list):
+    client = boto3.client("dynamodb")
+    for layer in published_layers(regions):
+        deploy.record_layer(dynamo_client=client, layer=layer, **PACKAGE_ARGS)
+
+
+def batched(regions: list):
+    checkpoint = deploy.DeployCheckpoint(
+        package=PACKAGE_ARGS["package"],
+        python_version=PACKAGE_ARGS["python_version"],
+        requirements_hash=PACKAGE_ARGS["requirements_hash"],
+        execution_id=None,
+    )
+    deploy.record_layers(
+        published=published_layers(regions), checkpoint=checkpoint, **PACKAGE_ARGS
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--regions", type=int, default=22)
+    args = parser.parse_args()
+    regions = [f"region-{i}" for i in range(args.regions)]
+
+    for name, function in (("per-region", serial), ("batched", batched)):
+        with mock_aws():
+            create_table(table_name=os.environ["DB_NAME"])
+            # First deploy creates v1, the second creates v2 and deprecates v1
+            first = count_calls(function, regions=regions)
+            second = count_calls(function, regions=regions)
+        print(
+            f"{name:>10}: first deploy {sum(first.values()):>3} round trips {dict(first)}"
+        )
+        print(
+            f"{'':>10}  redeploy     {sum(second.values()):>3} round trips {dict(second)}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+"""
+Compares build.freeze_requirements (in-process dist-info scan) with the `pip freeze --path` subprocess it replaced
+
+Usage:
+    python pipeline/benchmarks/freeze_requirements.py --package pandas
+    python pipeline/benchmarks/freeze_requirements.py --path /tmp/python --repeat 20
+"""
+
+import os
+import sys
+import time
+import argparse
+import subprocess
+import statistics
+
+sys.path.insert(
+    0,
+    os.path.join(
+        os.path.dirname(os.path.abspath(__file__)),
+        "..",
+        "container_images",
+        "build_images",
+        "common",
+    ),
+)
+import build  # noqa: E402
+
+
+def pip_freeze(path: str) -> str:
+    pip_freeze = subprocess.run(
+        [sys.executable, "-m", "pip", "freeze", "--path", path], capture_output=True
+    )
+    return pip_freeze.stdout.decode("utf-8").strip()
+
+
+def scan(path: str) -> str:
+    return build.format_requirements(
+        (distribution["name"], distribution["version"])
+        for distribution in build.scan_distributions(path)
+    )
+
+
+def time_it(function, path: str, repeat: int) -> list:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function(path)
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--package", default="pandas", help="package to install")
+    parser.add_argument("--path", default="/tmp/benchmark/python")
+    parser.add_argument("--repeat", type=int, default=10)
+    args = parser.parse_args()
+
+    if not os.path.isdir(args.path):
+        subprocess.run(
+            [sys.executable, "-m", "pip", "install", args.package, "-t", args.path],
+            check=True,
+            capture_output=True,
+        )
+
+    assert pip_freeze(args.path) == scan(args.path), "outputs differ"
+    distributions = build.scan_distributions(args.path)
+    print(
+        f"{len(distributions)} distributions, "
+        f"{sum(distribution['files'] for distribution in distributions)} files, "
+        f"{sum(distribution['size'] for distribution in distributions)} bytes in RECORD"
+    )
+
+    for name, function in (("pip freeze", pip_freeze), ("dist-info scan", scan)):
+        timings = time_it(function, args.path, args.repeat)
+        print(
+            f"{name:>15}: median {statistics.median(timings) * 1000:8.2f} ms, "
+            f"min {min(timings) * 1000:8.2f} ms"
+        )
+
+
+if __name__ == "__main__":
+    main()
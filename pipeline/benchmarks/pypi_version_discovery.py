@@ -0,0 +1,105 @@
+"""
+Compares version discovery from the legacy JSON API (parse every release key) against the JSON simple index
+(single pass over the versions list), in bytes fetched and parse time, for packages of real-world sizes
+
+Needs network access to the index. If the index doesn't serve the JSON simple API, parse times of the single
+pass are measured over the legacy document's release keys instead.
+
+Usage:
+    python pipeline/benchmarks/pypi_version_discovery.py --packages six requests numpy boto3
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+
+import requests
+from packaging.version import parse
+
+sys.path.insert(
+    0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "Serverless")
+)
+os.environ.setdefault("POWERTOOLS_LOG_LEVEL", "WARNING")
+from common import pypi_cache  # noqa: E402
+
+
+def legacy_latest(body: bytes) -> str:
+    """
+    What check.py used to do: load the whole document and parse every release
+    """
+    version = parse("0")
+    for release in json.loads(body).get("releases", []):
+        ver = parse(release)
+        if not ver.is_prerelease:
+            version = max(version, ver)
+    return str(version)
+
+
+def simple_latest(body: bytes) -> str:
+    return pypi_cache.get_latest_stable_version(json.loads(body)["versions"])
+
+
+def best_of(function, body: bytes, repeat: int) -> tuple:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function(body)
+        timings.append(time.perf_counter() - start)
+    return result, min(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--packages", nargs="+", default=["six", "requests", "numpy", "boto3"]
+    )
+    parser.add_argument("--pypi-url", default="https://pypi.org")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    session = requests.Session()
+    print(
+        f"{'package':<12}{'legacy kB':>11}{'simple kB':>11}{'license kB':>12}"
+        f"{'legacy ms':>11}{'simple ms':>11}  latest"
+    )
+    for package in args.packages:
+        legacy = session.get(f"{args.pypi_url}/pypi/{package}/json")
+        simple = session.get(
+            f"{args.pypi_url}/simple/{pypi_cache.normalize(package)}/",
+            headers={"Accept": pypi_cache.SIMPLE_JSON},
+        )
+        legacy_version, legacy_time = best_of(
+            legacy_latest, legacy.content, args.repeat
+        )
+
+        if simple.headers.get("Content-Type", "").startswith(pypi_cache.SIMPLE_JSON):
+            simple_kb = f"{len(simple.content) / 1024:.0f}"
+            simple_version, simple_time = best_of(
+                simple_latest, simple.content, args.repeat
+            )
+        else:
+            # Index only serves HTML, time the single pass over the same release keys
+            simple_kb = "html"
+            releases = json.dumps(
+                {"versions": list(json.loads(legacy.content)["releases"])}
+            ).encode("utf-8")
+            simple_version, simple_time = best_of(simple_latest, releases, args.repeat)
+
+        license_document = session.get(
+            f"{args.pypi_url}/pypi/{package}/{simple_version}/json"
+        )
+        license_kb = "n/a"
+        if license_document.status_code == requests.codes.ok:
+            license_kb = f"{len(license_document.content) / 1024:.0f}"
+        assert legacy_version == simple_version, (legacy_version, simple_version)
+        print(
+            f"{package:<12}{len(legacy.content) / 1024:>11.0f}{simple_kb:>11}"
+            f"{license_kb:>12}"
+            f"{legacy_time * 1000:>11.1f}{simple_time * 1000:>11.1f}  {simple_version}"
+        )
+
+
+if __name__ == "__main__":
+    main()
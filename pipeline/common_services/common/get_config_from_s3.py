@@ -4,7 +4,7 @@ import csv
 import boto3
 
 
-def download_packages_from_s3(python_version: str) -> list():
+def download_package_lines_from_s3(python_version: str) -> list():
     s3 = boto3.client("s3")
     config_file_name = "config.json"
     s3.download_file(
@@ -22,11 +22,39 @@ def download_packages_from_s3(python_version: str) -> list():
     )
     with open(f"/tmp/{python_package_file_name}", "r") as python_package_file:
         csv_reader = csv.DictReader(python_package_file)
-        packages_in_csv = [line["Package_Name"] for line in csv_reader]
+        packages_in_csv = [line for line in csv_reader]
 
     return packages_in_csv
 
 
+def download_packages_from_s3(python_version: str) -> list():
+    return [
+        line["Package_Name"] for line in download_package_lines_from_s3(python_version)
+    ]
+
+
+def download_bytecode_packages_from_s3(python_version: str) -> list():
+    """
+    Returns packages whose optional Compile_Bytecode column is set, these layers ship precompiled .pyc files
+    """
+    return [
+        line["Package_Name"]
+        for line in download_package_lines_from_s3(python_version)
+        if (line.get("Compile_Bytecode") or "").strip().lower() in ("true", "yes", "1")
+    ]
+
+
+def download_slim_packages_from_s3(python_version: str) -> list():
+    """
+    Returns packages whose optional Slim column is set, these layers are pruned of tests, docs, stubs and debug symbols
+    """
+    return [
+        line["Package_Name"]
+        for line in download_package_lines_from_s3(python_version)
+        if (line.get("Slim") or "").strip().lower() in ("true", "yes", "1")
+    ]
+
+
 def download_regions_from_s3() -> list():
     s3 = boto3.client("s3")
     region_file_name = "regions.csv"
@@ -2,6 +2,8 @@ import json
 from aws_lambda_powertools.logging import Logger
 from common.get_config_from_s3 import (
     download_packages_from_s3,
+    download_bytecode_packages_from_s3,
+    download_slim_packages_from_s3,
     download_regions_from_s3,
 )
 
@@ -15,7 +17,7 @@ def main(event, context):
 
     Args:
         python_version: Python version to get config items for
-        config_type: The type of configuration required (e.g. pckgs, rgns)
+        config_type: The type of configuration required (e.g. pckgs, pycPckgs, slmPckgs, rgns)
     Return:
         config_items: List of config items
     """
@@ -25,6 +27,10 @@ def main(event, context):
 
     if config_type == "pckgs":
         config_items = download_packages_from_s3(python_version=python_version)
+    elif config_type == "pycPckgs":
+        config_items = download_bytecode_packages_from_s3(python_version=python_version)
+    elif config_type == "slmPckgs":
+        config_items = download_slim_packages_from_s3(python_version=python_version)
     elif config_type == "rgns":
         config_items = download_regions_from_s3()
     else:
@@ -4,6 +4,8 @@ import json
 from aws_lambda_powertools.logging import Logger
 from common.get_config_from_s3 import (
     download_packages_from_s3,
+    download_bytecode_packages_from_s3,
+    download_slim_packages_from_s3,
     download_regions_from_s3,
     download_python_versions_from_s3,
 )
@@ -13,7 +15,7 @@ dynamodb = boto3.resource("dynamodb")
 
 """
 Loads configuration from S3 into DynamoDB
-Includes python_versions, packages, regions
+Includes python_versions, packages, bytecode packages, slim packages, regions
 Packages and region are python_version specific (each python_version has its own regions/packages)
 """
 
@@ -61,6 +63,40 @@ def main(event, context):
             }
         )
 
+        # Load packages that ship precompiled bytecode
+        bytecode_packages = download_bytecode_packages_from_s3(
+            python_version=python_version
+        )
+        response = load_config(
+            python_version=python_version,
+            config_type="pycPckgs",
+            config_items=bytecode_packages,
+        )
+        logger.info(
+            {
+                "message": "Loaded bytecode packages",
+                "python_version": python_version,
+                "packages": bytecode_packages,
+                "response": response,
+            }
+        )
+
+        # Load packages whose layers are slimmed
+        slim_packages = download_slim_packages_from_s3(python_version=python_version)
+        response = load_config(
+            python_version=python_version,
+            config_type="slmPckgs",
+            config_items=slim_packages,
+        )
+        logger.info(
+            {
+                "message": "Loaded slim packages",
+                "python_version": python_version,
+                "packages": slim_packages,
+                "response": response,
+            }
+        )
+
         # Load regions
         response = load_config(
             python_version=python_version, config_type="rgns", config_items=regions
@@ -1,7 +1,15 @@
 import os
 import sys
+import csv
+import json
 import shutil
+import stat
+import struct
 import hashlib
+import time
+import random
+from zipfile import ZipFile, ZipInfo, ZIP_DEFLATED
+from fnmatch import fnmatch
 from datetime import datetime
 
 import boto3
@@ -21,106 +29,202 @@ def get_pk_sk_latest_build(package: str, python_version: str):
     return pk, sk
 
 
+# Errors where another writer or throttling got in the way, put_requirements_hash retries these
+RETRYABLE_ERROR_CODES = (
+    "TransactionConflictException",
+    "ProvisionedThroughputExceededException",
+    "ThrottlingException",
+    "RequestLimitExceeded",
+)
+
+
+class BuildRecordError(Exception):
+    """
+    The build couldn't be recorded in DynamoDB
+    """
+
+
+def retry_write(write, description: str, max_attempts: int, already_written=None):
+    """
+    Calls write() until it succeeds, retrying conflicts and throttling with jittered backoff
+    Args:
+      write: Function making a single DynamoDB write, its return value is passed back
+      description: What is being written, for logs and errors
+      max_attempts: Attempts before giving up
+      already_written: Error code that means an earlier attempt landed after all (e.g. a failed condition)
+    returns:
+      result: Return value of write(), None if an earlier attempt had already landed
+    """
+    for attempt in range(1, max_attempts + 1):
+        try:
+            return write()
+        except ClientError as e:
+            error = {
+                "error_code": e.response["Error"]["Code"],
+                "error_message": e.response["Error"]["Message"],
+                "write": description,
+                "attempt": attempt,
+            }
+            if attempt > 1 and e.response["Error"]["Code"] == already_written:
+                logger.info({**error, "message": "Earlier attempt already written"})
+                return None
+            if (
+                e.response["Error"]["Code"] in RETRYABLE_ERROR_CODES
+                and attempt < max_attempts
+            ):
+                logger.warning({**error, "message": "Retrying build version write"})
+                time.sleep(random.uniform(0, 0.1 * 2**attempt))
+                continue
+            logger.error({**error, "message": "Failed to write build version"})
+            raise BuildRecordError(f"Failed to write {description}") from e
+
+
+def rollback_latest_build(
+    client,
+    table_name: str,
+    key: dict,
+    previous: dict,
+    new_version: int,
+    max_attempts: int,
+):
+    """
+    Restores the latest build record replaced by a build whose bld#v put failed
+    Nothing is restored if a later build has replaced it since, the latest record is that build's
+    Args:
+      key: pk and sk of the latest build record
+      previous: Attributes of the latest build record before the failed build, empty if there was none
+      new_version: Build version allocated to the failed build
+      max_attempts: Attempts before giving up on conflicts and throttling
+    """
+    condition = {
+        "ConditionExpression": "bltVrsn = :bltVrsn",
+        "ExpressionAttributeValues": {":bltVrsn": {"N": str(new_version)}},
+    }
+    try:
+        retry_write(
+            lambda: (
+                client.put_item(TableName=table_name, Item=previous, **condition)
+                if previous
+                else client.delete_item(TableName=table_name, Key=key, **condition)
+            ),
+            description=f"rollback of build version {new_version}",
+            max_attempts=max_attempts,
+        )
+    except BuildRecordError as e:
+        if e.__cause__.response["Error"]["Code"] != "ConditionalCheckFailedException":
+            raise
+        logger.info(
+            {
+                "message": "Later build already recorded as the latest, nothing to roll back",
+                "bltVrsn": new_version,
+            }
+        )
+
+
 def put_requirements_hash(
     python_version: str,
     package: str,
     version: str,
     requirements_txt: str,
     requirements_hash: str,
+    archive_hash: str,
+    build_attributes: dict = None,
+    max_attempts: int = 5,
 ):
     """
+    Allocates the next build version and records this build as the latest (bldVrsn0#) and as bld#v<version>
+    Each write is retried on its own, a retried bld#v put reuses the version already allocated
+    If the bld#v put fails, the latest record is rolled back so it never points at a missing build
     Args:
       package: Package name
       python_version: Version of python "p<major>.<minor>" (e.g. p3.8, p3.9, p3.10)
       version: Package version
       requirements_hash: SHA256 hash of the requirements.txt file
       requirements_txt: requirements txt of the entire build
+      archive_hash: SHA256 hash of the layer zip file
+      build_attributes: Additional DynamoDB attributes recorded on the bld#v item (e.g. sizes)
+      max_attempts: Attempts of each write before giving up on conflicts and throttling
     returns:
-      None
+      new_version: Build version allocated to this build
+    raises:
+      BuildRecordError: if either write fails
     """
     client = boto3.client("dynamodb")
     table_name = os.environ["DB_NAME"]
 
     pk, sk = get_pk_sk_latest_build(package, python_version)
-
-    # Get latest build version for package
     build_version_prefix = "bld#v"
-    response = client.get_item(
-        TableName=table_name,
-        Key={"pk": pk, "sk": sk},
-        ProjectionExpression="bltVrsn",
+    created_date = datetime.utcnow().isoformat()
+
+    # Single atomic round-trip: increments bltVrsn and writes this build as the latest
+    # Concurrent builds each get their own version, the highest version's attributes are kept last
+    response = retry_write(
+        lambda: client.update_item(
+            TableName=table_name,
+            Key={"pk": pk, "sk": sk},
+            UpdateExpression="set "
+            "rqrmntsTxt = :rqrmntsTxt, "
+            "pckgVrsn = :pckgVrsn, "
+            "rqrmntsHsh = :rqrmntsHsh,"
+            "zpHsh = :zpHsh,"
+            "crtdDt = :crtdDt,"
+            "pyVrsn = :pyVrsn "
+            "add bltVrsn :one",
+            ExpressionAttributeValues={
+                ":rqrmntsTxt": {"S": requirements_txt},
+                ":pckgVrsn": {"S": str(version)},
+                ":rqrmntsHsh": {"S": requirements_hash},
+                ":zpHsh": {"S": archive_hash},
+                ":crtdDt": {"S": created_date},
+                ":pyVrsn": {"S": python_version},
+                ":one": {"N": "1"},
+            },
+            ReturnValues="ALL_OLD",
+        ),
+        description=f"latest build of {package}",
+        max_attempts=max_attempts,
     )
-    try:
-        latest_version = int(response["Item"]["bltVrsn"]["N"])
-        new_version = latest_version + 1
-    except KeyError:
-        # Version wasn't deployed before, start with v1
-        new_version = 1
+    # The increment is atomic, the version before it is ours minus one
+    previous = response.get("Attributes", {})
+    new_version = int(previous.get("bltVrsn", {"N": "0"})["N"]) + 1
 
-    created_date = datetime.utcnow().isoformat()
     Item = {
         "pk": {"S": f"{build_version_prefix}{new_version}:{python_version}"},
         "sk": sk,
         "pckgVrsn": {"S": str(version)},
         "rqrmntsTxt": {"S": requirements_txt},
         "rqrmntsHsh": {"S": requirements_hash},
+        "zpHsh": {"S": archive_hash},
         "bltVrsn": {"N": str(new_version)},
         "crtdDt": {"S": created_date},
         "pckg": {"S": package},
         "pyVrsn": {"S": python_version},
+        **(build_attributes or {}),
     }
-
-    # Insert new record
+    # The version is ours alone, a failed condition on a retry means an earlier attempt landed
     try:
-        response = client.transact_write_items(
-            TransactItems=[
-                {
-                    "Update": {
-                        "TableName": table_name,
-                        "Key": {
-                            "pk": pk,
-                            "sk": sk,
-                        },
-                        "UpdateExpression": "set "
-                        "rqrmntsTxt = :rqrmntsTxt, "
-                        "pckgVrsn = :pckgVrsn, "
-                        "rqrmntsHsh = :rqrmntsHsh,"
-                        "bltVrsn = :bltVrsn,"
-                        "crtdDt = :crtdDt,"
-                        "pyVrsn = :pyVrsn",
-                        "ExpressionAttributeValues": {
-                            ":rqrmntsTxt": {"S": requirements_txt},
-                            ":pckgVrsn": {"S": str(version)},
-                            ":rqrmntsHsh": {"S": requirements_hash},
-                            ":bltVrsn": {"N": str(new_version)},
-                            ":crtdDt": {"S": created_date},
-                            ":pyVrsn": {"S": python_version},
-                        },
-                        "ConditionExpression": "bltVrsn <> :bltVrsn",
-                    }
-                },
-                {
-                    "Put": {
-                        "TableName": table_name,
-                        "Item": Item,
-                    }
-                },
-            ]
+        retry_write(
+            lambda: client.put_item(
+                TableName=table_name,
+                Item=Item,
+                ConditionExpression="attribute_not_exists(pk)",
+            ),
+            description=f"{build_version_prefix}{new_version} of {package}",
+            max_attempts=max_attempts,
+            already_written="ConditionalCheckFailedException",
         )
-        logger.info({"message": "Successfully written", "item": Item})
-        logger.debug(f"DynamoDB response: {response}")
-    except ClientError as e:
-        logger.error(
-            {
-                "error_code": e.response["Error"]["Code"],
-                "error_message": e.response["Error"]["Message"],
-                "item": Item,
-                "message": "Failed to Update record for Build Version",
-            }
+    except BuildRecordError:
+        rollback_latest_build(
+            client=client,
+            table_name=table_name,
+            key={"pk": pk, "sk": sk},
+            previous=previous,
+            new_version=new_version,
+            max_attempts=max_attempts,
         )
-        exit(1)
-
-    return None
+        raise
+    logger.info({"message": "Successfully written", "item": Item})
+    return new_version
 
 
 def check_requirement_hash(package: str, python_version: str, requirements_hash):
@@ -153,82 +257,473 @@ def check_requirement_hash(package: str, python_version: str, requirements_hash)
     return hash_match
 
 
-def freeze_requirements(package, path):
+def get_archive_hash(package: str, python_version: str):
     """
-    Walks through path, looking for *.dist-info folders. Parses out the package name and versions
-    returns: package name and version in requirements.txt format as a string
+    Args:
+      python_version: Version of python (e.g. p3.8, p3.9, p3.10)
+      package: Package name
+    returns:
+      archive_hash: SHA256 hash of the last uploaded layer zip file, None if not recorded
     """
-    import subprocess
 
-    logger.info("Getting requirements.txt file")
-    os.environ["PYTHONPATH"] = "/opt/python"
-    pip_install = subprocess.run(
-        ["pip", "freeze", "--path", path], shell=False, capture_output=True
+    client = boto3.client("dynamodb")
+    table_name = os.environ["DB_NAME"]
+    pk, sk = get_pk_sk_latest_build(package, python_version)
+
+    response = client.get_item(
+        TableName=table_name,
+        Key={"pk": pk, "sk": sk},
+        ProjectionExpression="zpHsh",
     )
-    requirements_txt = pip_install.stdout.decode("utf-8").strip()
-    logger.info(f"Requirements txt : \n{requirements_txt}")
-    requirements_hash = hashlib.sha256(requirements_txt.encode("utf-8")).hexdigest()
 
+    return response.get("Item", {}).get("zpHsh", {}).get("S")
+
+
+def put_checked_date(package: str, python_version: str):
+    """
+    Records that the latest build was checked and is still current, check uses it to space out rebuilds
+    Args:
+      python_version: Version of python (e.g. p3.8, p3.9, p3.10)
+      package: Package name
+    """
+
+    client = boto3.client("dynamodb")
+    table_name = os.environ["DB_NAME"]
+    pk, sk = get_pk_sk_latest_build(package, python_version)
+
+    try:
+        client.update_item(
+            TableName=table_name,
+            Key={"pk": pk, "sk": sk},
+            UpdateExpression="set chckdDt = :chckdDt",
+            ConditionExpression="attribute_exists(pk)",
+            ExpressionAttributeValues={
+                ":chckdDt": {"S": datetime.utcnow().isoformat()}
+            },
+        )
+    except ClientError as e:
+        # Only bookkeeping, a failure means the next check rebuilds a little early
+        logger.warning(
+            {
+                "message": "Unable to record checked date",
+                "error_code": e.response["Error"]["Code"],
+            }
+        )
+
+
+# pip freeze hides these from its output, on python 3.12+ only pip itself is hidden
+if sys.version_info >= (3, 12):
+    FREEZE_EXCLUDED_PACKAGES = {"pip"}
+else:
+    FREEZE_EXCLUDED_PACKAGES = {"pip", "setuptools", "wheel", "distribute"}
+
+
+def format_requirements(distributions) -> str:
+    """
+    Args:
+      distributions: Iterable of (name, version) tuples
+    returns:
+      requirements_txt: name==version lines, sorted and filtered the same way `pip freeze` does
+    """
+    lines = [
+        f"{name}=={version}"
+        for name, version in sorted(distributions, key=lambda dist: dist[0].lower())
+        if name.lower() not in FREEZE_EXCLUDED_PACKAGES
+    ]
+    return "\n".join(lines)
+
+
+def get_build_options(event: dict) -> list:
+    """
+    Args:
+      event: Build event
+    returns:
+      build_options: Sorted names of the options that change the layer's contents, empty for a default build
+    """
+    options = []
+    if event.get("compile_bytecode", False):
+        options.append("compile_bytecode")
+    if event.get("slim") or os.environ.get("SLIM_LAYERS", "false").lower() == "true":
+        options.append("slim")
+    return sorted(options)
+
+
+def get_requirements_hash(requirements_txt: str, build_options: list = ()) -> str:
+    """
+    Build options are hashed with the requirements, turning one on or off rebuilds (and redeploys) the layer.
+    Default builds hash requirements_txt alone, so their hashes match the ones already in the table.
+    """
+    hashed = requirements_txt + "".join(f"\n# {option}" for option in build_options)
+    return hashlib.sha256(hashed.encode("utf-8")).hexdigest()
+
+
+def get_package_version(package: str, requirements_txt: str):
+    """
+    Args:
+      package: Package name, optionally with extras (e.g. pandas, moto[s3])
+      requirements_txt: requirements txt of the entire build
+    returns:
+      version: Version of package in requirements_txt, None if not present
+    """
     # we need to check because some packages have optional dependencies
     # https://packaging.python.org/en/latest/specifications/dependency-specifiers/#dependency-specifiers
-    package_name=package.split("[")[0].lower()
+    package_name = package.split("[")[0].lower()
 
-    version = None
     for line in requirements_txt.split("\n"):
         if line[: len(package_name)].lower() == package_name:
             version = line.split("==")[1]
             logger.info(f"Version of {package} found is {version}")
-            break
+            return version
 
+    return None
+
+
+def resolve(package):
+    """
+    Resolves the full pinned dependency set of package using pip's dry-run report.
+    Nothing is installed, and wheels are not downloaded where the index serves their metadata separately.
+    returns: pip installation report as a dict -- or None if the package couldn't be resolved
+    """
+    import subprocess
+
+    logger.info("Resolving requirements without installing")
+    os.environ["PYTHONPATH"] = "/opt/python"
+    pip_resolve = subprocess.run(
+        [
+            "pip",
+            "install",
+            package,
+            "--dry-run",
+            "--ignore-installed",
+            "--quiet",
+            "--report",
+            "-",
+        ],
+        capture_output=True,
+    )
+    if pip_resolve.returncode != 0:
+        logger.warning(
+            {
+                "message": "Unable to resolve requirements, falling back to full build",
+                "stderr": pip_resolve.stderr.decode("utf-8"),
+            }
+        )
+        return None
+
+    return json.loads(pip_resolve.stdout)
+
+
+def requirements_from_report(package, report, build_options: list = ()):
+    """
+    Args:
+      package: Package name
+      report: pip installation report returned by resolve()
+      build_options: Build options hashed with the requirements, from get_build_options()
+    returns: requirements_txt, requirements_hash, version -- or None if package isn't in the report
+    """
+    requirements_txt = format_requirements(
+        (item["metadata"]["name"], item["metadata"]["version"])
+        for item in report["install"]
+    )
+    logger.info(f"Resolved requirements txt : \n{requirements_txt}")
+    requirements_hash = get_requirements_hash(requirements_txt, build_options)
+    version = get_package_version(package, requirements_txt)
+    if version is None:
+        return None
+
+    return requirements_txt, requirements_hash, version
+
+
+def read_distribution(dist_info_path: str) -> dict:
+    """
+    Args:
+      dist_info_path: Path to a *.dist-info folder
+    returns:
+      distribution: name and version from METADATA, file count and size from RECORD, and top level modules
+    """
+    distribution = {"name": None, "version": None, "files": 0, "size": 0}
+
+    with open(os.path.join(dist_info_path, "METADATA"), encoding="utf-8") as metadata:
+        # Name and Version are headers, headers end at the first blank line
+        for line in metadata:
+            if line in ("\n", "\r\n"):
+                break
+            if line.startswith("Name:"):
+                distribution["name"] = line[5:].strip()
+            elif line.startswith("Version:"):
+                distribution["version"] = line[8:].strip()
+
+    try:
+        with open(os.path.join(dist_info_path, "RECORD"), newline="") as record:
+            for row in csv.reader(record):
+                distribution["files"] += 1
+                if len(row) > 2 and row[2]:
+                    distribution["size"] += int(row[2])
+    except FileNotFoundError:
+        logger.warning(f"No RECORD in {dist_info_path}")
+
+    try:
+        with open(os.path.join(dist_info_path, "top_level.txt")) as top_level:
+            distribution["top_level"] = [
+                line.strip() for line in top_level if line.strip()
+            ]
+    except FileNotFoundError:
+        distribution["top_level"] = []
+
+    return distribution
+
+
+def scan_distributions(path: str) -> list:
+    """
+    Args:
+      path: Install target, e.g. /tmp/python
+    returns:
+      distributions: List of distributions installed in path, see read_distribution()
+    """
+    distributions = []
+    if not os.path.isdir(path):
+        return distributions  # nothing was installed
+    for entry in os.scandir(path):
+        if entry.name.endswith(".dist-info") and entry.is_dir():
+            distribution = read_distribution(entry.path)
+            if distribution["name"] is not None:
+                distributions.append(distribution)
+
+    return distributions
+
+
+def freeze_requirements(package, path, build_options: list = ()):
+    """
+    Walks through path, looking for *.dist-info folders. Parses out the package name and versions
+    returns: package name and version in requirements.txt format as a string, and the distributions found
+    """
+    logger.info("Getting requirements.txt file")
+    distributions = scan_distributions(path)
+    requirements_txt = format_requirements(
+        (distribution["name"], distribution["version"])
+        for distribution in distributions
+    )
+    logger.info(f"Requirements txt : \n{requirements_txt}")
+    requirements_hash = get_requirements_hash(requirements_txt, build_options)
+    logger.info(
+        {
+            "message": "Installed distributions",
+            "distributions": {
+                distribution["name"]: {
+                    "files": distribution["files"],
+                    "size": distribution["size"],
+                }
+                for distribution in distributions
+            },
+        }
+    )
+
+    version = get_package_version(package, requirements_txt)
     if version is None:
         # if the package itself is not in the requirements.txt, then it signals the installation process failed
         logger.error(
-            f"Unable to determine version of {package_name}....refer to logs for requirements.txt"
+            f"Unable to determine version of {package}....refer to logs for requirements.txt"
         )
         exit(1)
 
-    return requirements_txt, requirements_hash, version
+    return requirements_txt, requirements_hash, version, distributions
+
+
+class MultipartUploadWriter:
+    """
+    Write only file object that uploads to S3 in parts as data is written
+    One part is buffered while the previous part uploads in the background, so memory stays at ~2 parts
+    """
+
+    def __init__(self, bucket_name: str, key: str, part_size: int = 16 * 1024**2):
+        from concurrent.futures import ThreadPoolExecutor
+
+        self.bucket_name = bucket_name
+        self.key = key
+        self.part_size = part_size  # S3 minimum is 5MB, except for the last part
+        self.client = boto3.client("s3")
+        self.upload_id = self.client.create_multipart_upload(
+            Bucket=bucket_name, Key=key
+        )["UploadId"]
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        self.pending = None
+        self.buffer = bytearray()
+        self.parts = []
+        self.size = 0
+
+    def write(self, data):
+        self.buffer += data
+        self.size += len(data)
+        while len(self.buffer) >= self.part_size:
+            self._upload_part(bytes(self.buffer[: self.part_size]))
+            del self.buffer[: self.part_size]
+        return len(data)
+
+    def flush(self):
+        pass  # data is uploaded once a full part is buffered
 
+    def _wait_for_pending(self):
+        if self.pending is not None:
+            self.parts.append(self.pending.result())
+            self.pending = None
 
-def upload_to_s3(zip_file, package, uploaded_file_name):
+    def _upload_part(self, body: bytes):
+        self._wait_for_pending()
+        part_number = len(self.parts) + 1
+        self.pending = self.executor.submit(
+            lambda: {
+                "PartNumber": part_number,
+                "ETag": self.client.upload_part(
+                    Bucket=self.bucket_name,
+                    Key=self.key,
+                    UploadId=self.upload_id,
+                    PartNumber=part_number,
+                    Body=body,
+                )["ETag"],
+            }
+        )
+
+    def complete(self):
+        self._upload_part(bytes(self.buffer))
+        self._wait_for_pending()
+        self.executor.shutdown()
+        self.client.complete_multipart_upload(
+            Bucket=self.bucket_name,
+            Key=self.key,
+            UploadId=self.upload_id,
+            MultipartUpload={"Parts": self.parts},
+        )
+
+    def abort(self):
+        self.executor.shutdown(cancel_futures=True)
+        self.client.abort_multipart_upload(
+            Bucket=self.bucket_name, Key=self.key, UploadId=self.upload_id
+        )
+
+
+def upload_to_s3(dir_path, package, uploaded_file_name, previous_archive_hash=None):
     """
+    Zips dir_path straight into a multipart upload, without writing the zip to disk
+    Parts are uploaded as the zip is written, the hash is updated as the bytes go by
     Args:
-      zip_file: Location of zip file to be uploaded to S3 bucket
+      dir_path: Directory to zip (e.g. /tmp/python)
       package: Name of python package being uploaded
-    return:
       uploaded_file_name: Name of file in S3 bucket
+      previous_archive_hash: SHA256 hash of the last upload, the upload is aborted if the zip is unchanged
+    return:
+      archive_hash: SHA256 hash of the zip
+      size: Size of the zip in bytes
+      uploaded: False if the upload was aborted because the zip was unchanged
     """
 
     bucket_name = os.environ["BUCKET_NAME"]
+    writer = MultipartUploadWriter(bucket_name=bucket_name, key=uploaded_file_name)
+    try:
+        archive_hash, manifest = write_layer_zip(dir_path, writer)
+    except Exception:
+        writer.abort()
+        raise
 
-    s3 = boto3.resource("s3")
-    s3.meta.client.upload_file(zip_file, bucket_name, uploaded_file_name)
+    if archive_hash == previous_archive_hash:
+        # Zip is reproducible, same bytes means the uploaded artifact is already this build
+        # Aborting discards the parts sent so far, the existing object is kept
+        writer.abort()
+        logger.info(
+            {
+                "message": "Layer zip unchanged since last upload, aborted upload",
+                "archive_hash": archive_hash,
+            }
+        )
+        return archive_hash, writer.size, False
 
-    client = boto3.client("s3")
-    response = client.list_objects_v2(Bucket=bucket_name, Prefix=uploaded_file_name)
-    logger.info(response)
+    try:
+        writer.complete()
+    except Exception:
+        writer.abort()
+        raise
     logger.info(
         {
             "message": f"Uploaded {package}.zip",
-            "size": response["Contents"][0]["Size"],
-            "time": response["Contents"][0]["LastModified"],
+            "size": writer.size,
+            "files": len(manifest),
+            "parts": len(writer.parts),
+            "archive_hash": archive_hash,
             "bucket": bucket_name,
         }
     )
 
-    return uploaded_file_name
+    return archive_hash, writer.size, True
 
 
-def zip_dir(dir_path, package):
-    zip_file = f"/tmp/{package}"
-    result = shutil.make_archive(
-        base_name=zip_file,
-        format="zip",
-        base_dir=dir_path.split("/")[-1],
-        root_dir="/tmp",
-    )
-    logger.info(result)
-    return f"{zip_file}.zip"
+# Fixed zip entry metadata, so identical install trees give byte identical zip files
+ZIP_DATE_TIME = (1980, 1, 1, 0, 0, 0)
+ZIP_FILE_MODE = 0o644
+ZIP_EXECUTABLE_MODE = 0o755
+
+
+class HashingWriter:
+    """
+    Write only file object that hashes and counts bytes on their way to fp
+    It has no seek(), so ZipFile streams entries with data descriptors instead of rewriting headers
+    """
+
+    def __init__(self, fp):
+        self.fp = fp
+        self.sha256 = hashlib.sha256()
+        self.size = 0
+
+    def write(self, data):
+        self.sha256.update(data)
+        self.size += len(data)
+        return self.fp.write(data)
+
+    def flush(self):
+        self.fp.flush()
+
+
+def write_layer_zip(dir_path: str, fp):
+    """
+    Writes dir_path into fp as a reproducible zip: entries sorted by path, timestamps and permissions pinned,
+    every entry deflated at the default level. Paths are relative to the parent of dir_path (e.g. python/...)
+    Args:
+      dir_path: Directory to zip (e.g. /tmp/python)
+      fp: Writable file object
+    returns:
+      archive_hash: SHA256 hash of the zip bytes written
+      manifest: List of {path, size, sha256} of every file in the zip
+    """
+    root_dir = os.path.dirname(dir_path.rstrip("/"))
+    paths = []
+    for dir_name, _, file_names in os.walk(dir_path):
+        for file_name in file_names:
+            paths.append(os.path.relpath(os.path.join(dir_name, file_name), root_dir))
+    paths.sort()
+
+    writer = HashingWriter(fp)
+    manifest = []
+    with ZipFile(writer, "w", compression=ZIP_DEFLATED) as zip_file:
+        for path in paths:
+            full_path = os.path.join(root_dir, path)
+            zip_info = ZipInfo(path, date_time=ZIP_DATE_TIME)
+            zip_info.compress_type = ZIP_DEFLATED
+            zip_info.create_system = 3  # unix, so external_attr holds the file mode
+            if os.stat(full_path).st_mode & 0o111:
+                zip_info.external_attr = (stat.S_IFREG | ZIP_EXECUTABLE_MODE) << 16
+            else:
+                zip_info.external_attr = (stat.S_IFREG | ZIP_FILE_MODE) << 16
+
+            file_hash = hashlib.sha256()
+            file_size = 0
+            with open(full_path, "rb") as source, zip_file.open(zip_info, "w") as dest:
+                while chunk := source.read(1024 * 1024):
+                    file_hash.update(chunk)
+                    file_size += len(chunk)
+                    dest.write(chunk)
+            manifest.append(
+                {"path": path, "size": file_size, "sha256": file_hash.hexdigest()}
+            )
+
+    return writer.sha256.hexdigest(), manifest
 
 
 def delete_dir(dir):
@@ -253,16 +748,230 @@ def dir_size(path="."):
     return total
 
 
-def install(package, package_dir):
+class LocalWheelStore:
+    """
+    Content addressed wheel store in a local directory, wheels are stored as <sha256>/<filename>
+    Used for testing, and for running builds outside of Lambda
+    """
+
+    def __init__(self, path: str, max_bytes: int):
+        self.path = path
+        self.max_bytes = max_bytes
+
+    def get(self, filename: str, sha256: str, dest_dir: str) -> bool:
+        cached_path = os.path.join(self.path, sha256, filename)
+        if not os.path.isfile(cached_path):
+            return False
+        os.utime(cached_path)  # mtime tracks last use for eviction
+        shutil.copyfile(cached_path, os.path.join(dest_dir, filename))
+        return True
+
+    def put(self, wheel_path: str, filename: str, sha256: str) -> None:
+        os.makedirs(os.path.join(self.path, sha256), exist_ok=True)
+        shutil.copyfile(wheel_path, os.path.join(self.path, sha256, filename))
+
+    def evict(self) -> int:
+        """
+        Deletes least recently used wheels until the store is under max_bytes
+        returns: number of wheels evicted
+        """
+        wheels = []
+        for sha256 in os.listdir(self.path):
+            for filename in os.listdir(os.path.join(self.path, sha256)):
+                stat = os.stat(os.path.join(self.path, sha256, filename))
+                wheels.append((stat.st_mtime, stat.st_size, sha256, filename))
+
+        total_size = sum(wheel[1] for wheel in wheels)
+        evicted = 0
+        for _, size, sha256, filename in sorted(wheels):
+            if total_size <= self.max_bytes:
+                break
+            shutil.rmtree(os.path.join(self.path, sha256))
+            total_size -= size
+            evicted += 1
+
+        return evicted
+
+
+class S3WheelStore:
+    """
+    Content addressed wheel store in the artifacts bucket, wheels are stored as <prefix><sha256>/<filename>
+    Last use is kept in the lstUsd object tag, tagging doesn't write a new version of the object
+    """
+
+    def __init__(self, bucket_name: str, max_bytes: int, prefix: str = "wheel_cache/"):
+        self.bucket_name = bucket_name
+        self.max_bytes = max_bytes
+        self.prefix = prefix
+        self.client = boto3.client("s3")
+
+    @staticmethod
+    def last_used_tag() -> dict:
+        return {"Key": "lstUsd", "Value": datetime.utcnow().isoformat()}
+
+    def get(self, filename: str, sha256: str, dest_dir: str) -> bool:
+        key = f"{self.prefix}{sha256}/{filename}"
+        try:
+            self.client.download_file(
+                self.bucket_name, key, os.path.join(dest_dir, filename)
+            )
+        except ClientError as e:
+            if e.response["Error"]["Code"] in ("404", "NoSuchKey"):
+                return False
+            raise
+        self.client.put_object_tagging(
+            Bucket=self.bucket_name,
+            Key=key,
+            Tagging={"TagSet": [self.last_used_tag()]},
+        )
+        return True
+
+    def put(self, wheel_path: str, filename: str, sha256: str) -> None:
+        tag = self.last_used_tag()
+        self.client.upload_file(
+            wheel_path,
+            self.bucket_name,
+            f"{self.prefix}{sha256}/{filename}",
+            ExtraArgs={"Tagging": f"{tag['Key']}={tag['Value']}"},
+        )
+
+    def get_last_used(self, wheel: dict) -> str:
+        """
+        returns: lstUsd tag of the wheel, its LastModified if it has no tag
+        """
+        tags = self.client.get_object_tagging(Bucket=self.bucket_name, Key=wheel["Key"])
+        for tag in tags["TagSet"]:
+            if tag["Key"] == "lstUsd":
+                return tag["Value"]
+        return wheel["LastModified"].replace(tzinfo=None).isoformat()
+
+    def evict(self) -> int:
+        """
+        Deletes least recently used wheels until the store is under max_bytes
+        returns: number of wheels evicted
+        """
+        wheels = []
+        paginator = self.client.get_paginator("list_objects_v2")
+        for page in paginator.paginate(Bucket=self.bucket_name, Prefix=self.prefix):
+            wheels.extend(page.get("Contents", []))
+
+        total_size = sum(wheel["Size"] for wheel in wheels)
+        if total_size <= self.max_bytes:
+            return 0  # tags are only read when something has to go
+
+        evicted = 0
+        for wheel in sorted(wheels, key=self.get_last_used):
+            if total_size <= self.max_bytes:
+                break
+            self.client.delete_object(Bucket=self.bucket_name, Key=wheel["Key"])
+            total_size -= wheel["Size"]
+            evicted += 1
+
+        return evicted
+
+
+def get_wheel_store():
+    """
+    returns: LocalWheelStore if WHEEL_CACHE_DIR is set, S3WheelStore in the artifacts bucket otherwise
+    """
+    max_bytes = int(os.environ.get("WHEEL_CACHE_MAX_BYTES", 20 * 1024**3))
+    if os.environ.get("WHEEL_CACHE_DIR"):
+        return LocalWheelStore(path=os.environ["WHEEL_CACHE_DIR"], max_bytes=max_bytes)
+    return S3WheelStore(bucket_name=os.environ["BUCKET_NAME"], max_bytes=max_bytes)
+
+
+def download_wheel(url: str, dest_path: str) -> str:
+    """
+    Downloads url to dest_path
+    returns: sha256 of the downloaded file
+    """
+    from urllib.request import urlopen
+
+    sha256 = hashlib.sha256()
+    with urlopen(url) as response, open(dest_path, "wb") as wheel_file:
+        while chunk := response.read(1024 * 1024):
+            sha256.update(chunk)
+            wheel_file.write(chunk)
+
+    return sha256.hexdigest()
+
+
+def fill_wheelhouse(report, wheelhouse: str, store) -> bool:
+    """
+    Args:
+      report: pip installation report returned by resolve()
+      wheelhouse: Local directory to place wheels into, used as pip's --find-links
+      store: Wheel store to read from before going to the index, and write into after a download
+    returns:
+      True if every resolved distribution is a wheel now in the wheelhouse (install can run offline)
+    """
+    delete_dir(wheelhouse)
+    os.makedirs(wheelhouse)
+    stats = {
+        "hits": 0,
+        "misses": 0,
+        "hit_bytes": 0,
+        "miss_bytes": 0,
+        "hit_seconds": 0.0,
+        "miss_seconds": 0.0,
+    }
+    complete = True
+
+    for item in report["install"]:
+        download_info = item.get("download_info", {})
+        url = download_info.get("url", "")
+        sha256 = download_info.get("archive_info", {}).get("hashes", {}).get("sha256")
+        filename = url.split("/")[-1].split("#")[0]
+        if not filename.endswith(".whl") or sha256 is None:
+            complete = False  # sdists and direct references are left for pip
+            continue
+
+        wheel_path = os.path.join(wheelhouse, filename)
+        start = time.perf_counter()
+        if store.get(filename, sha256, wheelhouse):
+            stats["hits"] += 1
+            stats["hit_bytes"] += os.path.getsize(wheel_path)
+            stats["hit_seconds"] += time.perf_counter() - start
+            continue
+
+        downloaded_sha256 = download_wheel(url, wheel_path)
+        stats["misses"] += 1
+        stats["miss_bytes"] += os.path.getsize(wheel_path)
+        stats["miss_seconds"] += time.perf_counter() - start
+        if downloaded_sha256 != sha256:
+            logger.warning({"message": "Wheel hash mismatch", "wheel": filename})
+            os.remove(wheel_path)
+            complete = False
+            continue
+        store.put(wheel_path, filename, sha256)
+
+    if stats["misses"] > 0:
+        stats["evicted"] = store.evict()
+    logger.info({"message": "Wheel cache", **stats})
+
+    return complete
+
+
+def install(package, package_dir, report=None):
     """ "
     Args:
       package: Name of package to be queried
+      report: pip installation report, wheels it resolved to are served from the wheel cache
     return:
       path to zip file of final package
     """
     delete_dir(package_dir)
     import subprocess
 
+    pip_args = []
+    if report is not None:
+        # next to package_dir, so builds in separate directories don't share a wheelhouse
+        wheelhouse = os.path.join(os.path.dirname(package_dir), "wheelhouse")
+        if fill_wheelhouse(report, wheelhouse, get_wheel_store()):
+            pip_args = ["--no-index", "--find-links", wheelhouse]
+        else:
+            pip_args = ["--find-links", wheelhouse]
+
     os.environ["PYTHONPATH"] = "/opt/python"
     output = subprocess.run(
         [
@@ -274,6 +983,9 @@ def install(package, package_dir):
             "--quiet",
             "--upgrade",
             "--no-cache-dir",
+            # install time .pyc files embed source mtimes, which the zip pins, they'd be stale and non-reproducible
+            "--no-compile",
+            *pip_args,
         ],
         capture_output=True,
     )
@@ -282,6 +994,413 @@ def install(package, package_dir):
     return package_dir
 
 
+# Categories of files slim_dir() prunes, a package's rules can allow any of them back
+# There's no pycache category, install runs with --no-compile and compile_bytecode() runs after slimming
+SLIM_CATEGORIES = ("tests", "stubs", "docs", "debug_symbols")
+
+# Per package rules, "allow" takes categories or globs to keep, "deny" takes extra globs to prune
+# "prune_tests" takes the test directories that may be pruned, test suites are kept unless listed here
+# Globs match paths relative to the install target (e.g. "botocore/data/*")
+SLIM_PACKAGE_RULES = {
+    # Only ever run by pytest, nothing in the packages imports them
+    "numpy": {"prune_tests": ["numpy/tests", "numpy/*/tests"]},
+    "pandas": {"prune_tests": ["pandas/tests"]},
+}
+
+# RECORD entries with these suffixes are importable code
+IMPORTABLE_SUFFIXES = (".py", ".so", ".pyd")
+
+# Directories holding a test suite
+TEST_DIRECTORIES = ("tests", "test")
+
+
+def get_test_directory(relative_path: str):
+    """
+    returns: the test directory relative_path is in (e.g. pkg/tests), None if it isn't in one
+    """
+    parts = relative_path.split(os.sep)
+    for index, part in enumerate(parts[:-1]):
+        if part in TEST_DIRECTORIES:
+            return os.path.join(*parts[: index + 1])
+    return None
+
+
+def get_protected_paths(path: str) -> set:
+    """
+    Args:
+      path: Install target, e.g. /tmp/python
+    returns:
+      protected_paths: Paths relative to path of every module a RECORD lists, wherever it lives.
+        Modules can be imported dynamically (importlib, entry points, plugin discovery), so none are pruned
+    """
+    recorded = set()
+    for entry in os.scandir(path):
+        if not (entry.name.endswith(".dist-info") and entry.is_dir()):
+            continue
+        try:
+            with open(os.path.join(entry.path, "RECORD"), newline="") as record:
+                recorded.update(os.path.normpath(row[0]) for row in csv.reader(record))
+        except FileNotFoundError:
+            continue
+
+    # a .pyc outside __pycache__ is a sourceless module
+    return {
+        record_path
+        for record_path in recorded
+        if record_path.endswith(IMPORTABLE_SUFFIXES)
+        or (
+            record_path.endswith(".pyc")
+            and "__pycache__" not in record_path.split(os.sep)
+        )
+    }
+
+
+def get_slim_category(relative_path: str, prune_tests: list = ()):
+    """
+    Args:
+      relative_path: Path relative to the install target
+      prune_tests: Globs of the test directories that may be pruned
+    returns: category from SLIM_CATEGORIES that relative_path would be pruned under, None otherwise
+    """
+    parts = relative_path.split(os.sep)
+    directories, file_name = parts[:-1], parts[-1]
+    if file_name.endswith(".pyi") or file_name == "py.typed":
+        return "stubs"
+    test_directory = get_test_directory(relative_path)
+    if test_directory is not None:
+        # a test suite is kept whole unless the package's rules say it can go
+        if any(fnmatch(test_directory, glob) for glob in prune_tests):
+            return "tests"
+        return None
+    if "docs" in directories or "doc" in directories:
+        return "docs"
+    if file_name.endswith((".md", ".rst")):
+        return "docs"
+    return None
+
+
+def has_debug_sections(file_path: str) -> bool:
+    """
+    returns: True if file_path is an ELF file with .debug* sections, reads only the section headers
+    """
+    try:
+        return any(
+            name.startswith(".debug") for name in read_elf_section_names(file_path)
+        )
+    except (struct.error, IndexError):
+        logger.warning(
+            {"message": "Unable to read ELF section headers", "file": file_path}
+        )
+        return False
+
+
+def read_elf_section_names(file_path: str) -> list:
+    """
+    returns: section names of the ELF file at file_path, empty if it isn't an ELF file
+    """
+    with open(file_path, "rb") as binary:
+        ident = binary.read(16)
+        if ident[:4] != b"\x7fELF":
+            return []
+        is_64_bit = ident[4] == 2
+        endian = "<" if ident[5] == 1 else ">"
+        if is_64_bit:
+            binary.seek(0x28)
+            (section_offset,) = struct.unpack(f"{endian}Q", binary.read(8))
+            binary.seek(0x3A)
+        else:
+            binary.seek(0x20)
+            (section_offset,) = struct.unpack(f"{endian}I", binary.read(4))
+            binary.seek(0x2E)
+        entry_size, entry_count, names_index = struct.unpack(
+            f"{endian}HHH", binary.read(6)
+        )
+        if section_offset == 0 or names_index >= entry_count:
+            return []
+
+        sections = []
+        for index in range(entry_count):
+            binary.seek(section_offset + index * entry_size)
+            header = binary.read(entry_size)
+            if is_64_bit:
+                name, _, _, _, offset, size = struct.unpack(
+                    f"{endian}IIQQQQ", header[:40]
+                )
+            else:
+                name, _, _, _, offset, size = struct.unpack(
+                    f"{endian}IIIIII", header[:24]
+                )
+            sections.append((name, offset, size))
+
+        _, names_offset, names_size = sections[names_index]
+        binary.seek(names_offset)
+        names = binary.read(names_size)
+
+    return [
+        names[name:].split(b"\0", 1)[0].decode("ascii", "replace")
+        for name, _, _ in sections
+    ]
+
+
+def strip_debug_symbols(file_path: str) -> int:
+    """
+    returns: bytes saved by stripping debug symbols from the ELF file at file_path
+    """
+    import subprocess
+
+    size_before = os.path.getsize(file_path)
+    output = subprocess.run(["strip", "--strip-debug", file_path], capture_output=True)
+    if output.returncode != 0:
+        logger.warning({"message": "Unable to strip", "file": file_path})
+        return 0
+    return size_before - os.path.getsize(file_path)
+
+
+def slim_dir(package_dir: str, package: str, rules: dict = None) -> dict:
+    """
+    Prunes files a layer doesn't need at runtime from package_dir, *.dist-info folders are left untouched
+    Args:
+      package_dir: Install target, e.g. /tmp/python
+      package: Package name, used to look up SLIM_PACKAGE_RULES
+      rules: Rules for this build, merged over SLIM_PACKAGE_RULES
+    returns:
+      bytes_saved: Bytes saved per category (and "deny" for files removed by deny globs)
+    """
+    package_rules = SLIM_PACKAGE_RULES.get(package.split("[")[0].lower(), {})
+    rules = rules or {}
+    allow = package_rules.get("allow", []) + rules.get("allow", [])
+    deny = package_rules.get("deny", []) + rules.get("deny", [])
+    prune_tests = package_rules.get("prune_tests", []) + rules.get("prune_tests", [])
+    allowed_categories = {rule for rule in allow if rule in SLIM_CATEGORIES}
+    allowed_globs = [rule for rule in allow if rule not in SLIM_CATEGORIES]
+
+    protected_paths = get_protected_paths(package_dir)
+    strip_available = shutil.which("strip") is not None
+    if not strip_available:
+        logger.warning("strip not found, debug symbols will not be stripped")
+    bytes_saved = {category: 0 for category in SLIM_CATEGORIES + ("deny",)}
+
+    for dir_name, dir_names, file_names in os.walk(package_dir):
+        relative_dir = os.path.relpath(dir_name, package_dir)
+        if relative_dir.split(os.sep)[0].endswith(".dist-info"):
+            dir_names[:] = []
+            continue
+
+        for file_name in file_names:
+            file_path = os.path.join(dir_name, file_name)
+            relative_path = os.path.normpath(os.path.join(relative_dir, file_name))
+            if any(fnmatch(relative_path, glob) for glob in allowed_globs):
+                continue
+
+            category = get_slim_category(relative_path, prune_tests)
+            if category is None and any(fnmatch(relative_path, glob) for glob in deny):
+                category = "deny"
+
+            # Listing a test directory in prune_tests is what allows pruning the modules in it
+            if (
+                category is not None
+                and category not in allowed_categories
+                and (category == "tests" or relative_path not in protected_paths)
+            ):
+                bytes_saved[category] += os.path.getsize(file_path)
+                os.remove(file_path)
+            elif (
+                strip_available
+                and "debug_symbols" not in allowed_categories
+                and (file_name.endswith(".so") or ".so." in file_name)
+                # libraries vendored by auditwheel are patched, stripping them can break loading
+                and not relative_dir.split(os.sep)[0].endswith(".libs")
+                and has_debug_sections(file_path)
+            ):
+                bytes_saved["debug_symbols"] += strip_debug_symbols(file_path)
+
+    # Remove directories left empty by pruning
+    for dir_name, _, _ in os.walk(package_dir, topdown=False):
+        if dir_name != package_dir and not os.listdir(dir_name):
+            os.rmdir(dir_name)
+
+    logger.info({"message": "Slimmed package", "bytes_saved": bytes_saved})
+    return bytes_saved
+
+
+def compile_bytecode(package_dir: str) -> bool:
+    """
+    Compiles every module in package_dir for the running interpreter, which check_python_version() has matched
+    to the layer's runtime. Unchecked hash .pyc files are used, they stay valid after unzip whatever the mtimes,
+    and tracebacks point at /opt/python, where Lambda extracts the layer.
+    returns: True if every module compiled
+    """
+    import compileall
+    from py_compile import PycInvalidationMode
+
+    compiled = compileall.compile_dir(
+        package_dir,
+        ddir="/opt/python",
+        force=True,
+        quiet=1,
+        workers=1,  # process pools need /dev/shm, which Lambda doesn't have
+        invalidation_mode=PycInvalidationMode.UNCHECKED_HASH,
+    )
+    if not compiled:
+        logger.warning("Some modules failed to compile, they'll be compiled on import")
+    return compiled
+
+
+def get_top_level_modules(package: str, distributions: list) -> list:
+    """
+    Args:
+      package: Package name
+      distributions: Distributions returned by scan_distributions()
+    returns:
+      modules: Top level modules of package, from top_level.txt or guessed from the package name
+    """
+    package_name = package.split("[")[0].lower().replace("_", "-")
+    for distribution in distributions:
+        if distribution["name"].lower().replace("_", "-") == package_name:
+            if distribution["top_level"]:
+                return [
+                    module
+                    for module in distribution["top_level"]
+                    if not module.startswith("_")
+                ] or distribution["top_level"]
+    return [package_name.replace("-", "_")]
+
+
+def parse_import_time(importtime_output: str) -> dict:
+    """
+    Args:
+      importtime_output: stderr of python -X importtime
+    returns:
+      import_times: cumulative import time in microseconds of every top level import
+    """
+    import_times = {}
+    for line in importtime_output.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line[len("import time:") :].split("|", 2)
+        if name.startswith(" ") and not name.startswith(
+            "  "
+        ):  # nested imports are indented
+            try:
+                import_times[name.strip()] = int(cumulative)
+            except ValueError:
+                continue  # header line
+    return import_times
+
+
+# Printed to stderr by the measured interpreter after its imports, ru_maxrss is in KB on linux
+# Behind a marker on its own line, imported modules can print to stdout and stderr too
+PEAK_RSS_MARKER = "klayers-peak-rss-kb:"
+PEAK_RSS_SNIPPET = (
+    "import resource, sys; "
+    f"sys.stderr.write('\\n{PEAK_RSS_MARKER}' + "
+    "str(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss) + '\\n')"
+)
+
+# Imports that take longer than this are abandoned, the build carries on without a benchmark
+IMPORT_TIMEOUT_SECONDS = 60
+
+
+def parse_peak_rss(stderr: str):
+    """
+    Args:
+      stderr: stderr of the measured interpreter
+    returns:
+      peak_rss_kb: value after the last PEAK_RSS_MARKER, None if it's missing or garbled
+    """
+    for line in reversed(stderr.splitlines()):
+        if line.startswith(PEAK_RSS_MARKER):
+            try:
+                return int(line[len(PEAK_RSS_MARKER) :])
+            except ValueError:
+                return None
+    return None
+
+
+def measure_import_time(package_dir: str, modules: list, use_bytecode: bool) -> dict:
+    """
+    Imports modules in a fresh interpreter with package_dir on the path, like a cold start with the layer on /opt
+    Args:
+      package_dir: Install target, e.g. /tmp/python
+      modules: Modules to import
+      use_bytecode: False to ignore the .pyc files in package_dir, and compile every module on import
+    returns:
+      modules_us: cumulative import time in microseconds of each module, from -X importtime
+      total_us: sum of modules_us
+      peak_rss_kb: peak resident memory of the interpreter after the imports, None if it couldn't be read
+      Empty if the modules couldn't be imported within IMPORT_TIMEOUT_SECONDS
+    """
+    import subprocess
+    import tempfile
+
+    with tempfile.TemporaryDirectory() as empty_pycache:
+        command = [sys.executable, "-B", "-X", "importtime"]
+        if not use_bytecode:
+            # .pyc files are only looked up under pycache_prefix, which is empty
+            command += ["-X", f"pycache_prefix={empty_pycache}"]
+        imports = "; ".join(f"import {module}" for module in modules)
+        command += ["-c", f"{imports}; {PEAK_RSS_SNIPPET}"]
+        try:
+            output = subprocess.run(
+                command,
+                capture_output=True,
+                env={**os.environ, "PYTHONPATH": package_dir},
+                timeout=IMPORT_TIMEOUT_SECONDS,
+            )
+        except subprocess.TimeoutExpired:
+            logger.warning(
+                {
+                    "message": "Timed out importing modules",
+                    "modules": modules,
+                    "timeout": IMPORT_TIMEOUT_SECONDS,
+                }
+            )
+            return {}
+
+    stderr = output.stderr.decode("utf-8", errors="replace")
+    if output.returncode != 0:
+        logger.warning(
+            {
+                "message": "Unable to import modules",
+                "modules": modules,
+                "stderr": stderr[-2000:],
+            }
+        )
+        return {}
+
+    import_times = parse_import_time(stderr)
+    modules_us = {module: import_times.get(module, 0) for module in modules}
+    return {
+        "modules_us": modules_us,
+        "total_us": sum(modules_us.values()),
+        "peak_rss_kb": parse_peak_rss(stderr),
+    }
+
+
+def get_import_attributes(import_benchmark: dict) -> dict:
+    """
+    Args:
+      import_benchmark: Result of measure_import_time()
+    returns:
+      build_attributes: DynamoDB attributes for the bld#v item, empty if nothing was measured
+    """
+    if not import_benchmark:
+        return {}
+
+    attributes = {
+        "imprtTm": {"N": str(import_benchmark["total_us"])},
+        "imprtTms": {
+            "M": {
+                module: {"N": str(import_us)}
+                for module, import_us in import_benchmark["modules_us"].items()
+            }
+        },
+    }
+    if import_benchmark["peak_rss_kb"] is not None:
+        attributes["pkRss"] = {"N": str(import_benchmark["peak_rss_kb"])}
+    return attributes
+
+
 def check_python_version(python_version: str) -> bool:
     """ "
     Args:
@@ -313,33 +1432,176 @@ def check_python_version(python_version: str) -> bool:
         return False
 
 
-@logger.inject_lambda_context
-def main(event, context):
+def build_in_process(event: dict, package_dir: str, connection) -> None:
+    """
+    Target of the build_packages() worker processes, sends the build result or error through connection
+    """
+    try:
+        connection.send({"result": build_package(event, package_dir=package_dir)})
+    except BaseException as e:  # build_package exits on failure, SystemExit included
+        connection.send({"error": repr(e)})
+    finally:
+        connection.close()
+
+
+def build_packages(event: dict) -> dict:
+    """
+    Builds every package in event["packages"] in its own process and target directory
+    At most one process per vCPU (or BUILD_WORKERS) runs at a time, a failed build doesn't affect the others
+    Args:
+      event: Build event whose "packages" is a list of package names or of per package build events,
+        every other key (python_version, force_build, ...) is the default for each package
+    returns:
+      builds: Results of the successful builds, each the same as a single build returns
+      failures: package and error of every build that failed
+    """
+    import multiprocessing
+    from multiprocessing.connection import wait
+
+    defaults = {key: value for key, value in event.items() if key != "packages"}
+    package_events = [
+        {**defaults, **(item if isinstance(item, dict) else {"package": item})}
+        for item in event["packages"]
+    ]
+    workers = int(os.environ.get("BUILD_WORKERS", len(os.sched_getaffinity(0))))
+    # Lambda has no /dev/shm, so no multiprocessing.Pool, processes and pipes work
+    context = multiprocessing.get_context("fork")
+
+    outcomes = [None] * len(package_events)
+    pending = list(enumerate(package_events))
+    running = {}
+    while pending or running:
+        while pending and len(running) < workers:
+            index, package_event = pending.pop(0)
+            receiver, sender = context.Pipe(duplex=False)
+            process = context.Process(
+                target=build_in_process,
+                args=(package_event, f"/tmp/build/{index}/python", sender),
+            )
+            process.start()
+            sender.close()
+            running[receiver] = (index, process)
+
+        # Results are read before joining, a result bigger than the pipe buffer blocks the worker until read
+        # A receiver is also ready at EOF, when its worker exits without sending
+        for receiver in wait(list(running)):
+            index, process = running.pop(receiver)
+            try:
+                outcomes[index] = receiver.recv()
+            except EOFError:
+                outcomes[index] = None
+            receiver.close()
+            process.join()
+            if outcomes[index] is None:
+                outcomes[index] = {"error": f"Build exited with {process.exitcode}"}
+            delete_dir(f"/tmp/build/{index}")
+
+    builds = []
+    failures = []
+    for package_event, outcome in zip(package_events, outcomes):
+        if "result" in outcome:
+            builds.append(outcome["result"])
+        else:
+            failures.append({"package": package_event["package"], **outcome})
+    logger.info(
+        {
+            "message": "Batch build complete",
+            "workers": workers,
+            "builds": len(builds),
+            "failures": failures,
+        }
+    )
+
+    return {"builds": builds, "failures": failures}
+
+
+def build_package(event: dict, package_dir: str) -> dict:
     package = event["package"]
     license_info = event["license_info"]
     python_version = event["python_version"]
     force_build = event["force_build"]
     force_deploy = event["force_deploy"]
 
-    if not check_python_version(python_version):
-        sys.exit(1)
-
-    package_dir = f"/tmp/python"
     uploaded_file_name = f"{python_version}/{package}.zip"
     build_flag = False
+    build_options = get_build_options(event)
+
+    # Resolve before installing, most weekly builds resolve to a previously built requirements_hash
+    report = resolve(package)
+    resolved = (
+        None
+        if report is None
+        else requirements_from_report(package, report, build_options)
+    )
+    if not force_build and resolved is not None:
+        requirements_txt, requirements_hash, version = resolved
+        if check_requirement_hash(
+            package=package,
+            requirements_hash=requirements_hash,
+            python_version=python_version,
+        ):
+            logger.info(
+                {
+                    "message": "Resolved requirements hash previously built, skipping install",
+                    "package": package,
+                    "version": version,
+                    "requirements_hash": requirements_hash,
+                }
+            )
+            put_checked_date(package=package, python_version=python_version)
+            return {
+                "zip_file_S3key": uploaded_file_name,
+                "package": package,
+                "version": version,
+                "requirements_hash": requirements_hash,
+                "license_info": license_info,
+                "build_flag": build_flag,
+                "force_deploy": force_deploy,
+                "python_version": python_version,
+            }
 
-    package_dir = install(package, package_dir=package_dir)
+    package_dir = install(package, package_dir=package_dir, report=report)
     package_size = dir_size(package_dir)
     logger.info({"package": package, "size": package_size})
 
-    requirements_txt, requirements_hash, version = freeze_requirements(
-        package=package, path=package_dir
+    requirements_txt, requirements_hash, version, distributions = freeze_requirements(
+        package=package, path=package_dir, build_options=build_options
     )
     logger.info({"message": "Built Package", "requirements_txt": requirements_txt})
 
+    build_attributes = {}
+    if "slim" in build_options:
+        slim_dir(package_dir, package=package, rules=event.get("slim_rules"))
+        slimmed_size = dir_size(package_dir)
+        logger.info(
+            {
+                "package": package,
+                "size_before_slim": package_size,
+                "size_after_slim": slimmed_size,
+            }
+        )
+        build_attributes["szBfrSlm"] = {"N": str(package_size)}
+        build_attributes["szAftrSlm"] = {"N": str(slimmed_size)}
+
+    modules = get_top_level_modules(package, distributions)
+    if "compile_bytecode" in build_options:
+        compile_bytecode(package_dir)
+        without_bytecode = measure_import_time(package_dir, modules, use_bytecode=False)
+        logger.info(
+            {
+                "message": "Import time without bytecode",
+                "package": package,
+                **without_bytecode,
+            }
+        )
+
+    # Layer as shipped, Lambda can't write bytecode to /opt, so only precompiled .pyc files are used
+    import_benchmark = measure_import_time(package_dir, modules, use_bytecode=True)
+    logger.info({"message": "Import time", "package": package, **import_benchmark})
+    build_attributes.update(get_import_attributes(import_benchmark))
+
     with open(f"{package_dir}/requirements.txt", "w") as requirements_file:
         requirements_file.write(requirements_txt)
-    zip_file = zip_dir(dir_path=package_dir, package=package)
 
     if force_build or not check_requirement_hash(
         package=package,
@@ -356,33 +1618,41 @@ def main(event, context):
             }
         )
 
-        upload_to_s3(
-            zip_file=zip_file, package=package, uploaded_file_name=uploaded_file_name
-        )
-        put_requirements_hash(
+        archive_hash, archive_size, build_flag = upload_to_s3(
+            dir_path=package_dir,
             package=package,
-            requirements_txt=requirements_txt,
-            requirements_hash=requirements_hash,
-            version=version,
-            python_version=python_version,
+            uploaded_file_name=uploaded_file_name,
+            previous_archive_hash=get_archive_hash(
+                package=package, python_version=python_version
+            ),
         )
+        if build_flag:
+            put_requirements_hash(
+                package=package,
+                requirements_txt=requirements_txt,
+                requirements_hash=requirements_hash,
+                archive_hash=archive_hash,
+                version=version,
+                python_version=python_version,
+                build_attributes=build_attributes,
+            )
 
-        logger.info(
-            {
-                "package": package,
-                "version": version,
-                "location": f"s3://{os.environ['BUCKET_NAME']}",
-                "size": os.path.getsize(zip_file),
-                "requirements_hash": requirements_hash,
-            }
-        )
-        build_flag = True
+            logger.info(
+                {
+                    "package": package,
+                    "version": version,
+                    "location": f"s3://{os.environ['BUCKET_NAME']}",
+                    "size": archive_size,
+                    "requirements_hash": requirements_hash,
+                }
+            )
 
     else:
         build_flag = False
         logger.info(
             "Requirements hash previously built, proceeding to check for deployment"
         )
+        put_checked_date(package=package, python_version=python_version)
 
     return {
         "zip_file_S3key": uploaded_file_name,
@@ -394,3 +1664,17 @@ def main(event, context):
         "force_deploy": force_deploy,
         "python_version": python_version,
     }
+
+
+@logger.inject_lambda_context
+def main(event, context):
+    """
+    Builds event["package"], or every package in event["packages"] (see build_packages)
+    """
+    if not check_python_version(event["python_version"]):
+        sys.exit(1)
+
+    if "packages" in event:
+        return build_packages(event)
+
+    return build_package(event, package_dir="/tmp/python")
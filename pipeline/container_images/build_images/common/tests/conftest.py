@@ -0,0 +1,34 @@
+import boto3
+import pytest
+from moto import mock_aws
+
+TABLE_NAME = "kl.Klayers-test.db"
+
+
+def create_table(table_name: str = TABLE_NAME):
+    """
+    Creates a table with the pk and sk keys the build records are written to
+    """
+    client = boto3.client("dynamodb")
+    client.create_table(
+        TableName=table_name,
+        KeySchema=[
+            {"AttributeName": "pk", "KeyType": "HASH"},
+            {"AttributeName": "sk", "KeyType": "RANGE"},
+        ],
+        AttributeDefinitions=[
+            {"AttributeName": "pk", "AttributeType": "S"},
+            {"AttributeName": "sk", "AttributeType": "S"},
+        ],
+        BillingMode="PAY_PER_REQUEST",
+    )
+    return client
+
+
+@pytest.fixture
+def table(monkeypatch):
+    monkeypatch.setenv("AWS_DEFAULT_REGION", "us-east-1")
+    monkeypatch.setenv("DB_NAME", TABLE_NAME)
+    with mock_aws():
+        client = create_table()
+        yield client
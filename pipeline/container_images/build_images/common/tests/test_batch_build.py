@@ -0,0 +1,41 @@
+import os
+
+from .. import build
+
+# Bigger than a pipe buffer, the worker blocks in send until the parent reads
+LARGE_RESULT = "x" * (4 * 1024**2)
+
+
+def fake_build_package(event: dict, package_dir: str) -> dict:
+    if event["package"] == "broken":
+        raise ValueError("no matching distribution")
+    if event["package"] == "exits":
+        exit(1)
+    os.makedirs(package_dir)
+    return {
+        "package": event["package"],
+        "python_version": event["python_version"],
+        "requirements_txt": LARGE_RESULT,
+    }
+
+
+def test_failed_builds_dont_affect_the_batch(monkeypatch):
+    monkeypatch.setenv("BUILD_WORKERS", "2")
+    monkeypatch.setattr(build, "build_package", fake_build_package)
+
+    outcome = build.build_packages(
+        {
+            "python_version": "p3.12",
+            "packages": ["requests", "broken", {"package": "boto3"}, "exits"],
+        }
+    )
+
+    assert [result["package"] for result in outcome["builds"]] == ["requests", "boto3"]
+    assert all(
+        result["requirements_txt"] == LARGE_RESULT for result in outcome["builds"]
+    )
+    assert outcome["failures"] == [
+        {"package": "broken", "error": "ValueError('no matching distribution')"},
+        {"package": "exits", "error": "SystemExit(1)"},
+    ]
+    assert not os.path.exists("/tmp/build/0")
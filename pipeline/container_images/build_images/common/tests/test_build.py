@@ -0,0 +1,190 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from botocore.exceptions import ClientError
+
+from .. import build
+from .conftest import TABLE_NAME
+
+
+class BarrierPuts:
+    """
+    DynamoDB client whose bld#v puts wait for each other, so every build's conditional put is written together
+    The put of the build with requirements hash `failing` fails
+    """
+
+    def __init__(self, client, barrier, failing):
+        self.client = client
+        self.barrier = barrier
+        self.failing = failing
+        self.update_lock = threading.Lock()
+
+    def __getattr__(self, name):
+        return getattr(self.client, name)
+
+    def update_item(self, **kwargs):
+        # DynamoDB applies an update to one item atomically, moto doesn't under threads
+        with self.update_lock:
+            return self.client.update_item(**kwargs)
+
+    def put_item(self, **kwargs):
+        if kwargs["Item"]["pk"]["S"].startswith("bld#v"):
+            self.barrier.wait(timeout=30)
+            if kwargs["Item"]["rqrmntsHsh"]["S"] == self.failing:
+                raise ClientError(
+                    {"Error": {"Code": "ValidationException", "Message": "Too large"}},
+                    "PutItem",
+                )
+        return self.client.put_item(**kwargs)
+
+
+def get_build(client, pk: str, package: str = "requests") -> dict:
+    return client.get_item(
+        TableName=TABLE_NAME, Key={"pk": {"S": pk}, "sk": {"S": f"pckg#{package}"}}
+    ).get("Item")
+
+
+def test_concurrent_builds_get_unique_versions(table, monkeypatch):
+    builds = 48
+    barrier = threading.Barrier(builds)
+    client = BarrierPuts(table, barrier, failing="hash0")
+    monkeypatch.setattr(build.boto3, "client", lambda service: client)
+
+    def put(i):
+        try:
+            return build.put_requirements_hash(
+                python_version="p3.11",
+                package="requests",
+                version="2.31.0",
+                requirements_txt=f"requests==2.31.0\n# build {i}",
+                requirements_hash=f"hash{i}",
+                archive_hash=f"zip{i}",
+            )
+        except build.BuildRecordError:
+            return None
+
+    with ThreadPoolExecutor(max_workers=builds) as executor:
+        versions = list(executor.map(put, range(builds)))
+
+    assert versions[0] is None
+    assert len(set(versions[1:])) == builds - 1
+    for i, version in enumerate(versions[1:], start=1):
+        item = get_build(table, f"bld#v{version}:p3.11")
+        assert item["rqrmntsHsh"]["S"] == f"hash{i}"
+    history = table.scan(TableName=TABLE_NAME)["Items"]
+    assert len(history) == builds
+
+    # Whichever version the failed build got, the latest record is a build that was recorded
+    latest = get_build(table, "bldVrsn0#p3.11")
+    assert latest["bltVrsn"]["N"] == str(max(versions[1:]))
+    assert latest["rqrmntsHsh"] != {"S": "hash0"}
+    highest = get_build(table, f"bld#v{max(versions[1:])}:p3.11")
+    assert latest["rqrmntsHsh"] == highest["rqrmntsHsh"]
+
+
+def test_checked_date_only_on_existing_builds(table):
+    client = table
+    key = {"pk": {"S": "bldVrsn0#p3.11"}, "sk": {"S": "pckg#requests"}}
+
+    build.put_checked_date(package="requests", python_version="p3.11")
+    assert "Item" not in client.get_item(TableName=TABLE_NAME, Key=key)
+
+    build.put_requirements_hash(
+        python_version="p3.11",
+        package="requests",
+        version="2.31.0",
+        requirements_txt="requests==2.31.0",
+        requirements_hash="hash",
+        archive_hash="zip",
+    )
+    build.put_checked_date(package="requests", python_version="p3.11")
+    item = client.get_item(TableName=TABLE_NAME, Key=key)["Item"]
+    assert item["chckdDt"]["S"] >= item["crtdDt"]["S"]
+
+
+class ThrottledPuts:
+    """
+    DynamoDB client whose first `throttles` put_item calls are throttled
+    """
+
+    def __init__(self, client, throttles):
+        self.client = client
+        self.throttles = throttles
+
+    def __getattr__(self, name):
+        return getattr(self.client, name)
+
+    def put_item(self, **kwargs):
+        if self.throttles:
+            self.throttles -= 1
+            raise ClientError(
+                {
+                    "Error": {
+                        "Code": "ProvisionedThroughputExceededException",
+                        "Message": "Throttled",
+                    }
+                },
+                "PutItem",
+            )
+        return self.client.put_item(**kwargs)
+
+
+def test_throttled_put_reuses_version(table, monkeypatch):
+    monkeypatch.setattr(build.time, "sleep", lambda seconds: None)
+    client = table
+    throttled = ThrottledPuts(client, throttles=2)
+    monkeypatch.setattr(build.boto3, "client", lambda service: throttled)
+
+    def put(i, max_attempts=5):
+        return build.put_requirements_hash(
+            python_version="p3.11",
+            package="requests",
+            version="2.31.0",
+            requirements_txt="requests==2.31.0",
+            requirements_hash=f"hash{i}",
+            archive_hash=f"zip{i}",
+            max_attempts=max_attempts,
+        )
+
+    assert [put(1), put(2)] == [1, 2]
+
+    pk, sk = build.get_pk_sk_latest_build("requests", "p3.11")
+    latest = client.get_item(TableName=TABLE_NAME, Key={"pk": pk, "sk": sk})
+    assert latest["Item"]["bltVrsn"]["N"] == "2"
+    for version in (1, 2):
+        item = client.get_item(
+            TableName=TABLE_NAME,
+            Key={"pk": {"S": f"bld#v{version}:p3.11"}, "sk": sk},
+        )
+        assert item["Item"]["rqrmntsHsh"]["S"] == f"hash{version}"
+
+    throttled.throttles = 2
+    with pytest.raises(build.BuildRecordError):
+        put(3, max_attempts=2)
+
+    # The failed build is rolled back, the latest record is still the second build
+    latest = get_build(client, "bldVrsn0#p3.11")
+    assert latest["bltVrsn"]["N"] == "2"
+    assert latest["rqrmntsHsh"]["S"] == "hash2"
+    assert get_build(client, "bld#v3:p3.11") is None
+
+
+def test_failed_first_build_leaves_no_latest_record(table, monkeypatch):
+    monkeypatch.setattr(build.time, "sleep", lambda seconds: None)
+    throttled = ThrottledPuts(table, throttles=2)
+    monkeypatch.setattr(build.boto3, "client", lambda service: throttled)
+
+    with pytest.raises(build.BuildRecordError):
+        build.put_requirements_hash(
+            python_version="p3.11",
+            package="requests",
+            version="2.31.0",
+            requirements_txt="requests==2.31.0",
+            requirements_hash="hash",
+            archive_hash="zip",
+            max_attempts=2,
+        )
+
+    assert get_build(table, "bldVrsn0#p3.11") is None
+    assert get_build(table, "bld#v1:p3.11") is None
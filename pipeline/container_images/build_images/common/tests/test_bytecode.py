@@ -0,0 +1,45 @@
+import os
+import sys
+import struct
+import marshal
+import subprocess
+import importlib.util
+from zipfile import ZipFile
+
+from .. import build
+
+# pyc header flags, hash based and the source is never checked
+UNCHECKED_HASH_FLAGS = 0b01
+
+
+def test_layer_ships_unchecked_hash_bytecode(tmp_path):
+    package_dir = tmp_path / "python"
+    (package_dir / "answer").mkdir(parents=True)
+    (package_dir / "answer" / "__init__.py").write_text("VALUE = 1\n")
+
+    assert build.compile_bytecode(str(package_dir))
+    with open(tmp_path / "layer.zip", "wb") as layer_zip:
+        build.write_layer_zip(str(package_dir), layer_zip)
+
+    pyc_name = f"python/answer/__pycache__/__init__.{sys.implementation.cache_tag}.pyc"
+    with ZipFile(tmp_path / "layer.zip") as layer_zip:
+        assert pyc_name in layer_zip.namelist()
+        pyc = layer_zip.read(pyc_name)
+        layer_zip.extractall(tmp_path / "opt")
+
+    assert pyc[:4] == importlib.util.MAGIC_NUMBER
+    (flags,) = struct.unpack("<I", pyc[4:8])
+    assert flags == UNCHECKED_HASH_FLAGS
+    assert marshal.loads(pyc[16:]).co_filename == "/opt/python/answer/__init__.py"
+
+    # Unzipped with new mtimes and changed source, the shipped bytecode is still what runs, as is
+    extracted = tmp_path / "opt" / "python"
+    (extracted / "answer" / "__init__.py").write_text("VALUE = 2\n")
+    imported = subprocess.run(
+        [sys.executable, "-c", "import answer; print(answer.VALUE)"],
+        env={**os.environ, "PYTHONPATH": str(extracted)},
+        capture_output=True,
+        check=True,
+    )
+    assert imported.stdout == b"1\n"
+    assert (extracted / pyc_name.split("/", 1)[1]).read_bytes() == pyc
@@ -0,0 +1,39 @@
+from .. import build
+
+
+def make_package(path, source):
+    package_dir = path / "python"
+    (package_dir / "noisy").mkdir(parents=True)
+    (package_dir / "noisy" / "__init__.py").write_text(source)
+    return str(package_dir)
+
+
+def test_measure_import_time_with_module_output(tmp_path):
+    package_dir = make_package(
+        tmp_path,
+        "import sys\nprint('loaded')\nsys.stderr.write('42')\n",
+    )
+
+    benchmark = build.measure_import_time(package_dir, ["noisy"], use_bytecode=True)
+
+    assert benchmark["peak_rss_kb"] > 0
+    assert set(benchmark["modules_us"]) == {"noisy"}
+    attributes = build.get_import_attributes(benchmark)
+    assert attributes["pkRss"] == {"N": str(benchmark["peak_rss_kb"])}
+
+
+def test_parse_peak_rss():
+    marker = build.PEAK_RSS_MARKER
+    assert build.parse_peak_rss(f"{marker}1\nnoise\n{marker}2048\n") == 2048
+    assert build.parse_peak_rss("import time: 1 | 2 | noisy\n") is None
+    assert build.parse_peak_rss(f"{marker}lots\n") is None
+    assert "pkRss" not in build.get_import_attributes(
+        {"total_us": 5, "modules_us": {"noisy": 5}, "peak_rss_kb": None}
+    )
+
+
+def test_measure_import_time_timeout(tmp_path, monkeypatch):
+    monkeypatch.setattr(build, "IMPORT_TIMEOUT_SECONDS", 0.5)
+    package_dir = make_package(tmp_path, "import time\ntime.sleep(10)\n")
+
+    assert build.measure_import_time(package_dir, ["noisy"], use_bytecode=True) == {}
@@ -0,0 +1,99 @@
+import io
+import os
+import hashlib
+from zipfile import ZipFile
+
+import boto3
+from moto import mock_aws
+
+from .. import build
+
+FILES = {
+    "requests/__init__.py": b"from .api import get\n",
+    "requests/api.py": b"def get(url):\n    pass\n" * 100,
+    "requests-2.31.0.dist-info/RECORD": b"requests/__init__.py,,\n",
+    "bin/normalizer": b"#!/usr/bin/env python\n",
+}
+
+
+def make_tree(root, order, mtime):
+    package_dir = root / "python"
+    for path in order:
+        file_path = package_dir / path
+        file_path.parent.mkdir(parents=True, exist_ok=True)
+        file_path.write_bytes(FILES[path])
+        os.chmod(file_path, 0o775 if path.startswith("bin/") else 0o600)
+        os.utime(file_path, (mtime, mtime))
+    return str(package_dir)
+
+
+def test_same_tree_gives_identical_zip(tmp_path):
+    first = make_tree(tmp_path / "a", sorted(FILES), mtime=1_000_000_000)
+    # Created in another order, at another time, with other permissions on non executables
+    second = make_tree(tmp_path / "b", sorted(FILES, reverse=True), mtime=1_700_000_000)
+    os.chmod(os.path.join(second, "requests/api.py"), 0o644)
+
+    first_zip, second_zip = io.BytesIO(), io.BytesIO()
+    first_hash, first_manifest = build.write_layer_zip(first, first_zip)
+    second_hash, second_manifest = build.write_layer_zip(second, second_zip)
+
+    assert first_zip.getvalue() == second_zip.getvalue()
+    assert first_hash == second_hash
+    assert first_hash == hashlib.sha256(first_zip.getvalue()).hexdigest()
+    assert first_manifest == second_manifest
+
+    with ZipFile(first_zip) as archive:
+        assert archive.namelist() == sorted(f"python/{path}" for path in FILES)
+        modes = {
+            info.filename: info.external_attr >> 16 & 0o777
+            for info in archive.infolist()
+        }
+        assert modes["python/bin/normalizer"] == build.ZIP_EXECUTABLE_MODE
+        assert modes["python/requests/api.py"] == build.ZIP_FILE_MODE
+        assert archive.read("python/requests/api.py") == FILES["requests/api.py"]
+
+
+def test_changed_tree_changes_hash(tmp_path):
+    package_dir = make_tree(tmp_path, sorted(FILES), mtime=1_000_000_000)
+    before, _ = build.write_layer_zip(package_dir, io.BytesIO())
+    with open(os.path.join(package_dir, "requests/api.py"), "ab") as module:
+        module.write(b"# patched\n")
+    after, _ = build.write_layer_zip(package_dir, io.BytesIO())
+
+    assert before != after
+
+
+@mock_aws
+def test_upload_aborts_unchanged_zip(tmp_path, monkeypatch):
+    monkeypatch.setenv("AWS_DEFAULT_REGION", "us-east-1")
+    monkeypatch.setenv("BUCKET_NAME", "kl-test-bucket")
+    s3 = boto3.client("s3")
+    s3.create_bucket(Bucket="kl-test-bucket")
+    package_dir = make_tree(tmp_path, sorted(FILES), mtime=1_000_000_000)
+
+    archive_hash, size, uploaded = build.upload_to_s3(
+        package_dir, "requests", "p3.12/requests.zip"
+    )
+    layer = s3.get_object(Bucket="kl-test-bucket", Key="p3.12/requests.zip")
+    assert uploaded
+    assert layer["ContentLength"] == size
+    assert hashlib.sha256(layer["Body"].read()).hexdigest() == archive_hash
+
+    # Unchanged zip is streamed, then the multipart upload is aborted instead of completed
+    completed = []
+    complete = build.MultipartUploadWriter.complete
+    monkeypatch.setattr(
+        build.MultipartUploadWriter,
+        "complete",
+        lambda writer: completed.append(writer) or complete(writer),
+    )
+    assert build.upload_to_s3(
+        package_dir,
+        "requests",
+        "p3.12/requests.zip",
+        previous_archive_hash=archive_hash,
+    ) == (archive_hash, size, False)
+    assert completed == []
+    assert "Uploads" not in s3.list_multipart_uploads(Bucket="kl-test-bucket")
+    unchanged = s3.head_object(Bucket="kl-test-bucket", Key="p3.12/requests.zip")
+    assert unchanged["ETag"] == layer["ETag"]
@@ -0,0 +1,115 @@
+import json
+import hashlib
+import subprocess
+
+from .. import build
+
+DISTRIBUTIONS = [("requests", "2.31.0"), ("certifi", "2024.2.2"), ("Idna", "3.7")]
+
+
+def pip_report(distributions) -> dict:
+    """
+    Trimmed pip --report output, only the fields requirements_from_report reads
+    """
+    return {
+        "version": "1",
+        "install": [
+            {"metadata": {"name": name, "version": version}}
+            for name, version in distributions
+        ],
+    }
+
+
+def write_dist_info(path, name, version, files):
+    dist_info = path / f"{name}-{version}.dist-info"
+    dist_info.mkdir(parents=True)
+    (dist_info / "METADATA").write_text(
+        f"Metadata-Version: 2.1\nName: {name}\nVersion: {version}\n\nName: not-a-header\n"
+    )
+    (dist_info / "RECORD").write_text(
+        "".join(f"{file},sha256=x,{size}\n" for file, size in files)
+        + f"{name}-{version}.dist-info/RECORD,,\n"
+    )
+    (dist_info / "top_level.txt").write_text(f"{name.lower()}\n")
+
+
+def test_resolve_reads_pip_report(monkeypatch):
+    calls = []
+
+    def run(command, capture_output):
+        calls.append(command)
+        return subprocess.CompletedProcess(
+            command, 0, stdout=json.dumps(pip_report(DISTRIBUTIONS)).encode()
+        )
+
+    monkeypatch.setattr(subprocess, "run", run)
+    assert build.resolve("requests") == pip_report(DISTRIBUTIONS)
+    assert "--dry-run" in calls[0] and "--report" in calls[0]
+
+    monkeypatch.setattr(
+        subprocess,
+        "run",
+        lambda command, capture_output: subprocess.CompletedProcess(
+            command, 1, stdout=b"", stderr=b"No matching distribution"
+        ),
+    )
+    assert build.resolve("not-a-package") is None
+
+
+def test_requirements_from_report():
+    requirements_txt, requirements_hash, version = build.requirements_from_report(
+        "requests[security]", pip_report(DISTRIBUTIONS + [("pip", "24.0")])
+    )
+
+    assert requirements_txt == "certifi==2024.2.2\nIdna==3.7\nrequests==2.31.0"
+    assert requirements_hash == hashlib.sha256(requirements_txt.encode()).hexdigest()
+    assert version == "2.31.0"
+    assert build.requirements_from_report("boto3", pip_report(DISTRIBUTIONS)) is None
+
+
+def test_scanner_matches_resolver(tmp_path):
+    """
+    The resolve-first skip only works if the scanner hashes an install to what the resolver predicted
+    """
+    for name, version in DISTRIBUTIONS:
+        write_dist_info(tmp_path, name, version, [(f"{name.lower()}/__init__.py", 100)])
+
+    distributions = build.scan_distributions(str(tmp_path))
+    requests_distribution = next(d for d in distributions if d["name"] == "requests")
+    assert requests_distribution == {
+        "name": "requests",
+        "version": "2.31.0",
+        "files": 2,
+        "size": 100,
+        "top_level": ["requests"],
+    }
+
+    frozen = build.freeze_requirements("requests", str(tmp_path))
+    resolved = build.requirements_from_report("requests", pip_report(DISTRIBUTIONS))
+    assert frozen[:3] == resolved
+    assert build.scan_distributions(str(tmp_path / "missing")) == []
+
+
+def test_build_options_change_hash(monkeypatch):
+    monkeypatch.delenv("SLIM_LAYERS", raising=False)
+    report = pip_report(DISTRIBUTIONS)
+    _, default_hash, _ = build.requirements_from_report("requests", report)
+
+    assert build.get_build_options({}) == []
+    # Default builds keep the hashes already stored for them
+    _, unchanged_hash, _ = build.requirements_from_report(
+        "requests", report, build.get_build_options({"compile_bytecode": False})
+    )
+    assert unchanged_hash == default_hash
+
+    hashes = {default_hash}
+    for event in ({"compile_bytecode": True}, {"slim": True}):
+        _, requirements_hash, _ = build.requirements_from_report(
+            "requests", report, build.get_build_options(event)
+        )
+        hashes.add(requirements_hash)
+    monkeypatch.setenv("SLIM_LAYERS", "true")
+    both = build.get_build_options({"compile_bytecode": True})
+    assert both == ["compile_bytecode", "slim"]
+    hashes.add(build.requirements_from_report("requests", report, both)[1])
+    assert len(hashes) == 4
@@ -0,0 +1,201 @@
+import os
+import sys
+import shutil
+import importlib
+import subprocess
+
+import pytest
+
+from .. import build
+
+needs_gcc = pytest.mark.skipif(
+    shutil.which("gcc") is None or shutil.which("strip") is None,
+    reason="gcc and strip build the shared library",
+)
+
+# pkg loads a module from its own test package dynamically, other's tests are only run by pytest
+SOURCES = {
+    "pkg/__init__.py": "from .core import run\n",
+    "pkg/core.py": "def run():\n    pass\n",
+    "pkg/core.pyi": "def run() -> None: ...\n",
+    "pkg/py.typed": "",
+    "pkg/plugins.py": (
+        "import importlib\n"
+        "def load(name):\n"
+        "    return importlib.import_module(f'pkg.tests.{name}')\n"
+    ),
+    "pkg/tests/__init__.py": "",
+    "pkg/tests/helpers.py": "SAMPLE = 1\n",
+    "pkg/tests/sample.json": "{}\n",
+    "other/__init__.py": "import os\n",
+    "other/tests/__init__.py": "",
+    "other/tests/test_other.py": "def test():\n    import other.tests\n",
+    "other/tests/data.bin": "x" * 100,
+    "other/docs/guide.md": "# Guide\n",
+    "other/README.rst": "Other\n",
+}
+
+
+def make_site_packages(path, sources=SOURCES):
+    for name, files in (("pkg", "pkg/"), ("other", "other/")):
+        dist_info = path / f"{name}-1.0.dist-info"
+        dist_info.mkdir(parents=True)
+        (dist_info / "METADATA").write_text(f"Name: {name}\nVersion: 1.0\n")
+        (dist_info / "RECORD").write_text(
+            "".join(f"{file},," + "\n" for file in sources if file.startswith(files))
+        )
+    for file, content in sources.items():
+        (path / file).parent.mkdir(parents=True, exist_ok=True)
+        (path / file).write_text(content)
+
+
+def listing(path) -> set:
+    return {
+        os.path.relpath(os.path.join(dir_name, file_name), path)
+        for dir_name, _, file_names in os.walk(path)
+        for file_name in file_names
+        if ".dist-info" not in dir_name
+    }
+
+
+def compile_library(path, debug: bool):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    source = path.parent / "lib.c"
+    source.write_text("int answer(void) { return 42; }\n")
+    subprocess.run(
+        [
+            "gcc",
+            "-shared",
+            "-fPIC",
+            *(["-g"] if debug else []),
+            str(source),
+            "-o",
+            str(path),
+        ],
+        check=True,
+    )
+
+
+def test_every_recorded_module_is_protected(tmp_path):
+    make_site_packages(tmp_path)
+    protected = build.get_protected_paths(str(tmp_path))
+
+    assert {
+        "pkg/core.py",
+        "pkg/tests/helpers.py",
+        "other/tests/__init__.py",
+        "other/tests/test_other.py",
+    } <= protected
+    assert "pkg/tests/sample.json" not in protected
+    assert "pkg/core.pyi" not in protected
+
+
+def test_slim_dir(tmp_path):
+    make_site_packages(tmp_path)
+
+    bytes_saved = build.slim_dir(str(tmp_path), package="pkg")
+
+    # Test suites are kept whole without a prune_tests rule
+    assert listing(tmp_path) == {
+        "pkg/__init__.py",
+        "pkg/core.py",
+        "pkg/plugins.py",
+        "pkg/tests/__init__.py",
+        "pkg/tests/helpers.py",
+        "pkg/tests/sample.json",
+        "other/__init__.py",
+        "other/tests/__init__.py",
+        "other/tests/test_other.py",
+        "other/tests/data.bin",
+    }
+    assert not (tmp_path / "other" / "docs").exists()
+    assert bytes_saved["tests"] == 0
+    assert bytes_saved["stubs"] > 0
+    assert bytes_saved["docs"] > 0
+    assert (tmp_path / "other-1.0.dist-info" / "RECORD").exists()
+
+
+def test_dynamically_imported_test_module_survives(tmp_path, monkeypatch):
+    make_site_packages(tmp_path)
+
+    build.slim_dir(str(tmp_path), package="pkg")
+
+    monkeypatch.syspath_prepend(str(tmp_path))
+    plugins = importlib.import_module("pkg.plugins")
+    try:
+        assert plugins.load("helpers").SAMPLE == 1
+    finally:
+        for module in [name for name in sys.modules if name.split(".")[0] == "pkg"]:
+            del sys.modules[module]
+
+
+def test_prune_tests_allowlist(tmp_path):
+    make_site_packages(tmp_path)
+
+    bytes_saved = build.slim_dir(
+        str(tmp_path), package="other", rules={"prune_tests": ["other/tests"]}
+    )
+
+    remaining = listing(tmp_path)
+    assert not (tmp_path / "other" / "tests").exists()
+    assert bytes_saved["tests"] > 100
+    # Only the listed test directory goes
+    assert "pkg/tests/helpers.py" in remaining
+
+
+def test_slim_rules(tmp_path):
+    make_site_packages(tmp_path)
+
+    build.slim_dir(
+        str(tmp_path),
+        package="other",
+        rules={
+            "allow": ["tests", "other/docs/*"],
+            "deny": ["other/README.*", "other/__init__.py"],
+            "prune_tests": ["other/tests"],
+        },
+    )
+
+    remaining = listing(tmp_path)
+    assert "other/tests/test_other.py" in remaining
+    assert "other/docs/guide.md" in remaining
+    assert "other/README.rst" not in remaining
+    # deny globs never remove modules
+    assert "other/__init__.py" in remaining
+    assert "pkg/core.pyi" not in remaining
+
+
+@needs_gcc
+def test_read_elf_section_names(tmp_path):
+    library = tmp_path / "lib.so"
+    compile_library(library, debug=True)
+
+    names = build.read_elf_section_names(str(library))
+    assert ".text" in names
+    assert ".debug_info" in names
+    assert build.has_debug_sections(str(library))
+
+    (tmp_path / "module.py").write_text("pass\n")
+    assert build.read_elf_section_names(str(tmp_path / "module.py")) == []
+
+    truncated = tmp_path / "truncated.so"
+    truncated.write_bytes(library.read_bytes()[:64])
+    assert not build.has_debug_sections(str(truncated))
+
+
+@needs_gcc
+def test_slim_strips_debug_symbols(tmp_path):
+    make_site_packages(tmp_path, {"other/__init__.py": "", "other/_lib.so": ""})
+    compile_library(tmp_path / "other" / "_lib.so", debug=True)
+    compile_library(tmp_path / "other.libs" / "vendored.so", debug=True)
+    size_before = os.path.getsize(tmp_path / "other" / "_lib.so")
+
+    bytes_saved = build.slim_dir(str(tmp_path), package="other")
+
+    library = str(tmp_path / "other" / "_lib.so")
+    assert bytes_saved["debug_symbols"] == size_before - os.path.getsize(library)
+    assert bytes_saved["debug_symbols"] > 0
+    assert not build.has_debug_sections(library)
+    assert ".text" in build.read_elf_section_names(library)
+    # auditwheel vendored libraries are left alone
+    assert build.has_debug_sections(str(tmp_path / "other.libs" / "vendored.so"))
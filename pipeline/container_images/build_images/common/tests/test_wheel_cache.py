@@ -0,0 +1,158 @@
+import os
+import time
+import hashlib
+import subprocess
+from zipfile import ZipFile
+
+import boto3
+import pytest
+from moto import mock_aws
+
+from .. import build
+
+WHEEL_FILES = {
+    "klayers_demo/__init__.py": "ANSWER = 42\n",
+    "klayers_demo-1.0.dist-info/METADATA": "Metadata-Version: 2.1\nName: klayers-demo\nVersion: 1.0\n",
+    "klayers_demo-1.0.dist-info/WHEEL": "Wheel-Version: 1.0\nGenerator: test\nRoot-Is-Purelib: true\nTag: py3-none-any\n",
+}
+
+
+@pytest.fixture(autouse=True)
+def wheel_cache_env(monkeypatch):
+    monkeypatch.delenv("WHEEL_CACHE_DIR", raising=False)
+
+
+def make_wheel(path) -> str:
+    wheel_path = path / "klayers_demo-1.0-py3-none-any.whl"
+    path.mkdir(parents=True, exist_ok=True)
+    record = "".join(f"{name},," + "\n" for name in WHEEL_FILES)
+    with ZipFile(wheel_path, "w") as wheel:
+        for name, content in WHEEL_FILES.items():
+            wheel.writestr(name, content)
+        wheel.writestr("klayers_demo-1.0.dist-info/RECORD", record)
+    return str(wheel_path)
+
+
+def make_report(wheel_path: str, sha256: str = None) -> dict:
+    with open(wheel_path, "rb") as wheel:
+        sha256 = sha256 or hashlib.sha256(wheel.read()).hexdigest()
+    return {
+        "install": [
+            {
+                "metadata": {"name": "klayers-demo", "version": "1.0"},
+                "download_info": {
+                    "url": f"file://{wheel_path}",
+                    "archive_info": {"hashes": {"sha256": sha256}},
+                },
+            }
+        ]
+    }
+
+
+def test_fill_wheelhouse_miss_then_hit(tmp_path, monkeypatch):
+    report = make_report(make_wheel(tmp_path / "index"))
+    sha256 = report["install"][0]["download_info"]["archive_info"]["hashes"]["sha256"]
+    store = build.LocalWheelStore(path=str(tmp_path / "store"), max_bytes=10**6)
+    os.makedirs(store.path)
+    wheelhouse = str(tmp_path / "wheelhouse")
+
+    assert build.fill_wheelhouse(report, wheelhouse, store)
+    assert os.listdir(os.path.join(store.path, sha256)) == [
+        "klayers_demo-1.0-py3-none-any.whl"
+    ]
+
+    # Served from the store, the index isn't touched
+    def offline(url, dest_path):
+        raise AssertionError(f"downloaded {url}")
+
+    monkeypatch.setattr(build, "download_wheel", offline)
+    assert build.fill_wheelhouse(report, wheelhouse, store)
+    assert os.listdir(wheelhouse) == ["klayers_demo-1.0-py3-none-any.whl"]
+
+
+def test_fill_wheelhouse_rejects_hash_mismatch(tmp_path):
+    report = make_report(make_wheel(tmp_path / "index"), sha256="0" * 64)
+    store = build.LocalWheelStore(path=str(tmp_path / "store"), max_bytes=10**6)
+    os.makedirs(store.path)
+    wheelhouse = str(tmp_path / "wheelhouse")
+
+    assert not build.fill_wheelhouse(report, wheelhouse, store)
+    assert os.listdir(wheelhouse) == []
+    assert os.listdir(store.path) == []
+
+
+def test_local_store_evicts_least_recently_used(tmp_path):
+    store = build.LocalWheelStore(path=str(tmp_path / "store"), max_bytes=250)
+    source = tmp_path / "wheel.whl"
+    source.write_bytes(b"x" * 100)
+    for age, sha256 in enumerate(("newest", "middle", "oldest")):
+        store.put(str(source), "wheel.whl", sha256)
+        used = time.time() - 60 * age
+        os.utime(os.path.join(store.path, sha256, "wheel.whl"), (used, used))
+
+    # A hit makes the oldest the most recently used
+    os.makedirs(tmp_path / "wheelhouse")
+    assert store.get("wheel.whl", "oldest", str(tmp_path / "wheelhouse"))
+
+    assert store.evict() == 1
+    assert sorted(os.listdir(store.path)) == ["newest", "oldest"]
+
+
+@mock_aws
+def test_s3_store_tracks_use_without_new_versions(tmp_path, monkeypatch):
+    monkeypatch.setenv("AWS_DEFAULT_REGION", "us-east-1")
+    s3 = boto3.client("s3")
+    s3.create_bucket(Bucket="kl-test-bucket")
+    s3.put_bucket_versioning(
+        Bucket="kl-test-bucket", VersioningConfiguration={"Status": "Enabled"}
+    )
+    store = build.S3WheelStore(bucket_name="kl-test-bucket", max_bytes=250)
+    source = tmp_path / "wheel.whl"
+    source.write_bytes(b"x" * 100)
+    used = iter(f"2024-01-0{day}T00:00:00" for day in range(1, 5))
+    monkeypatch.setattr(
+        store, "last_used_tag", lambda: {"Key": "lstUsd", "Value": next(used)}
+    )
+    for sha256 in ("first", "second"):
+        store.put(str(source), "wheel.whl", sha256)
+
+    wheelhouse = tmp_path / "wheelhouse"
+    wheelhouse.mkdir()
+    assert store.get("wheel.whl", "first", str(wheelhouse))
+    assert not store.get("wheel.whl", "missing", str(wheelhouse))
+    versions = s3.list_object_versions(Bucket="kl-test-bucket")["Versions"]
+    assert len(versions) == 2
+
+    store.put(str(source), "wheel.whl", "third")
+    # second was used least recently, although first was uploaded before it
+    assert store.evict() == 1
+    keys = [
+        wheel["Key"]
+        for wheel in s3.list_objects_v2(Bucket="kl-test-bucket")["Contents"]
+    ]
+    assert sorted(keys) == [
+        "wheel_cache/first/wheel.whl",
+        "wheel_cache/third/wheel.whl",
+    ]
+
+
+def test_install_runs_offline_from_complete_wheelhouse(tmp_path, monkeypatch):
+    report = make_report(make_wheel(tmp_path / "index"))
+    monkeypatch.setenv("WHEEL_CACHE_DIR", str(tmp_path / "store"))
+    monkeypatch.setenv("PYTHONPATH", "")
+    os.makedirs(tmp_path / "store")
+    pip_calls = []
+    run = subprocess.run
+
+    def recorded_run(args, **kwargs):
+        pip_calls.append(args)
+        return run(args, **kwargs)
+
+    monkeypatch.setattr(subprocess, "run", recorded_run)
+    package_dir = str(tmp_path / "build" / "python")
+
+    build.install("klayers-demo", package_dir, report=report)
+
+    assert "--no-index" in pip_calls[0]
+    with open(os.path.join(package_dir, "klayers_demo", "__init__.py")) as module:
+        assert module.read() == WHEEL_FILES["klayers_demo/__init__.py"]